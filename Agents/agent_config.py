@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+Agent Config
+Location of the terminal agent's on-disk state (caches, history, settings)
+"""
+
+import os
+from pathlib import Path
+
+# Override with TERMINAL_AGENT_HOME to keep state somewhere other than ~/.terminal_agent
+AGENT_HOME = Path(os.environ.get("TERMINAL_AGENT_HOME", Path.home() / ".terminal_agent"))
+
+def agent_path(name: str) -> Path:
+    """Return a path inside the agent's state directory, creating the directory if needed"""
+    AGENT_HOME.mkdir(parents=True, exist_ok=True)
+    return AGENT_HOME / name
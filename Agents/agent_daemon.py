@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""
+Agent Daemon
+One warm process serving many isolated TerminalAgent sessions over a local
+HTTP JSON API (Unix socket by default), plus a thin interactive client
+"""
+
+import argparse
+import hmac
+import http.client
+import json
+import os
+import secrets
+import socket
+import socketserver
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Callable, Optional, Tuple
+
+from agent_config import agent_path
+from backend_pool import create_client
+from history_store import open_history_store
+from intents import IntentEngine
+from metrics import Metrics
+from ollama_client import OllamaClient
+from response_cache import ResponseCache
+from terminal_agent import TerminalAgent
+
+class QueueFull(Exception):
+    """Raised when the daemon is already holding as many queued requests as it allows"""
+
+class FairScheduler:
+    def __init__(self, workers: int = 4, max_queued: int = 64):
+        """Bounded worker pool that serves sessions round-robin, one job per session at a time"""
+        self.max_queued = max_queued
+        self.queues = {}  # session id -> deque of (fn, future)
+        self.ready = deque()  # sessions with queued work that are not running
+        self.running = set()
+        self.queued = 0
+        self.condition = threading.Condition()
+        self.threads = [threading.Thread(target=self.worker, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, session_id: str, fn: Callable[[], Any]) -> Future:
+        """Queue work for a session; a busy session can't starve the others"""
+        future = Future()
+        with self.condition:
+            if self.queued >= self.max_queued:
+                raise QueueFull(f"{self.queued} requests already queued")
+            self.queues.setdefault(session_id, deque()).append((fn, future))
+            self.queued += 1
+            if session_id not in self.running and session_id not in self.ready:
+                self.ready.append(session_id)
+                self.condition.notify()
+        return future
+
+    def worker(self):
+        """Take the next session in rotation and run one of its jobs"""
+        while True:
+            with self.condition:
+                while not self.ready:
+                    self.condition.wait()
+                session_id = self.ready.popleft()
+                fn, future = self.queues[session_id].popleft()
+                self.queued -= 1
+                self.running.add(session_id)
+            
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn())
+                except Exception as e:
+                    future.set_exception(e)
+            
+            with self.condition:
+                self.running.discard(session_id)
+                if self.queues[session_id]:
+                    # Back of the line, behind every other waiting session
+                    self.ready.append(session_id)
+                    self.condition.notify()
+                else:
+                    del self.queues[session_id]
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and busy workers"""
+        with self.condition:
+            return {"workers": len(self.threads), "busy": len(self.running), "queued": self.queued}
+
+class AgentSession:
+    def __init__(self, agent: TerminalAgent):
+        """One user's agent plus the lock that keeps its generate/execute calls in order"""
+        self.agent = agent
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+
+class AgentDaemon:
+    def __init__(self, workers: int = 4, max_queued: int = 64, session_ttl: float = 3600,
+                 client: Optional[OllamaClient] = None):
+        """Probe Ollama once and hold the components every session shares"""
+        self.client = client or create_client(pool_size=workers)
+        self.models = self.client.list_models()
+        print(f"✅ Connected to Ollama at {self.client.base_url} ({len(self.models)} models)")
+        
+        self.response_cache = ResponseCache()
+        self.history_store = open_history_store()
+        self.intents = IntentEngine()
+        self.metrics = Metrics(
+            trace_path=os.environ.get("TERMINAL_AGENT_TRACE"),
+            prometheus_path=os.environ.get("TERMINAL_AGENT_METRICS")
+        )
+        self.scheduler = FairScheduler(workers, max_queued)
+        self.session_ttl = session_ttl
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def create_session(self, cwd: Optional[str] = None) -> str:
+        """Start an isolated session with its own cwd, history and shell"""
+        if cwd and not os.path.isdir(cwd):
+            raise ValueError(f"Not a directory: {cwd}")
+        self.reap_sessions()
+        
+        agent = TerminalAgent(client=self.client, cwd=cwd or os.path.expanduser("~"), probe=False,
+                              cache=False, intents=False, retrieval=False, history=False)
+        agent.response_cache = self.response_cache
+        agent.intents = self.intents
+        agent.metrics = self.metrics
+        agent.use_available_models(self.models)
+        
+        session_id = uuid.uuid4().hex
+        # Sessions may belong to different people; none sees another's saved commands, nor the CLI's
+        agent.history_store = self.history_store.scoped(session_id) if self.history_store else None
+        with self.lock:
+            self.sessions[session_id] = AgentSession(agent)
+        return session_id
+
+    def get_session(self, session_id: str) -> AgentSession:
+        """Look a session up, refreshing its idle timer"""
+        with self.lock:
+            session = self.sessions.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        session.last_used = time.time()
+        return session
+
+    def close_session(self, session_id: str):
+        """End a session and its shell"""
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        if session and session.agent.shell:
+            with session.lock:
+                session.agent.shell.close()
+
+    def reap_sessions(self):
+        """Close sessions that have been idle longer than session_ttl"""
+        cutoff = time.time() - self.session_ttl
+        with self.lock:
+            idle = [session_id for session_id, session in self.sessions.items() if session.last_used < cutoff]
+        for session_id in idle:
+            self.close_session(session_id)
+
+    def generate(self, session_id: str, user_input: str) -> Dict[str, Any]:
+        """Queue a generation on the shared worker pool and wait for it"""
+        session = self.get_session(session_id)
+        
+        def job():
+            with session.lock:
+                return session.agent.generate_command(user_input)
+        
+        return self.scheduler.submit(session_id, job).result()
+
+    def execute(self, session_id: str, command: str) -> Dict[str, Any]:
+        """Run a command in the session's own shell"""
+        session = self.get_session(session_id)
+        with session.lock:
+            result = session.agent.execute_command(command)
+            result["cwd"] = session.agent.current_working_dir
+            return result
+
+    def record(self, session_id: str, user_input: str, ai_response: Dict[str, Any], result: Dict[str, Any]):
+        """Add an executed exchange to the session's history"""
+        session = self.get_session(session_id)
+        with session.lock:
+            session.agent.add_to_history(user_input, ai_response, result)
+
+    def clear(self, session_id: str):
+        """Clear a session's history"""
+        session = self.get_session(session_id)
+        with session.lock:
+            session.agent.conversation_history.clear()
+            session.agent.reset_session()
+            if session.agent.summary:
+                session.agent.summary.clear()
+
+    def history(self, session_id: str) -> list:
+        """Return a session's history"""
+        session = self.get_session(session_id)
+        with session.lock:
+            return list(session.agent.conversation_history)
+
+    def stats(self) -> Dict[str, Any]:
+        """Daemon-wide statistics"""
+        with self.lock:
+            session_count = len(self.sessions)
+        return {
+            "sessions": session_count,
+            "scheduler": self.scheduler.stats(),
+            "connections": self.client.stats(),
+            "cache": self.response_cache.stats(),
+            "stages": self.metrics.summary()
+        }
+
+class DaemonRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        """Requests are not logged"""
+
+    def send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None):
+        """Send a JSON response"""
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self) -> Dict[str, Any]:
+        """Read the JSON request body"""
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def route(self) -> Tuple[Optional[str], Optional[str]]:
+        """Split /sessions/<id>/<action> into (id, action)"""
+        parts = [part for part in self.path.split("/") if part]
+        if not parts or parts[0] != "sessions":
+            return None, None
+        return (parts[1] if len(parts) > 1 else None), (parts[2] if len(parts) > 2 else None)
+
+    def authorized(self) -> bool:
+        """Over TCP any local user can connect, so every request must carry the token from the 0600 token file"""
+        token = getattr(self.server, "token", None)
+        if token is None:
+            return True
+        supplied = self.headers.get("Authorization", "")
+        return hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode())
+
+    def handle_request(self, method: str):
+        """Dispatch a request to the daemon"""
+        daemon = self.server.daemon
+        if not self.authorized():
+            self.send_json(401, {"error": "Missing or wrong bearer token"}, {"WWW-Authenticate": "Bearer"})
+            return
+        try:
+            if method == "GET" and self.path == "/stats":
+                self.send_json(200, daemon.stats())
+                return
+            
+            session_id, action = self.route()
+            body = self.read_json() if method == "POST" else {}
+            
+            if method == "POST" and session_id is None and self.path.rstrip("/") == "/sessions":
+                self.send_json(201, {"session_id": daemon.create_session(body.get("cwd"))})
+            elif method == "DELETE" and session_id and action is None:
+                daemon.close_session(session_id)
+                self.send_json(200, {"closed": session_id})
+            elif method == "POST" and action == "generate":
+                self.send_json(200, daemon.generate(session_id, body["input"]))
+            elif method == "POST" and action == "execute":
+                self.send_json(200, daemon.execute(session_id, body["command"]))
+            elif method == "POST" and action == "record":
+                daemon.record(session_id, body["input"], body["ai_response"], body["result"])
+                self.send_json(200, {"recorded": True})
+            elif method == "POST" and action == "clear":
+                daemon.clear(session_id)
+                self.send_json(200, {"cleared": True})
+            elif method == "GET" and action == "history":
+                self.send_json(200, daemon.history(session_id))
+            else:
+                self.send_json(404, {"error": f"No route for {method} {self.path}"})
+        except KeyError as e:
+            self.send_json(404, {"error": f"Unknown session or missing field: {str(e)}"})
+        except QueueFull as e:
+            self.send_json(503, {"error": f"Daemon is busy: {str(e)}"}, {"Retry-After": "1"})
+        except (ValueError, json.JSONDecodeError) as e:
+            self.send_json(400, {"error": str(e)})
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        """Give handlers a (host, port)-shaped client address like TCP servers do"""
+        request, _ = super().get_request()
+        return request, ("local", 0)
+
+def write_token(token_path: str) -> str:
+    """Create a fresh bearer token in a file only this user can read"""
+    token = secrets.token_urlsafe(32)
+    fd = os.open(token_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    try:
+        os.fchmod(fd, 0o600)  # An existing file keeps its old mode otherwise
+        os.write(fd, token.encode())
+    finally:
+        os.close(fd)
+    return token
+
+def read_token(token_path: str) -> str:
+    """Read the bearer token a TCP daemon wrote at startup"""
+    try:
+        with open(token_path) as f:
+            return f.read().strip()
+    except OSError as e:
+        raise Exception(f"Could not read the daemon token from {token_path}: {e.strerror}")
+
+def serve(daemon: AgentDaemon, socket_path: Optional[str] = None, port: Optional[int] = None,
+          token_path: Optional[str] = None):
+    """Serve the API on a Unix socket (default) or on localhost TCP, where requests need the bearer token"""
+    if port is not None:
+        server = ThreadingHTTPServer(("127.0.0.1", port), DaemonRequestHandler)
+        token_path = token_path or str(agent_path("daemon.token"))
+        server.token = write_token(token_path)
+        location = f"http://127.0.0.1:{port} (token in {token_path})"
+    else:
+        socket_path = socket_path or str(agent_path("agent.sock"))
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = UnixHTTPServer(socket_path, DaemonRequestHandler)
+        # The API runs commands as this user, so only this user may connect
+        os.chmod(socket_path, 0o600)
+        location = socket_path
+    
+    server.daemon = daemon
+    print(f"🛰️  Agent daemon listening on {location}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Daemon stopped")
+    finally:
+        server.server_close()
+        if port is None and os.path.exists(socket_path):
+            os.unlink(socket_path)
+        if port is not None and os.path.exists(token_path):
+            os.unlink(token_path)
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float = 300):
+        """HTTP connection over a Unix domain socket"""
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+class DaemonClient:
+    def __init__(self, socket_path: Optional[str] = None, port: Optional[int] = None,
+                 token_path: Optional[str] = None):
+        """Thin client for the daemon API"""
+        self.socket_path = socket_path or str(agent_path("agent.sock"))
+        self.port = port
+        self.token = read_token(token_path or str(agent_path("daemon.token"))) if port is not None else None
+
+    def request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Any:
+        """Send one request and decode the JSON reply"""
+        if self.port is not None:
+            connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=300)
+        else:
+            connection = UnixHTTPConnection(self.socket_path)
+        try:
+            payload = json.dumps(body).encode() if body is not None else None
+            headers = {"Content-Type": "application/json"} if payload is not None else {}
+            if self.token:
+                headers["Authorization"] = f"Bearer {self.token}"
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            data = json.loads(response.read() or b"null")
+            if response.status >= 400:
+                raise Exception(data.get("error", f"Daemon returned status {response.status}"))
+            return data
+        finally:
+            connection.close()
+
+def run_client(client: DaemonClient, cwd: Optional[str] = None):
+    """Interactive loop that talks to the daemon instead of a local agent"""
+    session_id = client.request("POST", "/sessions", {"cwd": cwd or os.getcwd()})["session_id"]
+    print("🤖 AI Terminal Agent (daemon session)")
+    print("Type 'quit' or 'exit' to stop, 'history' to see this session's history, 'clear' to clear it\n")
+    
+    try:
+        while True:
+            try:
+                user_input = input("💬 You: ").strip()
+                if user_input.lower() in ['quit', 'exit', 'q']:
+                    print("👋 Goodbye!")
+                    break
+                if not user_input:
+                    continue
+                if user_input.lower() == 'history':
+                    for i, exchange in enumerate(client.request("GET", f"/sessions/{session_id}/history"), 1):
+                        status = '✅' if exchange['command_result'].get('success') else '❌'
+                        print(f"   {i}. {status} {exchange['user_input']} -> {exchange['ai_response'].get('command')}")
+                    continue
+                if user_input.lower() == 'clear':
+                    client.request("POST", f"/sessions/{session_id}/clear", {})
+                    print("🗑️  Conversation history cleared!")
+                    continue
+                
+                print("🤔 Thinking...")
+                ai_response = client.request("POST", f"/sessions/{session_id}/generate", {"input": user_input})
+                print(f"\n🔧 Generated command: {ai_response['command']}")
+                print(f"📝 Explanation: {ai_response['explanation']}")
+                if ai_response.get('warning'):
+                    print(f"⚠️  Warning: {ai_response['warning']}")
+                if not ai_response.get('is_safe', True):
+                    print("❌ Command deemed unsafe. Aborting.")
+                    continue
+                
+                confirm = input("\n❓ Execute this command? (y/n): ").strip().lower()
+                if confirm not in ['y', 'yes']:
+                    print("⏭️  Skipped.")
+                    continue
+                
+                print("⚡ Executing...")
+                result = client.request("POST", f"/sessions/{session_id}/execute", {"command": ai_response['command']})
+                client.request("POST", f"/sessions/{session_id}/record",
+                               {"input": user_input, "ai_response": ai_response, "result": result})
+                
+                print("\n📊 Results:")
+                if result['success']:
+                    print("✅ Command executed successfully")
+                    if result['stdout']:
+                        print(f"📤 Output:\n{result['stdout']}")
+                else:
+                    print("❌ Command failed")
+                    if result['stderr']:
+                        print(f"📤 Error:\n{result['stderr']}")
+                print("-" * 50)
+            except KeyboardInterrupt:
+                print("\n👋 Goodbye!")
+                break
+            except Exception as e:
+                print(f"❌ Error: {str(e)}")
+    finally:
+        try:
+            client.request("DELETE", f"/sessions/{session_id}")
+        except Exception:
+            pass
+
+def main():
+    """Start the daemon or connect to it"""
+    parser = argparse.ArgumentParser(description="Serve many terminal agent sessions from one warm process")
+    subcommands = parser.add_subparsers(dest="mode", required=True)
+    
+    serve_parser = subcommands.add_parser("serve", help="run the daemon")
+    serve_parser.add_argument("--socket", help="Unix socket path (default ~/.terminal_agent/agent.sock)")
+    serve_parser.add_argument("--port", type=int, help="listen on 127.0.0.1:PORT instead of a Unix socket")
+    serve_parser.add_argument("--token-file", help="where --port writes its bearer token (default ~/.terminal_agent/daemon.token)")
+    serve_parser.add_argument("--workers", type=int, default=4, help="concurrent generations")
+    serve_parser.add_argument("--max-queued", type=int, default=64, help="queued requests before returning 503")
+    serve_parser.add_argument("--session-ttl", type=float, default=3600, help="seconds before idle sessions close")
+    
+    connect_parser = subcommands.add_parser("connect", help="open an interactive session on a running daemon")
+    connect_parser.add_argument("--socket", help="Unix socket path (default ~/.terminal_agent/agent.sock)")
+    connect_parser.add_argument("--port", type=int, help="connect to 127.0.0.1:PORT instead of a Unix socket")
+    connect_parser.add_argument("--token-file", help="bearer token for --port (default ~/.terminal_agent/daemon.token)")
+    
+    args = parser.parse_args()
+    try:
+        if args.mode == "serve":
+            serve(AgentDaemon(args.workers, args.max_queued, args.session_ttl), args.socket, args.port,
+                  args.token_file)
+        else:
+            run_client(DaemonClient(args.socket, args.port, args.token_file))
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
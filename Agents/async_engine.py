@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Async Engine
+Event-loop plumbing for the interactive agent: input is read on its own thread so the
+next request can be typed early, and blocking stages run on workers that Ctrl-C cancels
+"""
+
+import asyncio
+import functools
+import signal
+import sys
+import threading
+from collections import deque
+from typing import Any, Callable, Optional, TextIO
+
+# What readline returns when Ctrl-C was pressed at a prompt
+INTERRUPTED = object()
+
+# A BaseException, like asyncio.CancelledError, so `except Exception` fallbacks along the way can't swallow it
+class StageCancelled(BaseException):
+    pass
+
+def trap_interrupts(loop: asyncio.AbstractEventLoop, handler: Callable[[], None]) -> bool:
+    """Route Ctrl-C to handler instead of raising KeyboardInterrupt; False where signals can't be trapped"""
+    try:
+        loop.add_signal_handler(signal.SIGINT, handler)
+        return True
+    except (NotImplementedError, RuntimeError, ValueError):
+        return False
+
+class LineReader:
+    def __init__(self, loop: asyncio.AbstractEventLoop, stream: Optional[TextIO] = None):
+        """Read lines on a daemon thread, so typing never waits for the agent to be ready"""
+        self.loop = loop
+        self.stream = stream or sys.stdin
+        self.lines = asyncio.Queue()
+        self.ahead = deque()  # Lines typed before a prompt that only takes fresh answers
+        # Piped input is a script of answers, read strictly in order; only a person types ahead
+        self.interactive = self.stream.isatty()
+        self.waiting = False
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """Forward each line to the event loop, then None at end of input"""
+        for line in iter(self.stream.readline, ""):
+            self.loop.call_soon_threadsafe(self.lines.put_nowait, line.rstrip("\n"))
+        self.loop.call_soon_threadsafe(self.lines.put_nowait, None)
+
+    async def readline(self, prompt: str, fresh: bool = False) -> Any:
+        """Next line (None at end of input, INTERRUPTED on Ctrl-C); fresh keeps earlier typing for later prompts"""
+        print(prompt, end="", flush=True)
+        if fresh and self.interactive:
+            while not self.lines.empty():
+                line = self.lines.get_nowait()
+                self.ahead.append(line)
+                self.closed = self.closed or line is None
+        elif self.ahead:
+            return self.echo(self.ahead.popleft())
+        elif not self.lines.empty():
+            return self.echo(self.lines.get_nowait())
+        if self.closed:
+            print()
+            return None
+        
+        self.waiting = True
+        try:
+            line = await self.lines.get()
+        finally:
+            self.waiting = False
+        if line is None:
+            self.closed = True
+        return line
+
+    def echo(self, line: Optional[str]) -> Optional[str]:
+        """Show a line that was typed ahead next to the prompt it answers"""
+        if line is None:
+            self.closed = True
+            print()
+        else:
+            print(line)
+        return line
+
+    def interrupt(self) -> bool:
+        """Wake a waiting readline with INTERRUPTED; False if nothing is waiting"""
+        if not self.waiting:
+            return False
+        self.lines.put_nowait(INTERRUPTED)
+        return True
+
+class StageRunner:
+    def __init__(self, cancelled: threading.Event, cancel: Callable[[], None]):
+        """cancel aborts whatever blocking work is in flight and must be safe to call from the event loop"""
+        self.cancelled = cancelled
+        self.cancel = cancel
+        self.on_cancel = None
+        self.running = False
+
+    async def run(self, func: Callable[..., Any], *args, on_cancel: Optional[Callable[[], None]] = None) -> Any:
+        """Run blocking work on a worker thread; Ctrl-C meanwhile cancels it instead of ending the agent"""
+        self.cancelled.clear()
+        self.on_cancel = on_cancel
+        self.running = True
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args))
+        finally:
+            self.running = False
+            self.on_cancel = None
+
+    def interrupt(self) -> bool:
+        """Cancel the running stage; False if there is none"""
+        if not self.running:
+            return False
+        self.cancelled.set()
+        if self.on_cancel:
+            self.on_cancel()
+        self.cancel()
+        return True
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Backend Pool
+Spreads requests over several Ollama servers: background health checks,
+least-loaded routing, failover on connection errors and optional hedging
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Any, List, Optional, Set, Union
+
+import requests
+
+from metrics import percentile
+from ollama_client import OllamaClient, RETRY_STATUS_CODES
+
+# Requests that run the model; only these are counted as in-flight generations and hedged
+GENERATION_PATHS = ("/api/generate", "/api/chat", "/api/embeddings")
+
+class Backend:
+    def __init__(self, client: OllamaClient):
+        """One Ollama server with its load and health"""
+        self.client = client
+        self.healthy = True
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_error = None
+
+    @property
+    def url(self) -> str:
+        return self.client.base_url
+
+class BackendPool:
+    def __init__(self, urls: List[str], pool_size: int = 4, connect_timeout: float = 5.0,
+                 read_timeout: float = 60.0, keep_alive: Optional[str] = None,
+                 health_interval: float = 10.0, hedge: bool = False, hedge_min_samples: int = 20):
+        """Create a client per server and start health-checking them"""
+        if not urls:
+            raise ValueError("BackendPool needs at least one Ollama URL")
+        # Failover replaces per-server retries: a failed request goes to the next server right away
+        self.backends = [
+            Backend(OllamaClient(url, connect_timeout, read_timeout, max_retries=0, keep_alive=keep_alive,
+                                 pool_size=pool_size))
+            for url in urls
+        ]
+        self.keep_alive = self.backends[0].client.keep_alive
+        self.lock = threading.Lock()
+        self.next_index = 0
+        self.failover_count = 0
+        
+        # Hedging sends a second copy of a slow generation to another server once it passes the observed p95
+        self.hedge = hedge and len(self.backends) > 1
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = {}  # (path, stream) -> recent seconds until the response started
+        self.hedge_count = 0
+        self.hedge_wins = 0
+        self.hedge_executor = ThreadPoolExecutor(pool_size * 2, thread_name_prefix="ollama-hedge") if self.hedge else None
+        
+        self.health_interval = health_interval
+        self.stopped = threading.Event()
+        self.health_thread = threading.Thread(target=self.health_loop, daemon=True)
+        self.health_thread.start()
+
+    @property
+    def base_url(self) -> str:
+        return ", ".join(backend.url for backend in self.backends)
+
+    def health_loop(self):
+        """Probe every server's /api/tags in the background"""
+        while not self.stopped.wait(self.health_interval):
+            self.check_health()
+
+    def check_health(self):
+        """Probe each server once"""
+        for backend in self.backends:
+            try:
+                response = backend.client.session.get(f"{backend.url}/api/tags", timeout=(2, 5))
+                response.close()
+                backend.healthy = response.status_code == 200
+                backend.last_error = None if backend.healthy else f"status {response.status_code}"
+            except requests.exceptions.RequestException as e:
+                backend.healthy = False
+                backend.last_error = str(e)
+
+    def choose(self, exclude: Set[Backend]) -> Optional[Backend]:
+        """Pick the server with the fewest in-flight generations, rotating between ties"""
+        with self.lock:
+            candidates = [backend for backend in self.backends if backend not in exclude]
+            # If every server looks down, try them anyway; the health view may be stale
+            healthy = [backend for backend in candidates if backend.healthy] or candidates
+            if not healthy:
+                return None
+            self.next_index += 1
+            start = self.next_index % len(self.backends)
+            rotated = self.backends[start:] + self.backends[:start]
+            return min((backend for backend in rotated if backend in healthy), key=lambda backend: backend.in_flight)
+
+    def send(self, backend: Backend, method: str, path: str, json: Optional[Dict[str, Any]],
+             stream: bool, timeout: Optional[float]) -> requests.Response:
+        """Send to one server, tracking its load until the response (or its stream) is finished"""
+        generation = path in GENERATION_PATHS
+        with self.lock:
+            backend.requests += 1
+            if generation:
+                backend.in_flight += 1
+        
+        def release():
+            if generation:
+                with self.lock:
+                    backend.in_flight -= 1
+        
+        started = time.perf_counter()
+        try:
+            response = backend.client.request(method, path, json=json, stream=stream, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            release()
+            with self.lock:
+                backend.failures += 1
+                backend.healthy = False
+                backend.last_error = str(e)
+            raise
+        except Exception:
+            release()
+            raise
+        
+        if generation and response.status_code == 200:
+            with self.lock:
+                self.latencies.setdefault((path, stream), deque(maxlen=200)).append(time.perf_counter() - started)
+        
+        if not stream:
+            release()
+            return response
+        
+        # A streamed generation keeps the server busy until the caller closes the response
+        close = response.close
+        released = []
+        def close_and_release():
+            close()
+            if not released:
+                released.append(True)
+                release()
+        response.close = close_and_release
+        return response
+
+    def send_with_failover(self, method: str, path: str, json: Optional[Dict[str, Any]], stream: bool,
+                           timeout: Optional[float], tried: Optional[Set[Backend]] = None) -> requests.Response:
+        """Try servers in load order until one answers"""
+        tried = set(tried or ())
+        last_error = None
+        while True:
+            backend = self.choose(tried)
+            if backend is None:
+                if isinstance(last_error, requests.Response):
+                    return last_error
+                raise last_error or requests.exceptions.ConnectionError("No Ollama backends available")
+            tried.add(backend)
+            
+            try:
+                response = self.send(backend, method, path, json, stream, timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                last_error = e
+                with self.lock:
+                    self.failover_count += 1
+                continue
+            
+            # A busy server's 502/503/504 goes to the next one; the last one's answer is returned as-is
+            if response.status_code in RETRY_STATUS_CODES and len(tried) < len(self.backends):
+                if isinstance(last_error, requests.Response):
+                    last_error.close()
+                last_error = response
+                with self.lock:
+                    self.failover_count += 1
+                continue
+            if isinstance(last_error, requests.Response):
+                last_error.close()
+            return response
+
+    def hedge_after(self, path: str, stream: bool) -> Optional[float]:
+        """Observed p95 wait for this kind of request, once there are enough samples"""
+        with self.lock:
+            samples = list(self.latencies.get((path, stream), ()))
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return percentile(samples, 95)
+
+    def send_hedged(self, method: str, path: str, json: Optional[Dict[str, Any]], stream: bool,
+                    timeout: Optional[float], delay: float) -> requests.Response:
+        """Send to one server and, if it hasn't answered after `delay`, to a second; keep the first answer"""
+        primary = self.choose(set())
+        futures = {self.hedge_executor.submit(self.send, primary, method, path, json, stream, timeout): primary}
+        done, _ = wait(futures, timeout=delay)
+        
+        if not done:
+            secondary = self.choose({primary})
+            if secondary is not None:
+                with self.lock:
+                    self.hedge_count += 1
+                futures[self.hedge_executor.submit(self.send, secondary, method, path, json, stream, timeout)] = secondary
+        
+        pending = set(futures)
+        winner = None
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and future.result().status_code == 200 and winner is None:
+                    winner = future
+        
+        # The slower copy is closed as soon as it answers so its server stops generating
+        def close_loser(future):
+            if future.exception() is None:
+                future.result().close()
+        for future in futures:
+            if future is not winner:
+                future.add_done_callback(close_loser)
+        
+        if winner is None:
+            return self.send_with_failover(method, path, json, stream, timeout, tried=set(futures.values()))
+        if futures[winner] is not primary:
+            with self.lock:
+                self.hedge_wins += 1
+        return winner.result()
+
+    def request(self, method: str, path: str, json: Optional[Dict[str, Any]] = None,
+                stream: bool = False, timeout: Optional[float] = None) -> requests.Response:
+        """Send a request to the least-loaded healthy server, failing over (and hedging, if enabled)"""
+        if self.hedge and path in GENERATION_PATHS:
+            delay = self.hedge_after(path, stream)
+            if delay is not None:
+                return self.send_hedged(method, path, json, stream, timeout, delay)
+        return self.send_with_failover(method, path, json, stream, timeout)
+
+    def get(self, path: str, timeout: Optional[float] = None) -> requests.Response:
+        """GET a path from any healthy server"""
+        return self.request("GET", path, timeout=timeout)
+
+    def post(self, path: str, json: Dict[str, Any], stream: bool = False,
+             timeout: Optional[float] = None) -> requests.Response:
+        """POST a JSON payload to the least-loaded server"""
+        return self.request("POST", path, json=json, stream=stream, timeout=timeout)
+
+    def list_models(self) -> list:
+        """Return the model list reported by /api/tags"""
+        response = self.get("/api/tags")
+        if response.status_code != 200:
+            raise Exception(f"Ollama server returned status {response.status_code}")
+        return response.json().get("models", [])
+
+    def stats(self) -> Dict[str, Any]:
+        """Combined connection statistics plus each server's load and health"""
+        per_backend = [(backend, backend.client.stats()) for backend in self.backends]
+        requests_sent = sum(stats["requests"] for _, stats in per_backend)
+        connections_opened = sum(stats["connections_opened"] for _, stats in per_backend)
+        return {
+            "requests": requests_sent,
+            "retries": self.failover_count,
+            "connections_opened": connections_opened,
+            "connections_reused": max(requests_sent - connections_opened, 0),
+            "keep_alive": self.keep_alive,
+            "failovers": self.failover_count,
+            "hedges": self.hedge_count,
+            "hedge_wins": self.hedge_wins,
+            "backends": [
+                {
+                    "url": backend.url,
+                    "healthy": backend.healthy,
+                    "in_flight": backend.in_flight,
+                    "requests": backend.requests,
+                    "failures": backend.failures,
+                    "last_error": backend.last_error
+                }
+                for backend, _ in per_backend
+            ]
+        }
+
+    def close(self):
+        """Stop health checks and close every server's connections"""
+        self.stopped.set()
+        if self.hedge_executor:
+            self.hedge_executor.shutdown(wait=False)
+        for backend in self.backends:
+            backend.client.close()
+
+def create_client(pool_size: int = 4) -> Union[OllamaClient, BackendPool]:
+    """A pool when OLLAMA_HOSTS lists servers, otherwise a single-server client"""
+    hosts = [host.strip() for host in os.environ.get("OLLAMA_HOSTS", "").split(",") if host.strip()]
+    if not hosts:
+        return OllamaClient(pool_size=pool_size)
+    hedge = os.environ.get("OLLAMA_HEDGE", "").lower() in ("1", "true", "yes")
+    return BackendPool(hosts, pool_size=pool_size, hedge=hedge)
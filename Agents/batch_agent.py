@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Batch Agent
+Non-interactive mode: reads requests from a JSONL file or stdin, generates
+commands concurrently, optionally runs allowlisted ones, and writes JSONL
+results in input order
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Iterable, Iterator, List, Optional, TextIO
+
+from backend_pool import create_client
+from command_analysis import READ_ONLY_COMMANDS, disallowed_reason
+from intents import IntentEngine
+from metrics import Metrics
+from ollama_client import OllamaClient
+from response_cache import ResponseCache
+from terminal_agent import TerminalAgent
+
+def read_requests(stream: TextIO) -> Iterator[Dict[str, Any]]:
+    """Yield request objects; a line may be a JSON object, a JSON string or plain text"""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError:
+            item = line
+        if isinstance(item, str):
+            item = {"request": item}
+        if not isinstance(item, dict):
+            item = {"error": f"line {line_number}: expected an object, a string or text"}
+        item.setdefault("line", line_number)
+        yield item
+
+class BatchRunner:
+    def __init__(self, client: OllamaClient, parallel: int = 4, execute: bool = False,
+                 allowlist: Optional[Iterable[str]] = None, exec_workers: int = 4,
+                 cwd: Optional[str] = None, model: Optional[str] = None, cache: bool = True,
+                 intents: bool = True, available_models: Optional[List[Dict[str, Any]]] = None):
+        """Share one client, cache and intent table across per-thread agents"""
+        self.client = client
+        self.parallel = parallel
+        self.execute = execute
+        self.allowlist = set(allowlist or READ_ONLY_COMMANDS)
+        self.cwd = cwd or os.getcwd()
+        self.model = model
+        self.available_models = available_models  # /api/tags result the cascade is narrowed to
+        self.response_cache = ResponseCache() if cache else None
+        self.intents = IntentEngine() if intents else None
+        self.metrics = Metrics()
+        self.local = threading.local()
+        self.generate_pool = ThreadPoolExecutor(parallel, thread_name_prefix="batch-generate")
+        self.execute_pool = ThreadPoolExecutor(exec_workers, thread_name_prefix="batch-execute")
+        self.counts = {"requests": 0, "executed": 0, "not_executed": 0, "errors": 0}
+
+    def agent(self) -> TerminalAgent:
+        """This thread's agent: no session context and no persistent shell, so requests stay independent"""
+        agent = getattr(self.local, "agent", None)
+        if agent is None:
+            agent = TerminalAgent(stream=False, session=False, client=self.client, cache=False, intents=False,
+                                  cwd=self.cwd, probe=False, shell=False, retrieval=False,
+                                  history=False, summarize=False)
+            agent.response_cache = self.response_cache
+            agent.intents = self.intents
+            agent.metrics = self.metrics
+            if self.model:
+                agent.set_model(self.model)
+            elif self.available_models is not None:
+                agent.use_available_models(self.available_models)
+            self.local.agent = agent
+        return agent
+
+    def generate(self, index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Generate one command and, if allowed, queue its execution"""
+        record = {"index": index, "line": item["line"]}
+        if "id" in item:
+            record["id"] = item["id"]
+        request = item.get("request", item.get("input"))
+        if item.get("error") or not isinstance(request, str):
+            record["error"] = item.get("error") or f"line {item['line']}: missing 'request'"
+            return record
+        record["request"] = request
+        
+        agent = self.agent()
+        agent.current_working_dir = item.get("cwd", self.cwd)
+        started = time.perf_counter()
+        ai_response = agent.generate_command(request)
+        record["generate_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        record.update({key: ai_response.get(key) for key in ["command", "explanation", "is_safe", "warning"]})
+        if ai_response.get("cached"):
+            record["source"] = "cache"
+        elif ai_response.get("intent"):
+            record["source"] = "intent"
+        else:
+            record["source"] = "model"
+        
+        if not self.execute:
+            return record
+        if not ai_response.get("is_safe", True):
+            record["not_executed"] = "deemed unsafe"
+        elif ai_response.get("warning"):
+            record["not_executed"] = f"warning: {ai_response['warning']}"
+        else:
+            reason = disallowed_reason(ai_response["command"], self.allowlist)
+            if reason:
+                record["not_executed"] = reason
+            else:
+                record["pending"] = self.execute_pool.submit(self.run_command, ai_response["command"],
+                                                             agent.current_working_dir)
+        return record
+
+    def run_command(self, command: str, cwd: str) -> Dict[str, Any]:
+        """Run an allowlisted command with a one-off subprocess in the request's directory"""
+        agent = self.agent()
+        agent.current_working_dir = cwd
+        started = time.perf_counter()
+        result = agent.execute_command(command)
+        result["execute_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return result
+
+    def finish(self, future: Future) -> Dict[str, Any]:
+        """Wait for a record's generation and execution"""
+        record = future.result()
+        pending = record.pop("pending", None)
+        if pending is not None:
+            record["result"] = pending.result()
+        
+        self.counts["requests"] += 1
+        if record.get("error"):
+            self.counts["errors"] += 1
+        elif "result" in record:
+            self.counts["executed"] += 1
+        elif "not_executed" in record:
+            self.counts["not_executed"] += 1
+        return record
+
+    def run(self, items: Iterable[Dict[str, Any]], output: TextIO):
+        """Process items with a bounded window of in-flight requests, writing results in input order"""
+        window = deque()
+        try:
+            for index, item in enumerate(items):
+                window.append(self.generate_pool.submit(self.generate, index, item))
+                # Read ahead only a little so huge inputs don't pile up in memory
+                while len(window) >= self.parallel * 2:
+                    self.write(self.finish(window.popleft()), output)
+            while window:
+                self.write(self.finish(window.popleft()), output)
+        finally:
+            for future in window:
+                future.cancel()
+            self.generate_pool.shutdown(wait=True)
+            self.execute_pool.shutdown(wait=True)
+
+    def write(self, record: Dict[str, Any], output: TextIO):
+        """Write one result line as soon as it is next in order"""
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+
+def main():
+    """Run a batch from the command line"""
+    parser = argparse.ArgumentParser(description="Generate (and optionally run) commands for a file of requests")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL file of requests, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="where to write JSONL results (default stdout)")
+    parser.add_argument("--parallel", type=int, default=4, help="concurrent generations")
+    parser.add_argument("--execute", action="store_true", help="run generated commands that are on the allowlist")
+    parser.add_argument("--allow", action="append", help="allowlisted program (repeatable; replaces the default list)")
+    parser.add_argument("--exec-workers", type=int, default=4, help="concurrent command executions")
+    parser.add_argument("--cwd", help="directory requests run in unless they set their own cwd")
+    parser.add_argument("--model", help="Ollama model to use")
+    parser.add_argument("--no-cache", action="store_true", help="don't read or write the response cache")
+    args = parser.parse_args()
+    
+    # Progress goes to stderr so stdout stays pure JSONL
+    try:
+        client = create_client(pool_size=args.parallel)
+        models = client.list_models()
+        print(f"✅ Connected to Ollama at {client.base_url} ({len(models)} models)", file=sys.stderr)
+    except Exception as e:
+        print(f"❌ Error connecting to Ollama: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+    
+    runner = BatchRunner(client, args.parallel, args.execute, args.allow, args.exec_workers, args.cwd, args.model,
+                         cache=not args.no_cache, available_models=models)
+    source = sys.stdin if args.input == "-" else open(args.input)
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    started = time.perf_counter()
+    try:
+        runner.run(read_requests(source), output)
+    except KeyboardInterrupt:
+        print("\n👋 Batch interrupted", file=sys.stderr)
+        sys.exit(130)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    
+    elapsed = time.perf_counter() - started
+    counts = runner.counts
+    print(f"📊 {counts['requests']} requests in {elapsed:.2f}s ({counts['requests'] / elapsed:.1f}/s): "
+          f"{counts['executed']} executed, {counts['not_executed']} not executed, {counts['errors']} errors",
+          file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
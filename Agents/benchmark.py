@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Benchmark
+Drives TerminalAgent end to end against the mock Ollama server and reports
+p50/p95/p99 latency per stage, written as JSON for comparing versions
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import agent_config
+from metrics import percentile
+from mock_ollama import MockOllamaServer
+from ollama_client import OllamaClient
+from response_schema import RESPONSE_SCHEMA
+from terminal_agent import TerminalAgent
+
+# Requests replayed by the benchmark, covering each canned mock reply
+REQUESTS = [
+    "show me the disk usage",
+    "how much memory is free",
+    "list the running processes",
+    "find all python files",
+    "what is the date",
+    "which directory am I in",
+    "list everything here"
+]
+
+STAGES = ["build_context_prompt", "http_round_trip", "json_parse", "execute_command", "turn"]
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Reduce a list of seconds to millisecond statistics"""
+    return {
+        "count": len(samples),
+        "mean_ms": sum(samples) / len(samples) * 1000 if samples else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "max_ms": max(samples) * 1000 if samples else 0.0
+    }
+
+def git_revision() -> Optional[str]:
+    """Identify the code being measured"""
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip() or None
+    except FileNotFoundError:
+        return None
+
+def run_benchmark(iterations: int = 50, token_rate: float = 200.0, ttft: float = 0.05,
+                  malformed_rate: float = 0.0, stream: bool = True, seed: int = 0,
+                  structured: bool = True, honor_format: bool = True) -> Dict[str, Any]:
+    """Run every stage `iterations` times and return the report"""
+    server = MockOllamaServer(token_rate=token_rate, ttft=ttft, malformed_rate=malformed_rate, seed=seed,
+                              honor_format=honor_format).start()
+    samples = {stage: [] for stage in STAGES}
+    unusable_replies = 0
+    workdir = tempfile.mkdtemp(prefix="agent-bench-")
+    previous_cwd = os.getcwd()
+    # The probe would otherwise record the mock's URL and models in the real ~/.terminal_agent/models.json
+    home = tempfile.mkdtemp(prefix="agent-bench-home-")
+    previous_home = agent_config.AGENT_HOME
+    try:
+        # Run from a scratch directory so executed commands have a small, stable tree
+        os.chdir(workdir)
+        agent_config.AGENT_HOME = Path(home)
+        agent = TerminalAgent(stream=stream, session=False, client=OllamaClient(base_url=server.url),
+                              cache=False, intents=False, structured=structured, retrieval=False,
+                              history=False, summarize=False)
+        response_format = {"format": RESPONSE_SCHEMA} if structured else {}
+        
+        for i in range(iterations):
+            user_input = REQUESTS[i % len(REQUESTS)]
+            
+            started = time.perf_counter()
+            prompt = agent.build_context_prompt(user_input)
+            samples["build_context_prompt"].append(time.perf_counter() - started)
+            
+            started = time.perf_counter()
+            response_data = agent.request_generation({"model": agent.model, "prompt": prompt, **response_format})
+            samples["http_round_trip"].append(time.perf_counter() - started)
+            
+            started = time.perf_counter()
+            ai_response, _ = agent.parse_response(response_data.get("response", ""))
+            samples["json_parse"].append(time.perf_counter() - started)
+            if ai_response is None or ai_response.get("warning"):
+                unusable_replies += 1
+            
+            if ai_response is not None:
+                started = time.perf_counter()
+                result = agent.execute_command(ai_response["command"])
+                samples["execute_command"].append(time.perf_counter() - started)
+            
+            # A full turn the way run() does it, minus the confirmation prompt
+            started = time.perf_counter()
+            ai_response = agent.generate_command(user_input)
+            result = agent.execute_command(ai_response["command"])
+            agent.add_to_history(user_input, ai_response, result)
+            samples["turn"].append(time.perf_counter() - started)
+    finally:
+        os.chdir(previous_cwd)
+        agent_config.AGENT_HOME = previous_home
+        shutil.rmtree(home, ignore_errors=True)
+        shutil.rmtree(workdir, ignore_errors=True)
+        server.stop()
+    
+    return {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            "iterations": iterations,
+            "token_rate": token_rate,
+            "ttft": ttft,
+            "malformed_rate": malformed_rate,
+            "stream": stream,
+            "structured": structured,
+            "honor_format": honor_format
+        },
+        "unusable_replies": unusable_replies,
+        "parse_counters": agent.metrics.counter_values(),
+        "stages": {stage: summarize(values) for stage, values in samples.items()}
+    }
+
+def print_report(report: Dict[str, Any]):
+    """Print the stage table"""
+    print(f"\n📊 Benchmark ({report['config']['iterations']} iterations, revision {report['revision'] or 'unknown'})")
+    print(f"{'stage':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, stats in report["stages"].items():
+        print(f"{stage:<22}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+    print(f"Unusable first replies: {report['unusable_replies']}")
+    if report.get("parse_counters"):
+        print("Parse outcomes: " + ", ".join(f"{name}={count}" for name, count in sorted(report["parse_counters"].items())))
+
+def compare_reports(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+                    min_delta_ms: float = 1.0) -> List[str]:
+    """List stages whose p95 got worse than the baseline by more than tolerance (and min_delta_ms)"""
+    regressions = []
+    for stage, stats in report["stages"].items():
+        before = baseline.get("stages", {}).get(stage)
+        if not before or not before["p95_ms"]:
+            continue
+        change = stats["p95_ms"] / before["p95_ms"] - 1
+        # Sub-millisecond stages are noisy; ignore relative changes that are tiny in absolute terms
+        regressed = change > tolerance and stats["p95_ms"] - before["p95_ms"] > min_delta_ms
+        marker = "❌" if regressed else "✅"
+        print(f"{marker} {stage}: p95 {before['p95_ms']:.2f} ms -> {stats['p95_ms']:.2f} ms ({change:+.0%})")
+        if regressed:
+            regressions.append(stage)
+    return regressions
+
+def main():
+    """Run the benchmark from the command line"""
+    parser = argparse.ArgumentParser(description="Offline latency benchmark for the terminal agent")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--token-rate", type=float, default=200.0, help="mock tokens per second")
+    parser.add_argument("--ttft", type=float, default=0.05, help="mock seconds before the first token")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="fraction of malformed mock replies")
+    parser.add_argument("--no-stream", action="store_true", help="use blocking generate requests")
+    parser.add_argument("--no-structured", action="store_true", help="skip the JSON schema and use fallback parsing")
+    parser.add_argument("--ignore-format", action="store_true", help="let the mock malform replies despite the schema")
+    parser.add_argument("--output", default="bench_output.json", help="where to write the JSON report")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown before failing")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args()
+    
+    report = run_benchmark(args.iterations, args.token_rate, args.ttft, args.malformed_rate, not args.no_stream,
+                           structured=not args.no_structured, honor_format=not args.ignore_format)
+    print_report(report)
+    
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Wrote {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"\n🔍 Compared with {args.baseline} (revision {baseline.get('revision') or 'unknown'}):")
+        if compare_reports(report, baseline, args.tolerance, args.min_delta_ms):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Command Analysis
+Static checks on generated shell commands: whether they are strictly
+read-only, and which paths a read-only command reads
+"""
+
+import glob
+import os
+import shlex
+from typing import Iterable, List, Optional, Tuple
+
+# Programs that only read; used for unattended execution and for caching/speculating results
+READ_ONLY_COMMANDS = [
+    "cat", "date", "df", "du", "echo", "file", "find", "free", "grep", "head", "hostname", "ls",
+    "ps", "pwd", "sort", "stat", "tail", "uname", "uniq", "uptime", "wc", "which", "whoami"
+]
+
+# Options that would let an otherwise read-only program write, run something, change the system or never finish:
+# (short option letters, long option names). Long names also match the abbreviations getopt accepts (--out=F)
+DENIED_OPTIONS = {
+    "date": ("s", {"set"}),
+    "file": ("C", {"compile"}),
+    "hostname": ("Fb", {"file", "boot"}),
+    "sort": ("o", {"output", "compress-program"}),
+    "tail": ("fF", {"follow"})
+}
+
+# Options of those programs that take an argument, so parsing knows what is a value rather than an option or
+# a positional: (short letters, long names). A short option's value may be attached (-oF) or the next word
+OPTION_ARGUMENTS = {
+    "date": ("dfrs", {"date", "file", "reference", "set"}),
+    "file": ("efFmP", {"exclude", "exclude-quiet", "files-from", "separator", "magic-file", "parameter"}),
+    "hostname": ("F", {"file"}),
+    "sort": ("koStT", {"batch-size", "buffer-size", "compress-program", "field-separator", "files0-from", "key",
+                       "output", "parallel", "random-source", "sort", "temporary-directory"}),
+    "tail": ("cns", {"bytes", "lines", "max-unchanged-stats", "pid", "sleep-interval"}),
+    "uniq": ("fsw", {"check-chars", "skip-chars", "skip-fields"})
+}
+
+# Short options whose value, if any, has to be attached (date -Iseconds), so the next word is never theirs
+OPTIONAL_ARGUMENTS = {"date": "I"}
+
+# find's primaries are whole words, never clustered or abbreviated
+DENIED_FIND_PRIMARIES = {"-exec", "-execdir", "-ok", "-okdir", "-delete", "-fprint", "-fprint0", "-fprintf", "-fls"}
+
+# Shell syntax that could redirect output, chain in unchecked commands or run substitutions
+DENIED_SYNTAX = [">", "<", "`", "$(", ";", "\n"]
+
+# Read-only programs whose output depends only on the files they read (not on the clock or processes)
+FILESYSTEM_COMMANDS = {"cat", "du", "file", "find", "grep", "head", "ls", "sort", "stat", "tail", "uniq", "wc"}
+
+# Programs that read from stdin when given no paths, instead of defaulting to the current directory
+STDIN_COMMANDS = {"cat", "grep", "head", "sort", "tail", "uniq", "wc"}
+
+def segments(command: str) -> List[str]:
+    """Split a pipeline or && / || chain into its commands"""
+    return command.replace("&&", "|").replace("||", "|").split("|")
+
+def parse_options(program: str, args: List[str]) -> Tuple[List[str], List[str]]:
+    """Split arguments the way GNU getopt would: options given (-x or --name, values dropped) and positionals"""
+    short_args, long_args = OPTION_ARGUMENTS.get(program, ("", set()))
+    optional_args = OPTIONAL_ARGUMENTS.get(program, "")
+    options, positionals = [], []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        i += 1
+        if arg == "--":
+            positionals.extend(args[i:])
+            break
+        if arg.startswith("--"):
+            name, has_value, _ = arg[2:].partition("=")
+            options.append(f"--{name}")
+            if not has_value and any(long.startswith(name) for long in long_args):
+                i += 1  # --name VALUE
+            continue
+        if arg.startswith("-") and arg != "-":
+            # A cluster like -rn; the first letter that takes a value ends it
+            for j, letter in enumerate(arg[1:], 1):
+                options.append(f"-{letter}")
+                if letter in optional_args:
+                    break
+                if letter in short_args:
+                    if j == len(arg) - 1:
+                        i += 1  # -o VALUE
+                    break
+            continue
+        positionals.append(arg)
+    return options, positionals
+
+def argument_problem(program: str, args: List[str]) -> Optional[str]:
+    """Why the arguments would make a read-only program write, run something or change the system, if they do"""
+    if program == "find":
+        denied = DENIED_FIND_PRIMARIES.intersection(args)
+        return f"find {sorted(denied)[0]} is not allowed" if denied else None
+    
+    options, positionals = parse_options(program, args)
+    denied_short, denied_long = DENIED_OPTIONS.get(program, ("", set()))
+    for option in options:
+        if option.startswith("--"):
+            # getopt takes any unambiguous prefix, so --out means --output
+            if option[2:] and any(long.startswith(option[2:]) for long in denied_long):
+                return f"{program} {option} is not allowed"
+        elif option[1] in denied_short:
+            return f"{program} {option} is not allowed"
+    
+    # Positionals that set something instead of naming what to read
+    if program == "hostname" and positionals:
+        return "hostname with an argument sets the host name"
+    if program == "date" and any(not arg.startswith("+") for arg in positionals):
+        return "date with an argument other than +FORMAT sets the clock"
+    if program == "uniq" and len(positionals) > 1:
+        return "uniq writes to its second argument"
+    return None
+
+def disallowed_reason(command: str, allowlist: Iterable[str] = READ_ONLY_COMMANDS) -> Optional[str]:
+    """Return why a command may not run unattended, or None if every part of it is allowlisted"""
+    for syntax in DENIED_SYNTAX:
+        if syntax in command:
+            return f"contains {syntax!r}"
+    
+    # Pipelines and && / || chains are fine as long as every command in them is allowed
+    for segment in segments(command):
+        if "&" in segment:
+            return "runs a background job"
+        try:
+            words = shlex.split(segment)
+        except ValueError as e:
+            return f"could not be parsed: {str(e)}"
+        if not words:
+            return "has an empty command"
+        
+        # A path (./ls, ~/bin/grep) runs whatever binary is there, not the allowlisted program
+        program = words[0]
+        if "/" in program:
+            return f"{program} is a path, not an allowlisted program"
+        if program not in allowlist:
+            return f"{program} is not on the allowlist"
+        problem = argument_problem(program, words[1:])
+        if problem:
+            return problem
+    return None
+
+def is_read_only(command: str) -> bool:
+    """True if every program in the command is a known read-only one used without writing or system-changing arguments"""
+    return disallowed_reason(command) is None
+
+def has_flag(args: List[str], letters: str, long: str) -> bool:
+    """True if any of the short flags (alone or combined, like -rn) or the long flag is given"""
+    return any(arg == long or (arg.startswith("-") and not arg.startswith("--") and
+                               any(letter in arg[1:] for letter in letters)) for arg in args)
+
+def positional_paths(program: str, args: List[str]) -> List[str]:
+    """The arguments that name files or directories"""
+    if program == "find":
+        # Paths come before the first expression token
+        paths = []
+        for arg in args:
+            if arg.startswith("-") or arg in ("(", "!"):
+                break
+            paths.append(arg)
+        return paths
+    
+    positionals = [arg for arg in args if not arg.startswith("-")]
+    if program == "grep" and not any(arg.startswith(("-e", "-f", "--regexp", "--file")) for arg in args):
+        positionals = positionals[1:]  # The first one is the pattern
+    return positionals
+
+def read_paths(command: str, cwd: str) -> Optional[List[Tuple[str, bool]]]:
+    """(absolute path, recursive) pairs the command reads, or None if its output can't be tied to files"""
+    if not is_read_only(command) or "$" in command:
+        return None
+    
+    paths = []
+    for segment in segments(command):
+        words = shlex.split(segment)
+        program, args = os.path.basename(words[0]), words[1:]
+        if program not in FILESYSTEM_COMMANDS:
+            return None
+        
+        recursive = (program in ("du", "find") or
+                     (program == "grep" and has_flag(args, "rR", "--recursive")) or
+                     (program == "ls" and has_flag(args, "R", "--recursive")))
+        
+        names = positional_paths(program, args)
+        if not names and program in STDIN_COMMANDS and not recursive:
+            continue  # Reads the previous command's output
+        for name in names or ["."]:
+            name = os.path.join(cwd, os.path.expanduser(name))
+            if glob.has_magic(name):
+                # The shell expands the pattern; watch the directory and whatever matches now
+                paths.append((os.path.dirname(name) or cwd, False))
+                paths.extend((match, recursive) for match in glob.glob(name))
+            else:
+                paths.append((os.path.normpath(name), recursive))
+    return paths
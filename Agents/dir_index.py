@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Directory Index
+Depth-limited, size-capped listing of the working directory tree that is only
+rescanned where directory mtimes changed, with relevance-ranked excerpts for prompts
+"""
+
+import heapq
+import os
+import re
+from typing import FrozenSet, List, Optional, Tuple
+
+# Listed but never descended into: big, generated, and rarely what a request is about
+SKIP_DIRS = {".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv", ".mypy_cache", ".tox",
+             ".cache", "dist", "build"}
+
+def words(text: str) -> FrozenSet[str]:
+    """Lowercase alphanumeric words of a name or request"""
+    return frozenset(re.findall(r"[a-z0-9]+", text.lower()))
+
+def format_size(size: int) -> str:
+    """Human-readable size, like ls -h"""
+    for unit in ["B", "K", "M", "G"]:
+        if size < 1024 or unit == "G":
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}G"
+
+class DirectoryIndex:
+    def __init__(self, max_depth: int = 3, max_dirs: int = 500, max_entries: int = 5000):
+        """Listings are cached per directory, so moving between directories reuses earlier scans"""
+        self.max_depth = max_depth
+        self.max_dirs = max_dirs
+        self.max_entries = max_entries
+        self.listings = {}  # dir path -> (mtime_ns, [(name, is_dir, size, name words)])
+        self.root = None
+        self.files = []  # (relative path, is_dir, size, depth, name words, parent's relative path) for the current root
+        self.scans = 0  # Directories actually rescanned, for stats
+
+    def listing(self, path: str) -> Optional[List[Tuple[str, bool, int, FrozenSet[str]]]]:
+        """One directory's entries, rescanned only if its mtime changed"""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self.listings.pop(path, None)
+            return None
+        cached = self.listings.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        
+        entries = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        size = 0 if is_dir else entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+                    entries.append((entry.name, is_dir, size, words(entry.name)))
+        except OSError:
+            return None
+        entries.sort()
+        self.listings[path] = (mtime, entries)
+        self.scans += 1
+        return entries
+
+    def refresh(self, root: str):
+        """Bring the index of root up to date, breadth first so the cap keeps the shallow entries"""
+        self.root = root
+        files = []
+        pending = [(root, "", 0)]
+        dirs = 0
+        while pending and dirs < self.max_dirs and len(files) < self.max_entries:
+            path, relative, depth = pending.pop(0)
+            entries = self.listing(path)
+            dirs += 1
+            if entries is None:
+                continue
+            for name, is_dir, size, name_words in entries:
+                rel = f"{relative}{name}"
+                files.append((rel, is_dir, size, depth, name_words, relative))
+                if is_dir and depth + 1 < self.max_depth and name not in SKIP_DIRS:
+                    pending.append((os.path.join(path, name), rel + "/", depth + 1))
+        self.files = files[:self.max_entries]
+        
+        # Forget listings under other roots once the cache grows well past what one tree needs
+        if len(self.listings) > self.max_dirs * 4:
+            self.listings = {path: listing for path, listing in self.listings.items()
+                             if path == root or path.startswith(root.rstrip(os.sep) + os.sep)}
+
+    def ranked(self, query: str) -> List[Tuple[float, str, bool, int]]:
+        """Entries scored against the request's words, in index order; shallow entries score higher"""
+        query_words = {word for word in words(query) if len(word) > 1}
+        partial = [word for word in query_words if len(word) > 2]
+        
+        def name_score(name: str, name_words: FrozenSet[str]) -> float:
+            # Whole words count most; a word inside a longer name (log in logs.txt) counts a little
+            score = 2.0 * len(query_words & name_words)
+            if partial:
+                lowered = name.lower()
+                score += sum(0.5 for word in partial if word not in name_words and word in lowered)
+            return score
+        
+        # A match in a directory's name counts for everything under it; scored once per directory
+        dir_scores = {"": 0.0}
+        scored = []
+        for rel, is_dir, size, depth, name_words, parent in self.files:
+            score = name_score(rel[len(parent):], name_words) if query_words else 0.0
+            if is_dir:
+                dir_scores[rel + "/"] = dir_scores.get(parent, 0.0) + score
+            scored.append((score + dir_scores.get(parent, 0.0) - 0.3 * depth, rel, is_dir, size))
+        return scored
+
+    def excerpt(self, query: str, max_lines: int = 40, matches_only: bool = False) -> str:
+        """Compact listing for a prompt: matching entries first, then the top of the tree"""
+        lines = []
+        for score, rel, is_dir, size in heapq.nsmallest(max_lines, self.ranked(query), key=lambda item: (-item[0], item[1])):
+            if len(lines) >= max_lines or (matches_only and score <= 0):
+                break
+            lines.append(f"{rel}/" if is_dir else f"{rel} ({format_size(size)})")
+        return "\n".join(lines)
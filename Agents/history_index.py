@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+History Index
+Persistent embedding index of past exchanges, so prompts can include the
+most relevant history within a token budget instead of just the latest turns
+"""
+
+import heapq
+import json
+import math
+import os
+import queue
+import threading
+from array import array
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+import requests
+
+from agent_config import agent_path
+from ollama_client import OllamaClient
+
+try:
+    import numpy as np
+except ImportError:  # Optional: without it, searches fall back to a pure-Python scan
+    np = None
+
+EMBED_MODEL = os.environ.get("TERMINAL_AGENT_EMBED_MODEL", "nomic-embed-text")
+
+# Rows the pure-Python fallback scores per search (NumPy scores them all)
+PURE_PYTHON_ROWS = 1000
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return len(text) // 4 + 1
+
+def normalize(vector: List[float]) -> List[float]:
+    """Scale to unit length so a dot product is the cosine similarity"""
+    length = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / length for x in vector]
+
+def entry_text(entry: Dict[str, Any]) -> str:
+    """The text embedded for an exchange"""
+    return f"{entry['user_input']}\n{entry['command']}"
+
+class HistoryIndex:
+    def __init__(self, client: OllamaClient, model: str = EMBED_MODEL, path: Optional[Path] = None,
+                 max_entries: int = 20000):
+        """Load the stored vectors and start the background embedding thread"""
+        self.client = client
+        self.model = model
+        self.path = path or agent_path("history_index")
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.available = True  # Turned off when the embedding model is missing
+        self.entries = []
+        self.dim = None
+        self.vectors = array("f")  # Row-major, unit-length rows
+        self.matrix = None  # NumPy copy of self.vectors, rebuilt after appends
+        self.load()
+        
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self.embed_loop, daemon=True)
+        self.thread.start()
+
+    def load(self):
+        """Read the index; a missing, corrupt or different-model index starts empty"""
+        try:
+            meta = json.loads((self.path / "meta.json").read_text())
+            if meta["model"] != self.model:
+                return
+            with open(self.path / "entries.jsonl") as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+            vectors = array("f")
+            with open(self.path / "vectors.f32", "rb") as f:
+                vectors.frombytes(f.read())
+        except (OSError, ValueError, KeyError):
+            return
+        
+        dim = meta["dim"]
+        rows = min(len(entries), len(vectors) // dim)
+        self.entries = entries[:rows]
+        self.vectors = vectors[:rows * dim]
+        self.dim = dim
+
+    def embed(self, text: str) -> Optional[List[float]]:
+        """Embed text with Ollama, or None if embeddings are unavailable"""
+        if not self.available:
+            return None
+        try:
+            response = self.client.post("/api/embeddings", json={"model": self.model, "prompt": text}, timeout=10)
+            if response.status_code == 404:
+                # The embedding model isn't installed; fall back to recent history for this run
+                self.available = False
+                return None
+            if response.status_code != 200:
+                return None
+            embedding = response.json().get("embedding")
+            return normalize(embedding) if embedding else None
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+
+    def add(self, user_input: str, command: str, success: bool, output: str, cwd: str, timestamp: float):
+        """Queue an exchange for embedding; the REPL never waits for it"""
+        self.pending.put({
+            "user_input": user_input,
+            "command": command,
+            "success": success,
+            "output": output[:100],
+            "cwd": cwd,
+            "ts": timestamp
+        })
+
+    def embed_loop(self):
+        """Embed queued exchanges and append them to the index files"""
+        while True:
+            entry = self.pending.get()
+            vector = self.embed(entry_text(entry))
+            if vector is not None:
+                self.append(entry, vector)
+            self.pending.task_done()
+
+    def append(self, entry: Dict[str, Any], vector: List[float]):
+        """Add one row in memory and on disk"""
+        with self.lock:
+            if self.dim != len(vector):
+                # First entry, or the embedding model changed size: start over
+                self.entries, self.vectors, self.dim = [], array("f"), len(vector)
+                self.rewrite()
+            self.entries.append(entry)
+            self.vectors.extend(vector)
+            self.matrix = None
+            try:
+                with open(self.path / "entries.jsonl", "a") as f:
+                    f.write(json.dumps(entry) + "\n")
+                with open(self.path / "vectors.f32", "ab") as f:
+                    f.write(array("f", vector).tobytes())
+            except OSError:
+                pass
+            
+            if len(self.entries) > self.max_entries * 1.1:
+                # Drop the oldest tenth at once so trimming doesn't rewrite the files on every append
+                self.entries = self.entries[-self.max_entries:]
+                self.vectors = self.vectors[-self.max_entries * self.dim:]
+                self.rewrite()
+
+    def rewrite(self):
+        """Write the whole index atomically (after a reset or trim)"""
+        try:
+            for name, data in [("entries.jsonl", "".join(json.dumps(entry) + "\n" for entry in self.entries).encode()),
+                               ("vectors.f32", self.vectors.tobytes()),
+                               ("meta.json", json.dumps({"model": self.model, "dim": self.dim}).encode())]:
+                temp_path = self.path / f"{name}.tmp"
+                temp_path.write_bytes(data)
+                os.replace(temp_path, self.path / name)
+        except OSError:
+            pass
+
+    def top(self, query: List[float], k: int) -> List[Tuple[float, int]]:
+        """The k rows with the highest cosine similarity to the query, as (score, row), best first"""
+        if np is not None:
+            if self.matrix is None:
+                # A copy, so the array can keep growing while the matrix is in use
+                self.matrix = np.frombuffer(self.vectors.tobytes(), dtype=np.float32).reshape(-1, self.dim)
+            scores = self.matrix @ np.asarray(query, dtype=np.float32)
+            rows = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+            return sorted(((float(scores[i]), int(i)) for i in rows), reverse=True)
+        # Without NumPy only the newest rows are scanned, to keep the lookup in the low milliseconds
+        dim = self.dim
+        rows = range(max(len(self.entries) - PURE_PYTHON_ROWS, 0), len(self.entries))
+        scores = (sum(a * b for a, b in zip(self.vectors[i * dim:(i + 1) * dim], query)) for i in rows)
+        return heapq.nlargest(k, zip(scores, rows))
+
+    def search(self, text: str, k: int = 5, min_score: float = 0.3) -> List[Tuple[float, Dict[str, Any]]]:
+        """Return up to k (score, entry) pairs most similar to the text, best first"""
+        if not self.entries or not self.available:
+            return []
+        query = self.embed(text)
+        with self.lock:
+            if query is None or len(query) != self.dim:
+                return []
+            return [(score, self.entries[i]) for score, i in self.top(query, k) if score >= min_score]
+
+    def stats(self) -> Dict[str, Any]:
+        """How much of the index a search scores; without NumPy older exchanges are never found"""
+        with self.lock:
+            indexed = len(self.entries)
+        searched = indexed if np is not None else min(indexed, PURE_PYTHON_ROWS)
+        return {
+            "backend": "numpy" if np is not None else "python",
+            "indexed": indexed,
+            "searched": searched,
+            "truncated": searched < indexed,
+            "available": self.available
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
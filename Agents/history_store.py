@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+History Store
+Append-only SQLite history of every executed exchange with full-text search
+(FTS5); writes are batched on a background thread off the REPL's hot path
+"""
+
+import atexit
+import queue
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from agent_config import agent_path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    cwd TEXT NOT NULL,
+    user_input TEXT NOT NULL,
+    command TEXT NOT NULL,
+    explanation TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    return_code INTEGER,
+    output TEXT NOT NULL,
+    scope TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS history_cwd ON history (cwd, id);
+CREATE INDEX IF NOT EXISTS history_success ON history (success, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+    user_input, command, output, content='history', content_rowid='id'
+);
+"""
+
+COLUMNS = ["id", "ts", "cwd", "user_input", "command", "explanation", "success", "return_code", "output"]
+
+# Only the head of the output is kept; it's for recognizing a run, not replaying it
+OUTPUT_LIMIT = 500
+
+def fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query where every word must match as a prefix"""
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"*' for word in words)
+
+class HistoryStore:
+    def __init__(self, path: Optional[Path] = None, batch_size: int = 200):
+        """Open (or create) the database and start the writer thread"""
+        self.path = path or agent_path("history.db")
+        self.batch_size = batch_size
+        
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        try:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+            # Databases from before sessions were scoped lack the column; their rows belong to the CLI
+            if "scope" not in [row[1] for row in self.conn.execute("PRAGMA table_info(history)")]:
+                self.conn.execute("ALTER TABLE history ADD COLUMN scope TEXT NOT NULL DEFAULT ''")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS history_scope ON history (scope, id)")
+        except sqlite3.Error:
+            self.conn.close()
+            raise
+        self.lock = threading.Lock()
+        
+        self.pending = queue.Queue()
+        self.closed = False
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def add(self, user_input: str, command: str, explanation: str, success: bool,
+            return_code: Optional[int], output: str, cwd: str, timestamp: Optional[float] = None, scope: str = ""):
+        """Queue an exchange; returns immediately"""
+        self.pending.put((timestamp or time.time(), cwd, user_input, command, explanation,
+                          int(bool(success)), return_code, (output or "")[:OUTPUT_LIMIT], scope))
+
+    def write_loop(self):
+        """Write queued exchanges in batches, one transaction per batch"""
+        conn = sqlite3.connect(str(self.path))
+        conn.execute("PRAGMA synchronous=NORMAL")
+        while True:
+            # Whatever piled up during the last write goes into the next transaction
+            rows = [self.pending.get()]
+            while len(rows) < self.batch_size:
+                try:
+                    rows.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            
+            stop = None in rows
+            rows = [row for row in rows if row is not None]
+            try:
+                with conn:
+                    for row in rows:
+                        cursor = conn.execute(
+                            "INSERT INTO history (ts, cwd, user_input, command, explanation, success, return_code, output,"
+                            " scope) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row
+                        )
+                        conn.execute("INSERT INTO history_fts (rowid, user_input, command, output) VALUES (?, ?, ?, ?)",
+                                     (cursor.lastrowid, row[2], row[3], row[7]))
+            except sqlite3.Error as e:
+                print(f"⚠️  Could not save history: {str(e)}")
+            finally:
+                for _ in range(len(rows) + (1 if stop else 0)):
+                    self.pending.task_done()
+            if stop:
+                conn.close()
+                return
+
+    def flush(self):
+        """Wait until everything queued so far is on disk"""
+        if not self.closed:
+            self.pending.join()
+
+    def close(self):
+        """Write what's pending and stop the writer"""
+        if self.closed:
+            return
+        self.closed = True
+        self.pending.put(None)
+        self.writer.join(timeout=5)
+
+    def query(self, where: List[str], params: List[Any], limit: int) -> List[Dict[str, Any]]:
+        """Run a filtered query over the history, newest first"""
+        self.flush()
+        sql = "SELECT " + ", ".join(f"history.{column}" for column in COLUMNS) + " FROM history"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY history.id DESC LIMIT ?"
+        with self.lock:
+            rows = self.conn.execute(sql, params + [limit]).fetchall()
+        return [dict(zip(COLUMNS, row), success=bool(row[6])) for row in rows]
+
+    def filters(self, cwd: Optional[str], success: Optional[bool], scope: str = "") -> Tuple[List[str], List[Any]]:
+        """WHERE clauses for the scope and the optional cwd and exit status filters"""
+        where, params = ["history.scope = ?"], [scope]
+        if cwd is not None:
+            where.append("history.cwd = ?")
+            params.append(cwd)
+        if success is not None:
+            where.append("history.success = ?")
+            params.append(int(success))
+        return where, params
+
+    def recent(self, limit: int = 10, cwd: Optional[str] = None, success: Optional[bool] = None,
+               scope: str = "") -> List[Dict[str, Any]]:
+        """The latest exchanges, optionally only from one directory or with one outcome"""
+        where, params = self.filters(cwd, success, scope)
+        return self.query(where, params, limit)
+
+    def search(self, text: str, limit: int = 20, cwd: Optional[str] = None,
+               success: Optional[bool] = None, scope: str = "") -> List[Dict[str, Any]]:
+        """Exchanges whose request, command or output contain every word of the text"""
+        match = fts_query(text)
+        if not match:
+            return []
+        where, params = self.filters(cwd, success, scope)
+        # A subquery rather than a join lets SQLite use the cwd/success indexes on the matches
+        return self.query(["history.id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)"] + where,
+                          [match] + params, limit)
+
+    def get(self, entry_id: int, scope: str = "") -> Optional[Dict[str, Any]]:
+        """One exchange by id"""
+        rows = self.query(["history.id = ?", "history.scope = ?"], [entry_id, scope], 1)
+        return rows[0] if rows else None
+
+    def count(self, scope: str = "") -> int:
+        """Number of stored exchanges"""
+        self.flush()
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM history WHERE scope = ?", (scope,)).fetchone()[0]
+
+    def scoped(self, scope: str) -> "ScopedHistory":
+        """A view of the store that only reads and writes one scope, such as a daemon session"""
+        return ScopedHistory(self, scope)
+
+class ScopedHistory:
+    def __init__(self, store: HistoryStore, scope: str):
+        """Pass every call through to the shared store, restricted to one scope"""
+        self.store = store
+        self.scope = scope
+
+    def add(self, *args, **kwargs):
+        """Queue an exchange in this scope"""
+        self.store.add(*args, **kwargs, scope=self.scope)
+
+    def recent(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        """The latest exchanges in this scope"""
+        return self.store.recent(*args, **kwargs, scope=self.scope)
+
+    def search(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        """Full-text search within this scope"""
+        return self.store.search(*args, **kwargs, scope=self.scope)
+
+    def get(self, entry_id: int) -> Optional[Dict[str, Any]]:
+        """One exchange by id, if it belongs to this scope"""
+        return self.store.get(entry_id, self.scope)
+
+    def count(self) -> int:
+        """Number of exchanges in this scope"""
+        return self.store.count(self.scope)
+
+def open_history_store(path: Optional[Path] = None) -> Optional[HistoryStore]:
+    """Open the store, or warn and return None when SQLite lacks FTS5 or the state directory isn't writable"""
+    try:
+        return HistoryStore(path)
+    except (sqlite3.Error, OSError) as e:
+        print(f"⚠️  History search and recall are off: {str(e)}")
+        return None
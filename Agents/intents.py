@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Intent Engine
+Resolves common requests ("list files", "disk space", "top 5 processes") to
+fixed commands with a compiled pattern table, without calling the model
+"""
+
+import json
+import re
+import shlex
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from agent_config import agent_path
+
+IS_MACOS = sys.platform == "darwin"
+
+# Friendly names people use for file types
+EXTENSION_ALIASES = {
+    "python": "py",
+    "javascript": "js",
+    "typescript": "ts",
+    "text": "txt",
+    "markdown": "md",
+    "shell": "sh",
+    "image": "png",
+    "yaml": "yml"
+}
+
+# Bare words taken as a file type; any other word ("hidden", "empty", "recent") goes to the model
+KNOWN_EXTENSIONS = ["py", "js", "ts", "jsx", "tsx", "txt", "log", "md", "sh", "json", "yml", "yaml", "toml",
+                    "ini", "cfg", "conf", "csv", "xml", "html", "css", "c", "h", "cpp", "hpp", "go", "rs",
+                    "java", "rb", "php", "sql", "pdf", "png", "jpg", "jpeg", "gif", "svg", "zip", "tar", "gz"]
+
+LIST = r"(?:list|show|display)(?: me)?(?: all)?(?: the)?"
+PATH = r"(?P<path>[~./\w-][^\s]*)"
+FIND = rf"(?:find|search for|{LIST})(?: all)?(?: the)?"
+SIZE = r"(?P<size>\d+ ?(?:[kmg]b?|bytes)?)"
+# A leading-dot extension, or a known extension or alias
+EXT = r"(?P<ext>\.\w+|{})".format("|".join(sorted(set(KNOWN_EXTENSIONS) | set(EXTENSION_ALIASES))))
+
+# Checked in order; the first full match wins
+BUILTIN_INTENTS = [
+    {
+        "name": "list files",
+        "patterns": [rf"{LIST} (?:files|contents)(?: here| in this (?:folder|directory|dir))?", r"ls", r"what files are here"],
+        "command": "ls -la",
+        "explanation": "Lists all files in the current directory, including hidden ones, with details"
+    },
+    {
+        "name": "list files in path",
+        "patterns": [rf"{LIST} (?:files|contents) (?:in|of) {PATH}"],
+        "command": "ls -la {path}",
+        "explanation": "Lists all files in {path} with details"
+    },
+    {
+        "name": "find files by extension",
+        "patterns": [rf"{FIND} {EXT} files(?: (?:in|under) {PATH})?"],
+        "command": "find {path} -type f -name '*.{ext}'",
+        "explanation": "Finds all .{ext} files under {path}",
+        "defaults": {"path": "."}
+    },
+    {
+        "name": "find large files",
+        "patterns": [rf"{FIND} (?:large|big) files(?: (?:over|larger than|bigger than) {SIZE})?(?: (?:in|under) {PATH})?(?: here)?"],
+        "command": "find {path} -type f -size +{size}",
+        "explanation": "Finds files larger than {size} under {path}",
+        "defaults": {"path": ".", "size": "100M"}
+    },
+    {
+        "name": "disk space",
+        "patterns": [r"(?:show |check |what'?s )?(?:my |the )?(?:disk|storage) (?:space|usage)(?: left)?", r"how much (?:disk )?space (?:is )?(?:left|free)"],
+        "command": "df -h",
+        "explanation": "Shows free and used space on all mounted disks"
+    },
+    {
+        "name": "directory size",
+        "patterns": [r"how big is (?:this|the current) (?:folder|directory|dir)", r"(?:show |check )?(?:this |current )?(?:folder|directory|dir) size"],
+        "command": "du -sh .",
+        "explanation": "Shows the total size of the current directory"
+    },
+    {
+        "name": "path size",
+        "patterns": [rf"how big is {PATH}", rf"(?:show |check )?(?:the )?size of {PATH}"],
+        "command": "du -sh {path}",
+        "explanation": "Shows the total size of {path}"
+    },
+    {
+        "name": "ip address",
+        "patterns": [r"what'?s my ip(?: address)?", r"what is my ip(?: address)?", r"(?:show|get)(?: me)? my ip(?: address)?"],
+        "command": "ipconfig getifaddr en0" if IS_MACOS else "hostname -I",
+        "explanation": "Shows this machine's local IP address"
+    },
+    {
+        "name": "top processes",
+        "patterns": [rf"(?:{LIST} )?top (?P<count>\d+) processes(?: by cpu)?"],
+        "command": "ps aux | sort -nrk 3 | head -n {count}",
+        "explanation": "Shows the {count} processes using the most CPU"
+    },
+    {
+        "name": "processes",
+        "patterns": [rf"{LIST}(?: running)? processes", r"what(?:'s| is) running", r"ps"],
+        "command": "ps aux",
+        "explanation": "Lists all running processes"
+    },
+    {
+        "name": "memory",
+        "patterns": [r"(?:show |check )?(?:memory|ram)(?: usage)?", r"how much (?:free )?(?:memory|ram)(?: is free| is left| do i have)?"],
+        "command": "vm_stat" if IS_MACOS else "free -h",
+        "explanation": "Shows memory usage"
+    },
+    {
+        "name": "date",
+        "patterns": [r"what(?:'s| is) the (?:current )?(?:date|time)(?: and (?:date|time))?", r"(?:show )?(?:the )?(?:current )?(?:date|time)"],
+        "command": "date",
+        "explanation": "Shows the current date and time"
+    },
+    {
+        "name": "uptime",
+        "patterns": [r"(?:show )?uptime", r"how long has (?:this|the) (?:machine|computer|system) been (?:up|running)"],
+        "command": "uptime",
+        "explanation": "Shows how long the system has been running and its load averages"
+    },
+    {
+        "name": "whoami",
+        "patterns": [r"who am i", r"whoami", r"what(?:'s| is) my (?:user ?name|user)"],
+        "command": "whoami",
+        "explanation": "Shows the current user name"
+    }
+]
+
+def normalize_text(user_input: str) -> str:
+    """Collapse whitespace and drop trailing punctuation, keeping case so paths survive into slots"""
+    text = re.sub(r"\s+", " ", user_input.strip()).rstrip("?! ")
+    # A sentence's final period, but not a bare "." or ".." path
+    return re.sub(r"(?<=[^\s.])\.$", "", text)
+
+def normalize_size(size: str) -> str:
+    """Turn '100 mb' into find's '100M'"""
+    match = re.match(r"(\d+) ?([kmg]?)", size.lower())
+    number, unit = match.group(1), match.group(2)
+    if "byte" in size.lower():
+        return f"{number}c"
+    return number + {"k": "k", "m": "M", "g": "G"}.get(unit, "M")
+
+def normalize_slot(name: str, value: str) -> str:
+    """Clean up an extracted slot value"""
+    if name == "path" and value.lower() in ("here", "this folder", "this directory"):
+        return "."
+    if name == "ext":
+        value = value.lower().lstrip(".")
+        return EXTENSION_ALIASES.get(value, value)
+    if name == "size":
+        return normalize_size(value)
+    if name == "count":
+        return str(min(int(value), 100))
+    return value
+
+def quote_slot(name: str, value: str) -> str:
+    """Shell-quote a slot value, leaving a leading ~ unquoted so it still expands"""
+    if name == "size":
+        return value
+    if name == "path" and (value == "~" or value.startswith("~/")):
+        return "~" + (shlex.quote(value[1:]) if value[1:] else "")
+    return shlex.quote(value)
+
+def fill_template(template: str, slots: Dict[str, str]) -> str:
+    """Substitute {slot} placeholders; anything else in braces (awk programs, etc.) is left alone"""
+    return re.sub(r"\{(\w+)\}", lambda m: slots.get(m.group(1), m.group(0)), template)
+
+class IntentEngine:
+    def __init__(self, config_path: Optional[Path] = None):
+        """Compile the built-in intents plus any user intents from the config file"""
+        self.config_path = config_path or agent_path("intents.json")
+        self.intents = []
+        self.hits = Counter()
+        self.lookups = 0
+        self.lookup_time = 0.0
+        
+        # User intents come first so they can override the built-ins
+        for intent in self.load_user_intents() + BUILTIN_INTENTS:
+            self.add_intent(intent)
+
+    def load_user_intents(self) -> List[Dict[str, Any]]:
+        """Read user-defined intents; a missing file just means there are none"""
+        if not self.config_path.exists():
+            return []
+        try:
+            intents = json.loads(self.config_path.read_text())
+            if not isinstance(intents, list):
+                raise ValueError("expected a list of intents")
+            return intents
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Could not load intents from {self.config_path}: {str(e)}")
+            return []
+
+    def add_intent(self, intent: Dict[str, Any]):
+        """Compile an intent's patterns and add it to the table"""
+        try:
+            compiled = [re.compile(pattern, re.IGNORECASE) for pattern in intent["patterns"]]
+        except (KeyError, TypeError, re.error) as e:
+            print(f"⚠️  Skipping intent {intent.get('name', '?')}: {str(e)}")
+            return
+        self.intents.append((compiled, intent))
+
+    def match(self, user_input: str) -> Optional[Dict[str, Any]]:
+        """Return a ready-made response for the request, or None to ask the model"""
+        started = time.perf_counter()
+        self.lookups += 1
+        try:
+            text = normalize_text(user_input)
+            for compiled, intent in self.intents:
+                found = next((m for m in (pattern.fullmatch(text) for pattern in compiled) if m), None)
+                if not found:
+                    continue
+                
+                slots = {name: normalize_slot(name, value)
+                         for name, value in found.groupdict().items() if value}
+                slots = {**intent.get("defaults", {}), **slots}
+                quoted = {name: quote_slot(name, value) for name, value in slots.items()}
+                
+                self.hits[intent["name"]] += 1
+                return {
+                    "command": fill_template(intent["command"], quoted),
+                    "explanation": fill_template(intent.get("explanation", ""), slots),
+                    "is_safe": True,
+                    "warning": "",
+                    "intent": intent["name"]
+                }
+            return None
+        finally:
+            self.lookup_time += time.perf_counter() - started
+
+    def stats(self) -> Dict[str, Any]:
+        """Report how often requests were answered without the model"""
+        hits = sum(self.hits.values())
+        return {
+            "lookups": self.lookups,
+            "hits": hits,
+            "hit_rate": hits / self.lookups if self.lookups else 0.0,
+            "avg_lookup_ms": self.lookup_time / self.lookups * 1000 if self.lookups else 0.0,
+            "by_intent": dict(self.hits.most_common())
+        }
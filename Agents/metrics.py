@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Metrics
+Low-overhead per-stage latency timers with rolling percentiles, an optional
+JSONL trace of every turn and a Prometheus text-format dump
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+# Upper bounds (seconds) of the cumulative Prometheus histogram buckets
+BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+class StageHistogram:
+    def __init__(self, window: int):
+        """Rolling window for percentiles plus cumulative buckets for Prometheus"""
+        self.recent = deque(maxlen=window)
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        """Record one duration"""
+        self.recent.append(seconds)
+        self.count += 1
+        self.total += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+class Metrics:
+    def __init__(self, trace_path: Optional[str] = None, prometheus_path: Optional[str] = None,
+                 window: int = 500):
+        """Collect stage timings; optionally trace turns to JSONL and export Prometheus text"""
+        self.trace_path = trace_path
+        self.prometheus_path = prometheus_path
+        self.window = window
+        self.stages = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.turn = None
+
+    def record(self, stage: str, seconds: float):
+        """Add one measurement for a stage"""
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = StageHistogram(self.window)
+            histogram.observe(seconds)
+            if self.turn is not None:
+                self.turn["stages"][stage] = round(self.turn["stages"].get(stage, 0.0) + seconds * 1000, 3)
+
+    @contextmanager
+    def time(self, stage: str):
+        """Time the enclosed block with the monotonic clock"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def count(self, name: str, amount: int = 1):
+        """Increment a counter"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def counter_values(self) -> Dict[str, int]:
+        """Snapshot of all counters"""
+        with self.lock:
+            return dict(self.counters)
+
+    def note(self, key: str, value: Any):
+        """Attach a detail (e.g. where the answer came from) to the current turn's trace"""
+        with self.lock:
+            if self.turn is not None:
+                self.turn[key] = value
+
+    def begin_turn(self):
+        """Start collecting the stages of one REPL turn"""
+        with self.lock:
+            self.turn = {"ts": time.time(), "stages": {}}
+
+    def end_turn(self):
+        """Finish the turn: write it to the trace and refresh the Prometheus file"""
+        with self.lock:
+            turn, self.turn = self.turn, None
+        if turn is None:
+            return
+        
+        if self.trace_path:
+            try:
+                with open(self.trace_path, "a") as f:
+                    f.write(json.dumps(turn) + "\n")
+            except OSError:
+                pass
+        
+        if self.prometheus_path:
+            # Write then rename so a scraper never sees a half-written file
+            try:
+                temp_path = f"{self.prometheus_path}.tmp"
+                with open(temp_path, "w") as f:
+                    f.write(self.prometheus_text())
+                os.replace(temp_path, self.prometheus_path)
+            except OSError:
+                pass
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage count and rolling p50/p95/p99 in milliseconds"""
+        with self.lock:
+            stages = {name: (list(h.recent), h.count) for name, h in self.stages.items()}
+        return {
+            name: {
+                "count": count,
+                "p50_ms": percentile(recent, 50) * 1000,
+                "p95_ms": percentile(recent, 95) * 1000,
+                "p99_ms": percentile(recent, 99) * 1000
+            }
+            for name, (recent, count) in stages.items()
+        }
+
+    def prometheus_text(self) -> str:
+        """Render all stages and counters in the Prometheus text exposition format"""
+        lines = [
+            "# HELP terminal_agent_stage_seconds Time spent in each stage of a turn",
+            "# TYPE terminal_agent_stage_seconds histogram"
+        ]
+        with self.lock:
+            for name, histogram in sorted(self.stages.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.buckets):
+                    cumulative += count
+                    lines.append(f'terminal_agent_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'terminal_agent_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'terminal_agent_stage_seconds_sum{{stage="{name}"}} {histogram.total:.6f}')
+                lines.append(f'terminal_agent_stage_seconds_count{{stage="{name}"}} {histogram.count}')
+            
+            if self.counters:
+                lines.append("# HELP terminal_agent_events_total Counted agent events")
+                lines.append("# TYPE terminal_agent_events_total counter")
+                for name, value in sorted(self.counters.items()):
+                    lines.append(f'terminal_agent_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Mock Ollama Server
+Local stand-in for the Ollama HTTP API (/api/tags, /api/generate, /api/chat,
+/api/embeddings)
+with configurable token rate, time to first token, parallel slots and malformed
+output, so the agent can be benchmarked and load-tested without a GPU or network
+"""
+
+import argparse
+import contextlib
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, List, Optional
+
+# Canned replies, picked by the first keyword found in the request
+REPLIES = [
+    ("disk", "df -h", "Shows disk usage for all mounted filesystems"),
+    ("memory", "free -h", "Shows memory usage"),
+    ("process", "ps aux | head -n 10", "Shows the first running processes"),
+    ("python", "find . -name '*.py' -type f", "Finds Python files under the current directory"),
+    ("date", "date", "Shows the current date and time"),
+    ("directory", "pwd", "Prints the current working directory"),
+    ("hello", "echo 'Hello World'", "Prints Hello World")
+]
+DEFAULT_REPLY = ("ls -la", "Lists all files in the current directory with details")
+
+EMBEDDING_DIM = 64
+
+def mock_embedding(text: str) -> List[float]:
+    """Hashed bag of words: texts sharing words get similar vectors, like a real embedding model"""
+    vector = [0.0] * EMBEDDING_DIM
+    for word in re.findall(r"\w+", text.lower()):
+        digest = hashlib.sha1(word.encode()).digest()
+        vector[digest[0] % EMBEDDING_DIM] += 1.0 if digest[1] & 1 else -1.0
+    length = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / length for x in vector]
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        """Keep the benchmark output clean"""
+
+    def send_json(self, status: int, payload: Dict[str, Any]):
+        """Send a complete JSON response"""
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_chunk(self, payload: Dict[str, Any]):
+        """Send one NDJSON line as an HTTP chunk"""
+        line = json.dumps(payload).encode() + b"\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def do_GET(self):
+        """Serve /api/tags"""
+        if self.path != "/api/tags":
+            self.send_json(404, {"error": "not found"})
+            return
+        self.send_json(200, {"models": [{"name": name, "model": name} for name in self.server.models]})
+
+    def do_POST(self):
+        """Serve /api/generate, /api/chat and /api/embeddings"""
+        if self.path not in ("/api/generate", "/api/chat", "/api/embeddings"):
+            self.send_json(404, {"error": "not found"})
+            return
+        
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self.send_json(400, {"error": "invalid JSON"})
+            return
+        
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            server.requests.append(request)
+        try:
+            if self.path == "/api/embeddings":
+                self.embeddings(request)
+            else:
+                self.generate(request)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client hung up mid-stream (e.g. a cancelled generation)
+            with server.lock:
+                server.cancelled += 1
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def embeddings(self, request: Dict[str, Any]):
+        """Return a deterministic embedding for the prompt"""
+        model = request.get("model", "")
+        if not any(name == model or name.split(":")[0] == model for name in self.server.models):
+            self.send_json(404, {"error": f"model '{model}' not found"})
+            return
+        self.send_json(200, {"embedding": mock_embedding(request.get("prompt", ""))})
+
+    def generate(self, request: Dict[str, Any]):
+        """Produce a reply at the configured pace"""
+        server = self.server
+        model = request.get("model", "")
+        if not any(name == model or name.split(":")[0] == model for name in server.models):
+            self.send_json(404, {"error": f"model '{model}' not found"})
+            return
+        
+        chat = self.path == "/api/chat"
+        if chat:
+            messages = request.get("messages", [])
+            prompt = messages[-1].get("content", "") if messages else ""
+        else:
+            prompt = request.get("prompt", "")
+        
+        # Real Ollama constrains output to the requested format; honor_format=False simulates a model that slips
+        response_format = request.get("format")
+        plan = isinstance(response_format, dict) and "steps" in response_format.get("properties", {})
+        text = server.reply_for(prompt, allow_malformed=not (response_format and server.honor_format), plan=plan)
+        tokens = re.findall(r".{1,4}", text, re.S) or [""]
+        prompt_tokens = len(prompt) // 4 + len(request.get("context", []))
+        final = {
+            "model": model,
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": len(tokens),
+            "total_duration": int((server.ttft + len(tokens) / server.token_rate) * 1e9)
+        }
+        if not chat:
+            final["context"] = list(range(prompt_tokens + len(tokens)))
+
+        def piece(token: str) -> Dict[str, Any]:
+            if chat:
+                return {"model": model, "message": {"role": "assistant", "content": token}, "done": False}
+            return {"model": model, "response": token, "done": False}
+        
+        # Like OLLAMA_NUM_PARALLEL: requests beyond the slot count wait for one to free up
+        with server.slots:
+            time.sleep(server.ttft)
+            if not request.get("stream", True):
+                time.sleep(len(tokens) / server.token_rate)
+                final.update(piece(text))
+                final["done"] = True
+                self.send_json(200, final)
+                return
+            
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in tokens:
+                self.send_chunk(piece(token))
+                time.sleep(1 / server.token_rate)
+            final.update(piece(""))
+            final["done"] = True
+            self.send_chunk(final)
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+class MockOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, models: Optional[List[str]] = None,
+                 token_rate: float = 50.0, ttft: float = 0.1, malformed_rate: float = 0.0,
+                 seed: Optional[int] = None, honor_format: bool = True, parallel: Optional[int] = None):
+        """Create a server; port 0 picks a free port"""
+        super().__init__((host, port), MockOllamaHandler)
+        self.models = models or ["llama3.2:latest", "nomic-embed-text:latest"]
+        self.token_rate = token_rate  # Tokens per second
+        self.ttft = ttft  # Seconds before the first token
+        self.malformed_rate = malformed_rate  # Fraction of replies that are not clean JSON
+        self.honor_format = honor_format  # Requests with a `format` never get malformed replies
+        # Generations served at once; None means unlimited
+        self.slots = threading.BoundedSemaphore(parallel) if parallel else contextlib.nullcontext()
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.request_count = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.cancelled = 0
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        """Base URL clients should use"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reply_for(self, prompt: str, allow_malformed: bool = True, plan: bool = False) -> str:
+        """Pick a canned reply for the request, sometimes malformed"""
+        if prompt.rstrip().endswith("Updated summary:"):
+            # Summaries: the exchange lines, shortened
+            exchanges = prompt.rsplit("Exchanges to add:", 1)[-1].rsplit("Updated summary:", 1)[0]
+            return " ".join(line.split(" (")[0].lstrip("- ") for line in exchanges.strip().splitlines())
+        request = prompt.rsplit("Current User Request:", 1)[-1].strip().split("\n", 1)[0].lower()
+        if plan:
+            # One independent step per keyword in the request
+            steps = [{"id": str(i), "command": command, "explanation": explanation, "is_safe": True, "warning": "",
+                      "depends_on": []}
+                     for i, (_, command, explanation) in enumerate(
+                         [reply for reply in REPLIES if reply[0] in request] or [("", *DEFAULT_REPLY)], 1)]
+            return json.dumps({"steps": steps, "explanation": f"Runs {len(steps)} independent steps"})
+        command, explanation = next(
+            ((command, explanation) for keyword, command, explanation in REPLIES if keyword in request),
+            DEFAULT_REPLY
+        )
+        reply = json.dumps({"command": command, "explanation": explanation, "is_safe": True, "warning": ""})
+        
+        with self.lock:
+            malformed = allow_malformed and self.random.random() < self.malformed_rate
+            style = self.random.choice(["fenced", "prose", "truncated"])
+        if not malformed:
+            return reply
+        if style == "fenced":
+            return f"```json\n{reply}\n```"
+        if style == "prose":
+            return f"Sure! Here is the command:\ncommand: {command}\nIt {explanation.lower()}."
+        return reply[:len(reply) // 2]
+
+    def start(self) -> "MockOllamaServer":
+        """Serve in a background thread"""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Shut the server down"""
+        self.shutdown()
+        self.server_close()
+
+def main():
+    """Run the mock server in the foreground"""
+    parser = argparse.ArgumentParser(description="Mock Ollama server for offline testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--model", action="append", dest="models", help="model name to report (repeatable)")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="tokens per second")
+    parser.add_argument("--ttft", type=float, default=0.1, help="seconds before the first token")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="fraction of malformed replies")
+    parser.add_argument("--ignore-format", action="store_true", help="malform replies even when a format is requested")
+    parser.add_argument("--parallel", type=int, help="generations served at once, like OLLAMA_NUM_PARALLEL")
+    args = parser.parse_args()
+    
+    server = MockOllamaServer(args.host, args.port, args.models, args.token_rate, args.ttft, args.malformed_rate,
+                              honor_format=not args.ignore_format, parallel=args.parallel)
+    print(f"🧪 Mock Ollama listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Stopped")
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
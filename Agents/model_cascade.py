@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Model Cascade
+Picks which installed models answer a request, smallest first, and decides
+when a reply is not good enough and should go to the next, larger model
+"""
+
+import os
+from typing import Dict, Any, List, Optional
+
+# Preferred tiers, fastest first; the last one is the model of record
+DEFAULT_CASCADE = ["llama3.2:1b", "llama3.2"]
+
+# Replies whose self-reported confidence is below this are escalated
+CONFIDENCE_THRESHOLD = 0.5
+
+def configured_cascade() -> List[str]:
+    """Model names from TERMINAL_AGENT_MODELS (comma-separated, smallest first) or the defaults"""
+    models = [name.strip() for name in os.environ.get("TERMINAL_AGENT_MODELS", "").split(",") if name.strip()]
+    return models or list(DEFAULT_CASCADE)
+
+def installed_name(wanted: str, installed: List[str]) -> Optional[str]:
+    """Match a configured name to an installed one; 'llama3.2' matches 'llama3.2:latest'"""
+    if wanted in installed:
+        return wanted
+    if ":" not in wanted and f"{wanted}:latest" in installed:
+        return f"{wanted}:latest"
+    return None
+
+def resolve_cascade(preferred: List[str], models: List[Dict[str, Any]]) -> List[str]:
+    """Keep the preferred tiers that are installed; with none of them, use the smallest and largest installed model"""
+    # Embedding models can't write commands
+    models = [model for model in models if model.get("name") and "embed" not in model["name"]]
+    installed = [model["name"] for model in models]
+    cascade = []
+    for wanted in preferred:
+        name = installed_name(wanted, installed)
+        if name and name not in cascade:
+            cascade.append(name)
+    if cascade or not installed:
+        return cascade
+
+    by_size = sorted(models, key=lambda model: model.get("size") or 0)
+    return list(dict.fromkeys([by_size[0]["name"], by_size[-1]["name"]]))
+
+def escalation_reason(result: Optional[Dict[str, Any]], threshold: float = CONFIDENCE_THRESHOLD) -> Optional[str]:
+    """Why a reply should go to the next model, or None if it can be used as is"""
+    if result is None:
+        return "schema"
+    if not result.get("is_safe", True):
+        return "unsafe"
+    confidence = result.get("confidence")
+    if isinstance(confidence, (int, float)) and confidence < threshold:
+        return "low_confidence"
+    return None
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Model Probe
+Startup helpers: the /api/tags model list cached on disk for a short time,
+and a background warm-up that loads models before the first question
+"""
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from agent_config import agent_path
+from ollama_client import OllamaClient
+
+# Seconds a cached model list is trusted before /api/tags is asked again
+PROBE_TTL = float(os.environ.get("TERMINAL_AGENT_PROBE_TTL", 300))
+
+def load_models(client: OllamaClient, ttl: float = PROBE_TTL,
+                path: Optional[Path] = None) -> Tuple[List[Dict[str, Any]], bool]:
+    """Return (models, from_cache), asking /api/tags only when the cached list is missing or stale"""
+    path = path or agent_path("models.json")
+    try:
+        cached = json.loads(path.read_text())
+        if cached["url"] == client.base_url and time.time() - cached["checked"] < ttl:
+            return cached["models"], True
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    models = client.list_models()
+    try:
+        # Write then rename so a concurrent start never reads half a file
+        temp_path = path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps({"url": client.base_url, "checked": time.time(), "models": models}))
+        os.replace(temp_path, path)
+    except OSError:
+        pass
+    return models, False
+
+def forget_models(path: Optional[Path] = None):
+    """Drop the cached list, e.g. after Ollama reports a model it listed as missing"""
+    try:
+        (path or agent_path("models.json")).unlink()
+    except FileNotFoundError:
+        pass
+
+class ModelWarmer:
+    def __init__(self, client: OllamaClient, models: List[str], timeout: float = 120.0):
+        """Load each model with an empty generate call in a background thread, in order"""
+        self.client = client
+        self.timeout = timeout
+        self.ready = {model: threading.Event() for model in models}
+        self.errors = {}
+        self.thread = threading.Thread(target=self.run, args=(list(models),), daemon=True)
+        self.thread.start()
+
+    def run(self, models: List[str]):
+        """An empty prompt makes Ollama load the model and keep it for keep_alive"""
+        for model in models:
+            try:
+                response = self.client.post("/api/generate", json={"model": model, "prompt": "", "stream": False},
+                                            timeout=self.timeout)
+                response.close()
+                if response.status_code != 200:
+                    self.errors[model] = f"status {response.status_code}"
+            except Exception as e:
+                self.errors[model] = str(e)
+            finally:
+                self.ready[model].set()
+
+    def wait(self, model: str, cancelled: Optional[threading.Event] = None) -> float:
+        """Block until the model's warm-up is over or cancelled is set; returns the seconds spent waiting"""
+        event = self.ready.get(model)
+        if event is None or event.is_set():
+            return 0.0
+        started = time.perf_counter()
+        if cancelled is None:
+            event.wait(self.timeout)
+        else:
+            # Short waits so a cancel is noticed quickly; loading a model can take a while
+            while not (event.wait(0.05) or cancelled.is_set() or time.perf_counter() - started > self.timeout):
+                pass
+        return time.perf_counter() - started
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Ollama Client
+Shared HTTP layer for talking to Ollama: a pooled session with timeouts,
+bounded retries with jitter and a keep_alive hint so the model stays loaded
+"""
+
+import os
+import random
+import socket
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, Optional
+
+DEFAULT_OLLAMA_URL = "http://localhost:11434"
+
+# Status codes worth retrying: the server is up but momentarily unable to answer
+RETRY_STATUS_CODES = {502, 503, 504}
+
+def abort_response(response: requests.Response):
+    """Cut a streaming response off from another thread; shutting the socket down wakes a read blocked on it"""
+    sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+class OllamaClient:
+    def __init__(self, base_url: Optional[str] = None, connect_timeout: float = 5.0,
+                 read_timeout: float = 60.0, max_retries: int = 2, backoff: float = 0.25,
+                 keep_alive: Optional[str] = None, pool_size: int = 4):
+        """Create a client with a persistent connection pool"""
+        self.base_url = (base_url or os.environ.get("OLLAMA_HOST") or DEFAULT_OLLAMA_URL).rstrip("/")
+        if "://" not in self.base_url:
+            self.base_url = f"http://{self.base_url}"
+        
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        
+        # How long Ollama should keep the model in memory after each request
+        self.keep_alive = keep_alive or os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+        
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+        self.request_count = 0
+        self.retry_count = 0
+
+    def request(self, method: str, path: str, json: Optional[Dict[str, Any]] = None,
+                stream: bool = False, timeout: Optional[float] = None) -> requests.Response:
+        """Send a request, retrying connection failures and busy responses with jittered backoff"""
+        url = f"{self.base_url}{path}"
+        
+        # Ask Ollama to keep the model loaded between slow human turns
+        if json is not None and path in ("/api/generate", "/api/chat", "/api/embeddings"):
+            json = {"keep_alive": self.keep_alive, **json}
+        
+        attempt = 0
+        while True:
+            self.request_count += 1
+            try:
+                response = self.session.request(
+                    method,
+                    url,
+                    json=json,
+                    stream=stream,
+                    timeout=(self.connect_timeout, timeout or self.read_timeout)
+                )
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                response.close()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+            
+            # Full jitter keeps several clients from retrying in lockstep
+            attempt += 1
+            self.retry_count += 1
+            time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def get(self, path: str, timeout: Optional[float] = None) -> requests.Response:
+        """GET a path on the Ollama server"""
+        return self.request("GET", path, timeout=timeout)
+
+    def post(self, path: str, json: Dict[str, Any], stream: bool = False,
+             timeout: Optional[float] = None) -> requests.Response:
+        """POST a JSON payload to the Ollama server"""
+        return self.request("POST", path, json=json, stream=stream, timeout=timeout)
+
+    def list_models(self) -> list:
+        """Return the model list reported by /api/tags"""
+        response = self.get("/api/tags")
+        if response.status_code != 200:
+            raise Exception(f"Ollama server returned status {response.status_code}")
+        return response.json().get("models", [])
+
+    def stats(self) -> Dict[str, Any]:
+        """Report how many requests were served over reused connections"""
+        connections_opened = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    connections_opened += pool.num_connections
+        
+        return {
+            "requests": self.request_count,
+            "retries": self.retry_count,
+            "connections_opened": connections_opened,
+            "connections_reused": max(self.request_count - connections_opened, 0),
+            "keep_alive": self.keep_alive
+        }
+
+    def close(self):
+        """Close all pooled connections"""
+        self.session.close()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Plan Runner
+Executes a validated multi-step plan as a dependency graph: independent steps
+run concurrently in a bounded pool, dependents start once their inputs are done
+"""
+
+import os
+import shutil
+import signal
+import subprocess
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Any, Callable, List, Optional, Set
+
+def run_step(command: str, cwd: str, timeout: float = 30,
+             processes: Optional[Set[subprocess.Popen]] = None) -> Dict[str, Any]:
+    """Run one step in its own bash process and process group; processes holds it while it runs, for interrupting"""
+    try:
+        process = subprocess.Popen(
+            command,
+            shell=True,
+            executable=shutil.which("bash"),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            cwd=cwd,
+            start_new_session=True
+        )
+    except OSError as e:
+        return {"success": False, "stdout": "", "stderr": f"Error executing command: {str(e)}", "return_code": -1}
+    if processes is not None:
+        processes.add(process)
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        # Kill everything the step started, not just its shell
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        process.communicate()
+        return {"success": False, "stdout": "", "stderr": f"Command timed out after {timeout:g} seconds",
+                "return_code": -1}
+    finally:
+        if processes is not None:
+            processes.discard(process)
+    # Killed by a signal (e.g. interrupted): report it the way bash does, 128 + the signal number
+    return_code = process.returncode if process.returncode >= 0 else 128 - process.returncode
+    return {
+        "success": return_code == 0,
+        "stdout": stdout,
+        "stderr": stderr,
+        "return_code": return_code
+    }
+
+def plan_order(steps: List[Dict[str, Any]]) -> List[str]:
+    """Step ids in an order that respects dependencies, keeping the plan's order where it can"""
+    done, order = set(), []
+    while len(order) < len(steps):
+        for step in steps:
+            if step["id"] not in done and all(dep in done for dep in step["depends_on"]):
+                done.add(step["id"])
+                order.append(step["id"])
+                break
+    return order
+
+class PlanRunner:
+    def __init__(self, execute: Callable[[str], Dict[str, Any]], workers: int = 4):
+        """execute runs one command and returns a result dict like TerminalAgent.execute_command"""
+        self.execute = execute
+        self.workers = workers
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        """Start no further steps; the caller interrupts the ones already running"""
+        self.cancelled.set()
+
+    def run(self, steps: List[Dict[str, Any]],
+            on_step: Optional[Callable[[Dict[str, Any], Dict[str, Any]], None]] = None) -> Dict[str, Dict[str, Any]]:
+        """Run every step whose dependencies succeeded; returns results by step id"""
+        by_id = {step["id"]: step for step in steps}
+        waiting = {step["id"]: set(step["depends_on"]) for step in steps}
+        dependents = {step["id"]: [] for step in steps}
+        for step in steps:
+            for dep in step["depends_on"]:
+                dependents[dep].append(step["id"])
+        results = {}
+        cancelled = {"success": False, "skipped": True, "stdout": "", "stderr": "Cancelled", "return_code": None}
+        
+        def execute(command: str) -> Dict[str, Any]:
+            # Steps still queued in the pool when the plan is cancelled don't start at all
+            return dict(cancelled) if self.cancelled.is_set() else self.execute(command)
+        
+        def finish(step_id: str, result: Dict[str, Any]):
+            results[step_id] = result
+            if on_step:
+                on_step(by_id[step_id], result)
+        
+        def skip(step_id: str, failed: str):
+            # A failed step takes everything downstream of it down too
+            if step_id in results:
+                return
+            waiting.pop(step_id, None)
+            finish(step_id, {"success": False, "skipped": True, "stdout": "",
+                             "stderr": f"Skipped because step {failed} failed", "return_code": None})
+            for dependent in dependents[step_id]:
+                skip(dependent, failed)
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            running = {}
+            
+            def submit_ready():
+                if self.cancelled.is_set():
+                    for step_id in list(waiting):
+                        del waiting[step_id]
+                        finish(step_id, dict(cancelled))
+                    return
+                for step_id in [step_id for step_id, deps in waiting.items() if not deps]:
+                    del waiting[step_id]
+                    running[pool.submit(execute, by_id[step_id]["command"])] = step_id
+            
+            submit_ready()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step_id = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"success": False, "stdout": "", "stderr": f"Error executing command: {str(e)}",
+                                  "return_code": -1}
+                    finish(step_id, result)
+                    for dependent in dependents[step_id]:
+                        if not result.get("success"):
+                            skip(dependent, step_id)
+                        elif dependent in waiting:
+                            waiting[dependent].discard(step_id)
+                submit_ready()
+        return results
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Prompt Builder
+Assembles prompts to a fixed token budget with per-section quotas, and keeps
+a rolling summary of older exchanges that is refreshed in the background
+"""
+
+import os
+import queue
+import threading
+from typing import Dict, Any, List, Optional
+
+import requests
+
+from history_index import estimate_tokens
+from ollama_client import OllamaClient
+
+# Whole-prompt budget, system prompt and request included
+PROMPT_TOKEN_BUDGET = int(os.environ.get("TERMINAL_AGENT_PROMPT_BUDGET", 1500))
+
+# Shares of what is left after the system prompt and request, filled in this order;
+# whatever a section doesn't use carries over to the next one
+SECTION_QUOTAS = {
+    "context": 0.15,  # Working directory and what's in it
+    "output": 0.25,  # Excerpt of the latest command's output
+    "summary": 0.15,  # Rolling summary of exchanges older than the verbatim ones
+    "history": 0.45  # Recent and retrieved exchanges, newest first
+}
+
+# Exchanges shown verbatim; older ones only reach the prompt through the summary (or retrieval)
+RECENT_EXCHANGES = 3
+
+SUMMARY_PROMPT = """Update the summary of a terminal session. Keep file names, directories, \
+errors and anything the user may refer back to. Reply with the summary only, at most {words} words.
+
+Current summary:
+{summary}
+
+Exchanges to add:
+{exchanges}
+
+Updated summary:"""
+
+def excerpt(text: str, tokens: int) -> str:
+    """Fit text to a token allowance, keeping its beginning and end (errors and totals are usually there)"""
+    if estimate_tokens(text) <= tokens:
+        return text
+    chars = max(tokens * 4 - 40, 0)
+    if chars <= 0:
+        return ""
+    head = chars * 2 // 3
+    tail = chars - head
+    omitted = len(text) - head - tail
+    return f"{text[:head]}\n... [{omitted} chars omitted] ...\n{text[-tail:] if tail else ''}"
+
+def exchange_line(exchange: Dict[str, Any]) -> str:
+    """One-line record of an exchange for summarizing"""
+    result = exchange['command_result']
+    status = "ok" if result.get('success') else "failed"
+    output = (result.get('stdout') or result.get('stderr') or '').strip().replace("\n", " ")
+    return f"- {exchange['user_input']} -> {exchange['ai_response'].get('command', 'N/A')} ({status}) {output[:200]}"
+
+class PromptBuilder:
+    def __init__(self, fixed: List[str], budget: int = PROMPT_TOKEN_BUDGET,
+                 quotas: Optional[Dict[str, float]] = None):
+        """Split what's left of the budget after the fixed parts (system prompt, request) into section quotas"""
+        available = max(budget - sum(estimate_tokens(text) for text in fixed), 0)
+        self.quotas = {name: int(available * share) for name, share in (quotas or SECTION_QUOTAS).items()}
+        self.spare = 0
+        self.used = sum(estimate_tokens(text) for text in fixed)
+
+    def allowance(self, section: str) -> int:
+        """Tokens the section may use: its quota plus what earlier sections left over"""
+        return self.quotas.get(section, 0) + self.spare
+
+    def fit(self, section: str, text: str) -> str:
+        """Trim one text to the section's allowance"""
+        allowance = self.allowance(section)
+        text = excerpt(text, allowance) if text else ""
+        cost = estimate_tokens(text) if text else 0
+        self.spare = max(allowance - cost, 0)
+        self.used += cost
+        return text
+
+    def fit_blocks(self, section: str, blocks: List[str], costs: Optional[List[int]] = None) -> List[str]:
+        """Keep whole blocks, most important first, while they fit; costs overrides parts already charged elsewhere"""
+        allowance = self.allowance(section)
+        kept, cost = [], 0
+        for i, block in enumerate(blocks):
+            block_cost = costs[i] if costs else estimate_tokens(block)
+            if cost + block_cost > allowance:
+                break
+            kept.append(block)
+            cost += block_cost
+        self.spare = max(allowance - cost, 0)
+        self.used += cost
+        return kept
+
+class RollingSummary:
+    def __init__(self, client: OllamaClient, model: str, max_tokens: int = 200):
+        """Summarize exchanges in a background thread; readers always get the latest finished summary"""
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.text = ""
+        self.lock = threading.Lock()
+        self.generation = 0  # Bumped by clear() so an in-flight update can't resurrect old text
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def add(self, exchange: Dict[str, Any]):
+        """Queue an exchange that has left the verbatim window; returns immediately"""
+        self.pending.put((self.generation, exchange))
+
+    def current(self) -> str:
+        """The summary as of the last finished pass"""
+        with self.lock:
+            return self.text
+
+    def flush(self):
+        """Wait until every queued exchange is in the summary"""
+        self.pending.join()
+
+    def clear(self):
+        """Forget the summary (e.g. when the conversation is cleared)"""
+        with self.lock:
+            self.text = ""
+            self.generation += 1
+
+    def run(self):
+        """Fold queued exchanges into the summary, several at a time if they piled up"""
+        while True:
+            batch = [self.pending.get()]
+            while True:
+                try:
+                    batch.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            
+            generation = self.generation
+            lines = [exchange_line(exchange) for queued_generation, exchange in batch if queued_generation == generation]
+            if lines:
+                updated = self.summarize(self.current(), lines)
+                with self.lock:
+                    if generation == self.generation:
+                        self.text = updated
+            for _ in batch:
+                self.pending.task_done()
+
+    def summarize(self, summary: str, lines: List[str]) -> str:
+        """Ask the model for an updated summary; if that fails, keep the newest lines verbatim"""
+        prompt = SUMMARY_PROMPT.format(words=self.max_tokens * 3 // 4, summary=summary or "(empty)",
+                                       exchanges="\n".join(lines))
+        try:
+            response = self.client.post("/api/generate", json={
+                "model": self.model,
+                "prompt": prompt,
+                "stream": False,
+                "options": {"num_predict": self.max_tokens}
+            }, timeout=60)
+            if response.status_code == 200:
+                text = response.json().get("response", "").strip()
+                if text:
+                    return excerpt(text, self.max_tokens)
+        except (requests.exceptions.RequestException, ValueError):
+            pass
+        
+        # Extractive fallback: drop the oldest lines until it fits
+        kept = (summary.splitlines() if summary else []) + lines
+        while kept and estimate_tokens("\n".join(kept)) > self.max_tokens:
+            kept.pop(0)
+        return "\n".join(kept)
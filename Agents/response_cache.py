@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Response Cache
+Two-tier cache for generated commands: an in-memory LRU in front of a
+persistent SQLite table with TTL and size-based eviction
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from agent_config import agent_path
+
+def normalize_request(user_input: str) -> str:
+    """Normalize a request so trivial spelling variations share a cache entry"""
+    text = re.sub(r"\s+", " ", user_input.strip().lower())
+    return text.rstrip("?.! ")
+
+class ResponseCache:
+    def __init__(self, path: Optional[Path] = None, memory_size: int = 128,
+                 max_entries: int = 5000, ttl: float = 7 * 24 * 3600):
+        """Open the cache; the SQLite tier is skipped if its file cannot be opened"""
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        
+        self.path = path
+        self.db = None
+        try:
+            self.path = path or agent_path("response_cache.db")
+            self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self.db.commit()
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠️  Response cache is memory-only: {str(e)}")
+            self.db = None
+
+    def make_key(self, user_input: str, cwd: str, history_fingerprint: str, model: str) -> str:
+        """Build the cache key for a request in a given directory and conversation state"""
+        raw = "\0".join([normalize_request(user_input), cwd, history_fingerprint, model])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look a key up in memory, then on disk"""
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.ttl:
+                    self.memory.move_to_end(key)
+                    self.hits["memory"] += 1
+                    return value
+                del self.memory[key]
+            
+            if self.db is not None:
+                try:
+                    row = self.db.execute(
+                        "SELECT value, created FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None and now - row[1] <= self.ttl:
+                        self.db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                        self.db.commit()
+                        value = json.loads(row[0])
+                        self._remember(key, row[1], value)
+                        self.hits["disk"] += 1
+                        return value
+                except sqlite3.Error:
+                    pass
+            
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """Store a response in both tiers"""
+        now = time.time()
+        with self.lock:
+            self._remember(key, now, value)
+            
+            if self.db is not None:
+                try:
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO responses (key, value, created, last_used) VALUES (?, ?, ?, ?)",
+                        (key, json.dumps(value), now, now)
+                    )
+                    self._evict(now)
+                    self.db.commit()
+                except sqlite3.Error:
+                    pass
+
+    def _remember(self, key: str, created: float, value: Dict[str, Any]):
+        """Insert into the LRU tier, dropping the least recently used entry when full"""
+        self.memory[key] = (created, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def _evict(self, now: float):
+        """Remove expired rows and trim the table to max_entries"""
+        self.db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        self.db.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def clear(self):
+        """Empty both tiers"""
+        with self.lock:
+            self.memory.clear()
+            if self.db is not None:
+                try:
+                    self.db.execute("DELETE FROM responses")
+                    self.db.commit()
+                except sqlite3.Error:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Report hit rates and tier sizes"""
+        with self.lock:
+            disk_entries = 0
+            if self.db is not None:
+                try:
+                    disk_entries = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            
+            lookups = self.hits["memory"] + self.hits["disk"] + self.misses
+            return {
+                "memory_hits": self.hits["memory"],
+                "disk_hits": self.hits["disk"],
+                "misses": self.misses,
+                "hit_rate": (self.hits["memory"] + self.hits["disk"]) / lookups if lookups else 0.0,
+                "memory_entries": len(self.memory),
+                "disk_entries": disk_entries,
+                "path": str(self.path) if self.db is not None else None
+            }
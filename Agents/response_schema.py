@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Response Schema
+JSON schema for the model's command replies, passed to Ollama's `format`
+parameter, with strict validation and a cheap local repair step
+"""
+
+import json
+from typing import Dict, Any, Optional
+
+RESPONSE_FIELDS = {
+    "command": str,
+    "explanation": str,
+    "is_safe": bool,
+    "warning": str
+}
+
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "command": {"type": "string"},
+        "explanation": {"type": "string"},
+        "is_safe": {"type": "boolean"},
+        "warning": {"type": "string"},
+        "confidence": {"type": "number", "minimum": 0, "maximum": 1}
+    },
+    "required": list(RESPONSE_FIELDS)
+}
+
+def clean_confidence(data: Dict[str, Any]):
+    """Drop an optional confidence that isn't a number from 0 to 1 rather than rejecting the reply"""
+    confidence = data.get("confidence")
+    if "confidence" in data and (isinstance(confidence, bool) or not isinstance(confidence, (int, float))
+                                 or not 0 <= confidence <= 1):
+        del data["confidence"]
+
+def validate_response(data: Any) -> Optional[str]:
+    """Return what is wrong with a parsed reply, or None if it matches the schema"""
+    if not isinstance(data, dict):
+        return "reply is not a JSON object"
+    for field, expected in RESPONSE_FIELDS.items():
+        if field not in data:
+            return f"missing field '{field}'"
+        if not isinstance(data[field], expected):
+            return f"field '{field}' should be {expected.__name__}"
+    if not data["command"].strip():
+        return "command is empty"
+    clean_confidence(data)
+    return None
+
+def repair_response(text: str) -> Optional[Dict[str, Any]]:
+    """Fix the common near misses (code fences, surrounding prose, loose types) without another generation"""
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    
+    if isinstance(data.get("is_safe"), str) and data["is_safe"].lower() in ("true", "false"):
+        data["is_safe"] = data["is_safe"].lower() == "true"
+    for field in ("explanation", "warning"):
+        if data.get(field) is None:
+            data[field] = ""
+    
+    repaired = {field: data[field] for field in list(RESPONSE_FIELDS) + ["confidence"] if field in data}
+    clean_confidence(repaired)
+    return repaired
+
+# Plans: several commands from one generation, with the order they depend on
+MAX_PLAN_STEPS = 8
+
+PLAN_STEP_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "id": {"type": "string"},
+        **RESPONSE_SCHEMA["properties"],
+        "depends_on": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["id"] + list(RESPONSE_FIELDS)
+}
+
+PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "steps": {"type": "array", "items": PLAN_STEP_SCHEMA, "minItems": 1, "maxItems": MAX_PLAN_STEPS},
+        "explanation": {"type": "string"}
+    },
+    "required": ["steps"]
+}
+
+def validate_plan(data: Any) -> Optional[str]:
+    """Return what is wrong with a parsed plan (each step must also pass validate_response), or None"""
+    if not isinstance(data, dict) or not isinstance(data.get("steps"), list):
+        return "plan has no 'steps' list"
+    steps = data["steps"]
+    if not 1 <= len(steps) <= MAX_PLAN_STEPS:
+        return f"plan must have 1 to {MAX_PLAN_STEPS} steps"
+    
+    ids = set()
+    for step in steps:
+        problem = validate_response(step)
+        if problem:
+            return f"step {len(ids) + 1}: {problem}"
+        if not isinstance(step.get("id"), str) or not step["id"] or step["id"] in ids:
+            return f"step {len(ids) + 1}: missing or duplicate id"
+        step.setdefault("depends_on", [])
+        if not isinstance(step["depends_on"], list) or not all(isinstance(dep, str) for dep in step["depends_on"]):
+            return f"step {step['id']}: depends_on should be a list of step ids"
+        ids.add(step["id"])
+    
+    # Every dependency must exist and the graph must have no cycles (Kahn's algorithm)
+    remaining = {step["id"]: set(step["depends_on"]) for step in steps}
+    for step_id, deps in remaining.items():
+        unknown = deps - ids
+        if unknown:
+            return f"step {step_id}: depends on unknown step {sorted(unknown)[0]}"
+    while remaining:
+        ready = [step_id for step_id, deps in remaining.items() if not deps]
+        if not ready:
+            return "plan has a dependency cycle"
+        for step_id in ready:
+            del remaining[step_id]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return None
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Result Cache
+Opt-in in-memory cache of read-only command results, keyed by command and
+directory and dropped as soon as a path the command reads changes
+"""
+
+import ctypes
+import ctypes.util
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from command_analysis import read_paths
+
+# inotify event bits (linux/inotify.h)
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+# Fields of a command result worth replaying
+RESULT_FIELDS = ["success", "stdout", "stderr", "return_code", "truncated"]
+
+class InotifyWatcher:
+    def __init__(self, max_watches: int = 4096):
+        """Open an inotify instance through libc; raises OSError where inotify isn't available"""
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self.add_watch = libc.inotify_add_watch
+        self.add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.rm_watch = libc.inotify_rm_watch
+        self.rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        
+        # Watches count against the user-wide fs.inotify.max_user_watches that IDEs and other tools share
+        self.max_watches = max_watches
+        self.wds = {}  # path -> watch descriptor
+        self.active = set()  # Watch descriptors the kernel still holds
+        self.changed = {}  # watch descriptor -> sequence number of its last event
+        self.seq = 0
+        self.overflowed = 0  # Sequence number of the last lost-events overflow
+
+    def watch(self, path: str) -> Optional[int]:
+        """Watch a file or directory (once per path); None if it can't be watched"""
+        wd = self.wds.get(path)
+        if wd is None:
+            if len(self.active) >= self.max_watches:
+                return None
+            wd = self.add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                return None
+            self.wds[path] = wd
+            self.active.add(wd)
+        return wd
+
+    def unwatch(self, wds: Set[int]):
+        """Remove watches nothing needs any more"""
+        wds = wds & self.active
+        for wd in wds:
+            self.rm_watch(self.fd, wd)
+            self.changed.pop(wd, None)
+        self.active -= wds
+        self.wds = {path: wd for path, wd in self.wds.items() if wd not in wds}
+
+    def drain(self):
+        """Read every pending event without blocking and record which watches fired"""
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return
+            if not data:
+                return
+            
+            self.seq += 1
+            offset = 0
+            while offset + EVENT_HEADER.size <= len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size + length
+                if mask & IN_Q_OVERFLOW:
+                    self.overflowed = self.seq
+                    continue
+                if mask & IN_IGNORED:
+                    # The path is gone (or replaced, or unwatched); it needs a fresh watch next time
+                    self.active.discard(wd)
+                    self.changed.pop(wd, None)
+                    self.wds = {path: w for path, w in self.wds.items() if w != wd}
+                    continue
+                self.changed[wd] = self.seq
+
+    def changed_since(self, wds: Set[int], seq: int) -> bool:
+        """True if any of the watches fired after the given sequence number, or was removed since"""
+        return (self.overflowed > seq or not wds <= self.active or
+                any(self.changed.get(wd, 0) > seq for wd in wds))
+
+    def close(self):
+        """Release the inotify descriptor and all its watches"""
+        os.close(self.fd)
+
+def stat_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    """(mtime, size, inode) of a path, or None if it doesn't exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+class ResultCache:
+    def __init__(self, max_entries: int = 128, ttl: float = 600.0, max_paths: int = 20000,
+                 inotify: bool = True, max_watches: int = 4096):
+        """Use inotify to learn about changes when the kernel has it, otherwise compare stat() signatures"""
+        self.max_entries = max_entries
+        self.ttl = ttl  # Upper bound even when nothing is seen to change
+        self.max_paths = max_paths  # Commands reading more than this many paths aren't cached
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()  # snapshot() runs both on its own and inside lookup()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.uncacheable = 0
+        self.stat_fallbacks = 0
+        # Snapshots handed out but not stored yet keep their watches; bounded, since some are never stored
+        self.pending = deque(maxlen=16)
+        
+        self.watcher = None
+        if inotify:
+            try:
+                self.watcher = InotifyWatcher(max_watches)
+            except (OSError, AttributeError):
+                pass  # Not Linux, or out of inotify instances
+        self.mode = "inotify" if self.watcher else "stat"
+
+    def walk(self, path: str, recursive: bool, directories_only: bool) -> Optional[List[str]]:
+        """The path plus what's under it that a change could hide in; None when there is too much"""
+        paths = [path]
+        if not os.path.isdir(path):
+            return paths
+        pending = [path]
+        while pending:
+            try:
+                with os.scandir(pending.pop()) as it:
+                    for entry in it:
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        if is_dir and recursive:
+                            pending.append(entry.path)
+                        if is_dir and recursive or not directories_only:
+                            paths.append(entry.path)
+            except OSError:
+                continue
+            if len(paths) > self.max_paths:
+                return None
+            if not recursive:
+                break
+        return paths
+
+    def snapshot(self, command: str, cwd: str) -> Optional[Dict[str, Any]]:
+        """Record the state of everything the command reads, taken before it runs; None if it can't be cached"""
+        targets = read_paths(command, cwd)
+        if targets is None:
+            return None
+        
+        snapshot = {"key": (command, cwd), "taken": time.time()}
+        if self.watcher:
+            # A directory watch reports changes to the files directly inside it, so only directories
+            # need watches, plus directly named files and their parent (which sees them created or replaced)
+            wanted = []
+            for path, recursive in targets:
+                paths = self.walk(path, recursive, directories_only=True)
+                if paths is None:
+                    return None
+                parent = os.path.dirname(path) if not os.path.isdir(path) else None
+                wanted += [(watched, watched == parent) for watched in paths + ([parent] if parent else [])]
+            
+            with self.lock:
+                self.prune()
+                new = {watched for watched, _ in wanted if watched not in self.watcher.wds}
+                if len(self.watcher.active) + len(new) <= self.watcher.max_watches:
+                    wds = set()
+                    for watched, is_parent in wanted:
+                        wd = self.watcher.watch(watched)
+                        if wd is None and not is_parent and os.path.exists(watched):
+                            return None
+                        if wd is not None:
+                            wds.add(wd)
+                    self.watcher.drain()
+                    snapshot.update(wds=wds, seq=self.watcher.seq)
+                    self.pending.append(snapshot)
+                    return snapshot
+                # Out of watches; this command is checked with stat() instead
+                self.stat_fallbacks += 1
+        
+        signature = self.signature(targets)
+        if signature is None:
+            return None
+        snapshot.update(targets=targets, signature=signature)
+        return snapshot
+
+    def signature(self, targets: List[Tuple[str, bool]]) -> Optional[Dict[str, Any]]:
+        """stat() signatures of every path the command reads, including directory contents"""
+        signature = {}
+        for path, recursive in targets:
+            paths = self.walk(path, recursive, directories_only=False)
+            if paths is None:
+                return None
+            for p in paths:
+                signature[p] = stat_signature(p)
+        return signature
+
+    def is_current(self, snapshot: Dict[str, Any]) -> bool:
+        """True if nothing the snapshot covers has changed since it was taken"""
+        if time.time() - snapshot["taken"] > self.ttl:
+            return False
+        if "wds" in snapshot:
+            self.watcher.drain()
+            return not self.watcher.changed_since(snapshot["wds"], snapshot["seq"])
+        return self.signature(snapshot["targets"]) == snapshot["signature"]
+
+    def prune(self):
+        """Remove the watches no cached entry or pending snapshot uses any more"""
+        if not self.watcher:
+            return
+        used = set()
+        for snapshot in list(self.entries.values()) + list(self.pending):
+            used |= snapshot.get("wds", set())
+        self.watcher.unwatch(self.watcher.active - used)
+
+    def lookup(self, command: str, cwd: str) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Return (cached result, None) on a hit, else (None, snapshot to store the fresh result with)"""
+        key = (command, cwd)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if self.is_current(entry):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return {**entry["result"], "cached": True, "cached_at": entry["taken"]}, None
+                del self.entries[key]
+                self.invalidations += 1
+                self.prune()
+            
+            self.misses += 1
+            snapshot = self.snapshot(command, cwd)
+            if snapshot is None:
+                self.uncacheable += 1
+            return None, snapshot
+
+    def store(self, snapshot: Optional[Dict[str, Any]], result: Dict[str, Any]):
+        """Keep a successful result; a change while it ran shows up on the next lookup, since the snapshot predates it"""
+        if snapshot is None:
+            return
+        with self.lock:
+            if any(pending is snapshot for pending in self.pending):
+                self.pending.remove(snapshot)
+            if result.get("success"):
+                self.entries[snapshot["key"]] = {
+                    **snapshot,
+                    "result": {field: result[field] for field in RESULT_FIELDS if field in result}
+                }
+                self.entries.move_to_end(snapshot["key"])
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            self.prune()
+
+    def clear(self):
+        """Drop every cached result and the watches behind them"""
+        with self.lock:
+            self.entries.clear()
+            self.pending.clear()
+            self.prune()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for display"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "mode": self.mode,
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "uncacheable": self.uncacheable,
+                "watches": len(self.watcher.active) if self.watcher else 0,
+                "stat_fallbacks": self.stat_fallbacks,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
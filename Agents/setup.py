@@ -41,8 +41,8 @@ def install_ollama():
 def check_ollama_server():
     """Check if Ollama server is running"""
     try:
-        import requests
-        response = requests.get("http://localhost:11434/api/tags", timeout=5)
+        from ollama_client import OllamaClient
+        response = OllamaClient(max_retries=0).get("/api/tags", timeout=5)
         if response.status_code == 200:
             print("✅ Ollama server is running")
             return True
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Shell Session
+Runs commands in one long-lived bash coprocess so cd, exported variables and
+other shell state persist, with sentinel markers separating command output
+"""
+
+import codecs
+import os
+import secrets
+import selectors
+import shlex
+import signal
+import subprocess
+import time
+from typing import Dict, Any, Callable, List, Optional, Set, Tuple
+
+class OutputBuffer:
+    def __init__(self, limit: int = 64 * 1024):
+        """Keep the first and last limit/2 bytes of a stream, however much is written"""
+        self.head_limit = limit // 2
+        self.tail_limit = limit - self.head_limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def write(self, data: bytes):
+        """Append bytes, discarding the middle once both halves are full"""
+        self.total += len(data)
+        if len(self.head) < self.head_limit:
+            room = self.head_limit - len(self.head)
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            if len(self.tail) > self.tail_limit:
+                del self.tail[:len(self.tail) - self.tail_limit]
+
+    @property
+    def truncated(self) -> bool:
+        """Whether any bytes were dropped"""
+        return self.total > len(self.head) + len(self.tail)
+
+    def getvalue(self) -> str:
+        """Decode the kept bytes, marking where output was omitted"""
+        head = bytes(self.head).decode("utf-8", errors="replace")
+        if not self.truncated:
+            return head + bytes(self.tail).decode("utf-8", errors="replace")
+        omitted = self.total - len(self.head) - len(self.tail)
+        tail = bytes(self.tail).decode("utf-8", errors="replace")
+        return f"{head}\n... [{omitted} bytes omitted] ...\n{tail}"
+
+class MarkedStream:
+    def __init__(self, name: str, marker: bytes, limit: int,
+                 on_output: Optional[Callable[[str, str], None]] = None):
+        """Split one of the shell's pipes into command output and the end-of-command marker line"""
+        self.name = name
+        self.marker = marker
+        self.on_output = on_output
+        self.buffer = OutputBuffer(limit)
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.carry = bytearray()
+        self.trailer = b""
+        self.done = False
+
+    def feed(self, data: bytes):
+        """Consume a chunk read from the pipe"""
+        self.carry += data
+        index = self.carry.find(self.marker)
+        if index != -1:
+            line_end = self.carry.find(b"\n", index)
+            if line_end == -1:
+                return  # Wait for the rest of the marker line
+            # The shell prints a newline before the marker; it is not part of the output
+            self.emit(self.carry[:max(index - 1, 0)])
+            self.trailer = bytes(self.carry[index + len(self.marker):line_end])
+            self.carry.clear()
+            self.finish()
+            return
+        
+        # Hold back enough bytes to catch a marker split across reads
+        keep = len(self.marker) + 1
+        if len(self.carry) > keep:
+            self.emit(self.carry[:-keep])
+            del self.carry[:-keep]
+
+    def emit(self, data: bytes):
+        """Record output and pass it on, decoded incrementally, to the live callback"""
+        if not data:
+            return
+        self.buffer.write(data)
+        if self.on_output:
+            text = self.decoder.decode(bytes(data))
+            if text:
+                self.on_output(self.name, text)
+
+    def finish(self):
+        """Flush whatever is left once the command is over"""
+        if self.carry:
+            self.emit(self.carry)
+            self.carry.clear()
+        if self.on_output:
+            text = self.decoder.decode(b"", final=True)
+            if text:
+                self.on_output(self.name, text)
+        self.done = True
+
+class ShellSession:
+    def __init__(self, cwd: Optional[str] = None, shell: str = "bash", output_limit: int = 64 * 1024):
+        """Start a persistent shell in the given directory"""
+        self.shell = shell
+        self.cwd = cwd or os.getcwd()
+        self.output_limit = output_limit  # Bytes of each stream kept for the result
+        self.process = None
+        self.restarts = 0
+        self.command_count = 0
+        # interrupt() writes here to wake run() from another thread
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        os.set_blocking(self.wakeup_read, False)
+        os.set_blocking(self.wakeup_write, False)
+        self.start()
+
+    def start(self):
+        """Launch the shell coprocess"""
+        # Each session gets an unguessable marker so command output can't fake a boundary
+        self.marker = f"__TERMINAL_AGENT_{secrets.token_hex(8)}__".encode()
+        self.process = subprocess.Popen(
+            [self.shell, "--noprofile", "--norc"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=self.cwd,
+            start_new_session=True
+        )
+
+    def restart(self):
+        """Kill the shell and start a fresh one in the last known directory"""
+        self.close()
+        self.restarts += 1
+        if not os.path.isdir(self.cwd):
+            self.cwd = os.path.expanduser("~")
+        self.start()
+
+    def is_alive(self) -> bool:
+        """Check whether the shell coprocess is still running"""
+        return self.process is not None and self.process.poll() is None
+
+    def interrupt(self):
+        """Stop the running command like Ctrl-C in a terminal, escalating as on a timeout; safe from any thread"""
+        try:
+            os.write(self.wakeup_write, b"!")
+        except (BlockingIOError, OSError):
+            pass  # A wakeup is already pending
+
+    def drain_wakeups(self) -> bool:
+        """Consume pending interrupt() wakeups; True if there were any"""
+        woken = False
+        while True:
+            try:
+                if not os.read(self.wakeup_read, 64):
+                    return woken
+            except BlockingIOError:
+                return woken
+            woken = True
+
+    def run(self, command: str, timeout: float = 30,
+            on_output: Optional[Callable[[str, str], None]] = None) -> Dict[str, Any]:
+        """Run a command in the shell, streaming its output until the end-of-command markers"""
+        if not self.is_alive():
+            self.restart()
+        
+        self.command_count += 1
+        marker = self.marker + str(self.command_count).encode() + b":"
+        
+        # eval keeps syntax errors inside the command; stdin is detached so the command can't eat the protocol
+        script = (
+            f"eval {shlex.quote(command)} < /dev/null\n"
+            f"__ta_rc=$?; printf '\\n%s %d %s\\n' '{marker.decode()}' \"$__ta_rc\" \"$PWD\"; "
+            f"printf '\\n%s\\n' '{marker.decode()}' >&2\n"
+        )
+        
+        stdout = MarkedStream("stdout", marker, self.output_limit, on_output)
+        stderr = MarkedStream("stderr", marker, self.output_limit, on_output)
+        self.drain_wakeups()  # An interrupt from before this command started is stale
+        try:
+            self.process.stdin.write(script.encode())
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self.restart()
+            stderr.emit(b"Shell was not running; restarted it")
+            return self._result(False, stdout, stderr, -1)
+        
+        return_code = -1
+        stopped = None  # "timeout" or "interrupt" once the job is being stopped
+        
+        selector = selectors.DefaultSelector()
+        selector.register(self.process.stdout, selectors.EVENT_READ, stdout)
+        selector.register(self.process.stderr, selectors.EVENT_READ, stderr)
+        selector.register(self.wakeup_read, selectors.EVENT_READ, None)
+        
+        # Escalate on timeout or interrupt: SIGINT the job, then SIGKILL it, then replace the shell
+        deadline = time.monotonic() + timeout
+        escalation = [signal.SIGINT, signal.SIGKILL, None]
+        try:
+            while not (stdout.done and stderr.done):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    stopped = stopped or "timeout"
+                    sig = escalation.pop(0)
+                    if sig is None:
+                        self.restart()
+                        break
+                    self.signal_job(sig)
+                    deadline = time.monotonic() + 1.0
+                    continue
+                
+                for key, _ in selector.select(remaining):
+                    stream = key.data
+                    if stream is None:
+                        # interrupt(): start the escalation now, unless it is already under way
+                        if self.drain_wakeups() and stopped is None:
+                            stopped = "interrupt"
+                            deadline = time.monotonic()
+                        continue
+                    if stream.done:
+                        selector.unregister(key.fileobj)
+                        continue
+                    data = os.read(key.fileobj.fileno(), 65536)
+                    if not data:
+                        # EOF: the shell exited (e.g. the command ran `exit`)
+                        stdout.finish()
+                        stderr.finish()
+                        return_code = self.process.wait()
+                        break
+                    stream.feed(data)
+        finally:
+            selector.close()
+        
+        stdout.finish()
+        stderr.finish()
+        
+        if stdout.trailer:
+            rc, _, pwd = stdout.trailer.strip().partition(b" ")
+            return_code = int(rc)
+            self.cwd = pwd.decode(errors="replace") or self.cwd
+        
+        separator = "\n" if stderr.buffer.total else ""
+        if stopped == "timeout":
+            stderr.emit(f"{separator}Command timed out after {timeout:g} seconds".encode())
+            return self._result(False, stdout, stderr, -1)
+        if stopped == "interrupt":
+            # The job usually exits on SIGINT and the shell reports its status (130) as usual
+            stderr.emit(f"{separator}Interrupted".encode())
+            if not self.is_alive():
+                self.restart()
+            return self._result(False, stdout, stderr, return_code)
+        
+        if not self.is_alive():
+            self.restart()
+        
+        return self._result(return_code == 0, stdout, stderr, return_code)
+
+    def _result(self, success: bool, stdout: MarkedStream, stderr: MarkedStream, return_code: int) -> Dict[str, Any]:
+        """Build the result dict execute_command returns"""
+        return {
+            "success": success,
+            "stdout": stdout.buffer.getvalue(),
+            "stderr": stderr.buffer.getvalue(),
+            "return_code": return_code,
+            "truncated": stdout.buffer.truncated or stderr.buffer.truncated
+        }
+
+    def environment(self) -> Optional[Tuple[Dict[str, str], Set[str]]]:
+        """The shell's exported variables and the names of its aliases and functions; None if they can't be read"""
+        # env -0 never prints an empty entry, so the first empty one separates the two parts
+        result = self.run("env -0; printf '\\0'; compgen -a -A function", timeout=5)
+        if not result['success'] or result.get('truncated'):
+            return None
+        exported, _, names = result['stdout'].partition("\0\0")
+        variables = dict(entry.split("=", 1) for entry in exported.split("\0") if "=" in entry)
+        return variables, set(names.split())
+
+    def job_pids(self) -> List[int]:
+        """List every process started by the shell for the running command"""
+        pids = []
+        pending = [self.process.pid]
+        while pending:
+            parent = pending.pop()
+            try:
+                with open(f"/proc/{parent}/task/{parent}/children") as f:
+                    children = [int(pid) for pid in f.read().split()]
+            except OSError:
+                # No /proc (macOS): ask pgrep instead
+                result = subprocess.run(['pgrep', '-P', str(parent)], capture_output=True, text=True)
+                children = [int(pid) for pid in result.stdout.split()]
+            pids.extend(children)
+            pending.extend(children)
+        return pids
+
+    def signal_job(self, sig: int):
+        """Signal the running command without touching the shell itself"""
+        for pid in self.job_pids():
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def close(self):
+        """Terminate the shell and everything it started"""
+        if self.process is None:
+            return
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout, self.process.stderr):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        self.process = None
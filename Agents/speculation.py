@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Speculation
+Starts a strictly read-only command in a sandboxed subprocess while the user
+is still deciding whether to run it; the buffered result is used on "y"
+"""
+
+import os
+import selectors
+import shlex
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from typing import Dict, Any, Collection, List, Optional
+
+from command_analysis import is_read_only, segments
+from shell_session import OutputBuffer
+
+def can_speculate(command: str, shadowed: Collection[str] = ()) -> bool:
+    """Only allowlisted read-only commands, none that expand shell variables, and none whose program is one
+    of the session's aliases or functions; the sandbox gets exported variables only"""
+    if not is_read_only(command) or "$" in command:
+        return False
+    return not any(shlex.split(segment)[0] in shadowed for segment in segments(command))
+
+def sandboxed(command: str, cpu_seconds: int) -> List[str]:
+    """argv for a low-priority bash that can't grow files (ulimit -f 0) and has bounded CPU time"""
+    # ulimit doesn't stop opening with O_TRUNC or calls like sethostname; the argument checks in can_speculate do
+    script = f"ulimit -f 0 -t {cpu_seconds}; eval {shlex.quote(command)}"
+    argv = ["bash", "--noprofile", "--norc", "-c", script]
+    return ["nice", "-n", "10"] + argv if shutil.which("nice") else argv
+
+class Speculation:
+    def __init__(self, command: str, cwd: str, timeout: float = 30, output_limit: int = 64 * 1024,
+                 snapshot: Optional[Dict[str, Any]] = None, env: Optional[Dict[str, str]] = None):
+        """Start the command right away and collect its output on a background thread"""
+        self.command = command
+        self.timeout = timeout
+        self.snapshot = snapshot  # Result cache snapshot taken at start, to tell if the output went stale
+        self.stdout = OutputBuffer(output_limit)
+        self.stderr = OutputBuffer(output_limit)
+        self.return_code = None
+        self.started = time.perf_counter()
+        self.finished = None
+        
+        self.process = subprocess.Popen(
+            sandboxed(command, int(timeout) + 1),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=cwd,
+            env=env,  # The session's exported variables, so LC_ALL, TZ or PATH match the confirmed run
+            start_new_session=True
+        )
+        self.thread = threading.Thread(target=self.collect, daemon=True)
+        self.thread.start()
+
+    def collect(self):
+        """Buffer both pipes until the command exits"""
+        selector = selectors.DefaultSelector()
+        selector.register(self.process.stdout, selectors.EVENT_READ, self.stdout)
+        selector.register(self.process.stderr, selectors.EVENT_READ, self.stderr)
+        open_streams = 2
+        try:
+            while open_streams:
+                for key, _ in selector.select():
+                    data = os.read(key.fileobj.fileno(), 65536)
+                    if not data:
+                        selector.unregister(key.fileobj)
+                        open_streams -= 1
+                        continue
+                    key.data.write(data)
+        finally:
+            selector.close()
+        self.return_code = self.process.wait()
+        self.finished = time.perf_counter()
+
+    def result(self) -> Optional[Dict[str, Any]]:
+        """Wait for the command (up to its timeout) and return its result, or None if it has to be rerun"""
+        asked = time.perf_counter()
+        self.thread.join(max(self.started + self.timeout - asked, 0))
+        if self.thread.is_alive() or self.return_code is None or self.return_code < 0:
+            # Timed out or killed (e.g. by the CPU limit): let the real run report it
+            self.cancel()
+            return None
+        
+        return {
+            "success": self.return_code == 0,
+            "stdout": self.stdout.getvalue(),
+            "stderr": self.stderr.getvalue(),
+            "return_code": self.return_code,
+            "truncated": self.stdout.truncated or self.stderr.truncated,
+            "speculated": True,
+            # The part of the run that overlapped the confirmation prompt
+            "saved": min(self.finished, asked) - self.started
+        }
+
+    def cancel(self):
+        """Kill the command and everything it started; its output is discarded"""
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        self.thread.join(1)
+        for stream in (self.process.stdout, self.process.stderr):
+            try:
+                stream.close()
+            except OSError:
+                pass
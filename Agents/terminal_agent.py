@@ -4,55 +4,186 @@ AI Terminal Agent
 Converts natural language to terminal commands using Ollama's Llama 3.2
 """
 
+import asyncio
 import os
-import subprocess
+import re
+import hashlib
+import shutil
+import signal
 import sys
 import json
+import threading
+import time
 import requests
-from typing import List, Dict, Any
+from async_engine import INTERRUPTED, LineReader, StageCancelled, StageRunner, trap_interrupts
+from ollama_client import OllamaClient, abort_response
+from backend_pool import create_client
+from response_cache import ResponseCache
+from result_cache import ResultCache
+from shell_session import ShellSession
+from speculation import Speculation, can_speculate
+from intents import IntentEngine
+from history_index import HistoryIndex, estimate_tokens
+from history_store import open_history_store
+from dir_index import DirectoryIndex
+from prompt_builder import PROMPT_TOKEN_BUDGET, RECENT_EXCHANGES, SECTION_QUOTAS, PromptBuilder, RollingSummary, excerpt
+from model_probe import ModelWarmer, load_models, forget_models
+from model_cascade import CONFIDENCE_THRESHOLD, configured_cascade, resolve_cascade, escalation_reason
+from metrics import Metrics
+from response_schema import PLAN_SCHEMA, RESPONSE_SCHEMA, validate_plan, validate_response, repair_response
+from plan_runner import PlanRunner, plan_order, run_step
+from typing import List, Dict, Any, Callable, Optional, Tuple
 from pathlib import Path
 
+FALLBACK_WARNING = "Response format was unexpected, using fallback parsing"
+SCHEMA_WARNING = "The model's reply did not match the response schema"
+
+# How much history a full prompt may carry, and how many relevant exchanges to look for
+HISTORY_TOKEN_BUDGET = 600
+HISTORY_TOP_K = 5
+
+# Older exchanges in the prompt get only a line or two of their output; the latest one gets the output quota
+OLDER_OUTPUT_TOKENS = 30
+
+# Appended to the prompt when the first reply could not be used
+RETRY_NOTE = "\nYour previous reply was not a valid JSON object with command, explanation, is_safe and warning. Reply with only that JSON object."
+
+PLAN_NOTE = """
+This request has several parts. Reply with a JSON object {"steps": [...], "explanation": "..."}. Each step has
+"id", "command", "explanation", "is_safe", "warning" and "depends_on" (the ids of steps it needs to finish first).
+Steps without dependencies between them run at the same time, each in its own shell in the current working
+directory, so don't use cd and only declare a dependency when a step really needs another one's effect."""
+
+def extract_json_string_field(text: str, field: str) -> Optional[str]:
+    """Return a string field from partial JSON text once its closing quote has arrived"""
+    match = re.search(r'"%s"\s*:\s*"' % re.escape(field), text)
+    if not match:
+        return None
+    
+    start = match.end() - 1
+    i = match.end()
+    while i < len(text):
+        if text[i] == '\\':
+            i += 2
+            continue
+        if text[i] == '"':
+            try:
+                return json.loads(text[start:i + 1])
+            except json.JSONDecodeError:
+                return None
+        i += 1
+    return None
+
 class TerminalAgent:
-    def __init__(self):
+    def __init__(self, stream: bool = True, session: bool = True, client: Optional[OllamaClient] = None,
+                 cache: bool = True, intents: bool = True, structured: bool = True,
+                 cwd: Optional[str] = None, probe: bool = True, shell: bool = True, retrieval: bool = True,
+                 history: bool = True, result_cache: Optional[bool] = None, speculate: bool = True,
+                 summarize: bool = True, index_cwd: bool = True):
         """Initialize the terminal agent with Ollama"""
-        self.ollama_url = "http://localhost:11434"
+        # Pooled client shared by every request so connections and the loaded model are reused;
+        # OLLAMA_HOSTS spreads requests over several servers instead
+        self.client = client or create_client()
+        self.ollama_url = self.client.base_url
+        
+        # Models tried in order, smallest first; a reply only goes up a tier when it isn't good enough
+        self.models = configured_cascade()
+        self.model = self.models[-1]
+        self.confidence_threshold = CONFIDENCE_THRESHOLD
+        
+        # Stream tokens from Ollama so the command can be shown before the explanation is done
+        self.stream = stream
+        
+        # Constrain replies to the response JSON schema instead of scraping free text
+        self.structured = structured
+        
+        # Session mode keeps Ollama's KV context between turns and only sends the new turn
+        self.session = session
+        self.ollama_context = None
+        self.context_model = None
+        self.context_command = None  # What the model's reply in that context proposed
+        self.pending_results = []  # (exchange, generated) pairs the context hasn't seen the outcome of
+        self.max_context_tokens = 3000  # Rebuild the prompt before the context window fills up
+        
+        # Cache generated commands for repeated requests
+        self.response_cache = ResponseCache() if cache else None
+        
+        # Opt-in: read-only commands are answered from their last run until something they read changes
+        if result_cache is None:
+            result_cache = os.environ.get("TERMINAL_AGENT_RESULT_CACHE", "").lower() in ("1", "true", "yes", "on")
+        self.result_cache = ResultCache() if result_cache else None
+        
+        # Common requests resolve to fixed commands without asking the model
+        self.intents = IntentEngine() if intents else None
+        
+        # Per-stage latency timers; set the env vars to trace turns or export Prometheus text
+        self.metrics = Metrics(
+            trace_path=os.environ.get("TERMINAL_AGENT_TRACE"),
+            prometheus_path=os.environ.get("TERMINAL_AGENT_METRICS")
+        )
         
         # Initialize conversation history
         self.conversation_history = []
         self.max_history_length = 10  # Keep last 10 exchanges
         
+        # Every executed exchange is also kept on disk for `history search` and `!<id>` recall
+        self.history_store = open_history_store() if history else None
+        
+        # Every exchange is also embedded into a persistent index so relevant older turns can be recalled
+        self.history_index = HistoryIndex(self.client) if retrieval else None
+        self.history_token_budget = HISTORY_TOKEN_BUDGET
+        
+        # Full prompts are fitted to a fixed token budget; exchanges that leave the verbatim window
+        # are folded into a summary by the smallest model between turns
+        self.prompt_budget = PROMPT_TOKEN_BUDGET
+        self.summary = RollingSummary(self.client, self.models[0]) if summarize else None
+        
         # Track current working directory
-        self.current_working_dir = os.getcwd()
+        self.current_working_dir = cwd or os.getcwd()
         
-        # Test Ollama connection
-        try:
-            response = requests.get(f"{self.ollama_url}/api/tags")
-            if response.status_code == 200:
-                print("✅ Successfully connected to Ollama")
-            else:
-                raise Exception(f"Ollama server returned status {response.status_code}")
-        except requests.exceptions.ConnectionError:
-            raise Exception("Could not connect to Ollama. Make sure Ollama is running on localhost:11434")
-        except Exception as e:
-            raise Exception(f"Error connecting to Ollama: {str(e)}")
+        # Real file names from the working directory go into the prompt so the model doesn't have to guess
+        self.dir_index = DirectoryIndex() if index_cwd else None
         
-        # Check if llama3.2 model is available
-        try:
-            response = requests.get(f"{self.ollama_url}/api/tags")
-            models = response.json().get("models", [])
-            model_names = [model.get("name", "") for model in models]
+        # One persistent shell per agent keeps cd, cd -, exports and aliases between commands
+        self.shell = ShellSession(self.current_working_dir) if shell and shutil.which("bash") else None
+        
+        # Read-only commands start in a sandbox while the confirmation prompt is up
+        self.speculative = speculate
+        
+        # What the current stage has in flight, so Ctrl-C can stop it from the event loop
+        self.cancelled = threading.Event()
+        self.active_response = None
+        self.active_processes = set()
+        self.reader = None  # Set up by repl(), along with the stage runner
+        self.stages = None
+        
+        # Background model loading; the first request to a model waits for it only if it is still running
+        self.warmer = None
+        
+        # Skipped when a long-lived process (e.g. the daemon) has already probed Ollama
+        if probe:
+            # One /api/tags call at most; a recent model list on disk skips even that
+            try:
+                models, from_cache = load_models(self.client)
+                if not from_cache:
+                    print("✅ Successfully connected to Ollama")
+            except requests.exceptions.ConnectionError:
+                raise Exception(f"Could not connect to Ollama. Make sure Ollama is running on {self.ollama_url}")
+            except Exception as e:
+                raise Exception(f"Error connecting to Ollama: {str(e)}")
+            
+            # Build the cascade from whatever models are installed
+            try:
+                self.use_available_models(models)
+            except Exception as e:
+                raise Exception(f"Error checking models: {str(e)}")
             
-            if "llama3.2:latest" in model_names:
-                print("✅ Llama 3.2 model found")
+            if len(self.models) > 1:
+                print(f"✅ Model cascade: {' → '.join(self.models)}")
             else:
-                print("⚠️  Llama 3.2 model not found. Available models:")
-                for model in models:
-                    print(f"  - {model.get('name', 'Unknown')}")
-                print("\nTo install Llama 3.2, run: ollama pull llama3.2")
-                raise Exception("Llama 3.2 model not available")
-                
-        except Exception as e:
-            raise Exception(f"Error checking models: {str(e)}")
+                print(f"✅ Using model {self.model}")
+            
+            self.warmer = ModelWarmer(self.client, self.models)
         
         # Define system prompt for safe command generation
         self.system_prompt = """
@@ -68,6 +199,7 @@ IMPORTANT SAFETY RULES:
 - NEVER generate commands like 'rm -rf /', 'format', 'dd', or any destructive operations
 - NEVER generate commands that could harm the system
 - ONLY generate commands for file operations, system info, and safe utilities
+- Use the FILES listing for real file and directory names instead of guessing them
 - If unsure about safety, ask for clarification
 
 Respond with a JSON object containing:
@@ -75,112 +207,382 @@ Respond with a JSON object containing:
     "command": "the terminal command to run",
     "explanation": "what this command does",
     "is_safe": true/false,
-    "warning": "any safety warnings (if applicable)"
+    "warning": "any safety warnings (if applicable)",
+    "confidence": 0.0-1.0 (how sure you are that the command does what was asked)
 }
 """
 
     def add_to_history(self, user_input: str, ai_response: Dict[str, Any], command_result: Dict[str, Any]):
         """Add an exchange to the conversation history"""
+        now = time.time()
         exchange = {
             "user_input": user_input,
             "ai_response": ai_response,
             "command_result": command_result,
-            "timestamp": subprocess.run(['date'], capture_output=True, text=True).stdout.strip()
+            "timestamp": time.strftime("%a %b %d %H:%M:%S %Z %Y", time.localtime(now)),
+            "ts": now
         }
         
         self.conversation_history.append(exchange)
         
+        # Both stores write in the background; nothing here waits on disk or the network
+        if self.history_store:
+            self.history_store.add(user_input, ai_response.get('command', 'N/A'), ai_response.get('explanation', ''),
+                                   bool(command_result.get('success')), command_result.get('return_code'),
+                                   command_result.get('stdout') or command_result.get('stderr') or '',
+                                   self.current_working_dir, now)
+        if self.history_index is not None:
+            self.history_index.add(user_input, ai_response.get('command', 'N/A'), bool(command_result.get('success')),
+                                   command_result.get('stdout') or '', self.current_working_dir, exchange['ts'])
+        
+        # The oldest verbatim exchange just dropped out of the prompt; summarize it in the background
+        if self.summary and len(self.conversation_history) > RECENT_EXCHANGES:
+            self.summary.add(self.conversation_history[-RECENT_EXCHANGES - 1])
+        
+        # The model has not seen this result yet; report it on the next session turn. Its context only holds
+        # the command if the model generated it there, not one from an intent, the cache or a recall
+        generated = (self.context_command is not None and ai_response.get('command') == self.context_command
+                     and not ai_response.get('intent') and not ai_response.get('cached'))
+        self.context_command = None
+        self.pending_results.append((exchange, generated))
+        if len(self.pending_results) > RECENT_EXCHANGES:
+            # Cheaper to rebuild the full prompt, which holds all of them, than to replay each one
+            self.reset_session()
+        
         # Keep only the last max_history_length exchanges
         if len(self.conversation_history) > self.max_history_length:
             self.conversation_history = self.conversation_history[-self.max_history_length:]
 
-    def build_context_prompt(self, user_input: str) -> str:
-        """Build a prompt that includes conversation history for context"""
+    def gather_grounding(self, user_input: str, listing: Optional[str] = None) -> Dict[str, Any]:
+        """Retrieve what a prompt is grounded in once per request, so every cascade tier and retry reuses it"""
+        return {
+            "history": self.select_history(user_input),
+            "listing": self.directory_listing(user_input) if listing is None else listing,
+            "turn_listing": self.directory_listing(user_input, max_lines=10, matches_only=True,
+                                                   refresh=False) if self.session else "",
+            # The summary updates in the background; every tier should see the same one
+            "summary": self.summary.current() if self.summary else ""
+        }
+
+    def build_context_prompt(self, user_input: str, grounding: Optional[Dict[str, Any]] = None) -> str:
+        """Build a prompt that includes conversation history for context, fitted to the token budget"""
+        grounding = grounding or self.gather_grounding(user_input)
+        request_parts = [f"\n\nCurrent User Request: {user_input}", "\nGenerate a safe terminal command:"]
+        builder = PromptBuilder([self.system_prompt] + request_parts, self.prompt_budget)
         context_parts = [self.system_prompt]
         
-        # Add current working directory context
-        context_parts.append(f"\nCURRENT WORKING DIRECTORY: {self.current_working_dir}")
+        # Add current working directory context, with the files most relevant to the request
+        context_lines = [f"\nCURRENT WORKING DIRECTORY: {self.current_working_dir}"]
+        if grounding["listing"]:
+            context_lines += ["FILES (most relevant first):"] + grounding["listing"].splitlines()
+        context_parts.append("\n".join(builder.fit_blocks("context", context_lines)))
+        
+        # The latest output is what the next command most often builds on, so it gets its own quota
+        history = grounding["history"]
+        latest_output = builder.fit("output", history[-1]['output'].strip() if history else "")
+        
+        summary = builder.fit("summary", grounding["summary"])
+        if summary:
+            context_parts.append(f"\n\nEARLIER IN THIS SESSION (summary):\n{summary}")
         
-        if self.conversation_history:
+        # Newest first, so the oldest exchanges are the ones left out when the budget runs short
+        blocks, costs = [], []
+        for i, entry in enumerate(reversed(history)):
+            lines = [f"User: {entry['user_input']}", f"AI Command: {entry['command']}",
+                     f"Result: {'Success' if entry['success'] else 'Failed'}"]
+            costs.append(estimate_tokens("\n".join(lines)))
+            output = latest_output if i == 0 else excerpt(entry['output'].strip(), OLDER_OUTPUT_TOKENS)
+            if output:
+                lines.append(f"Output: {output}")
+                if i > 0:
+                    costs[-1] += estimate_tokens(output)
+            blocks.append("\n".join(lines))
+        kept = builder.fit_blocks("history", blocks, costs)
+        if kept:
             context_parts.append("\n\nCONVERSATION HISTORY:")
-            for i, exchange in enumerate(self.conversation_history[-3:], 1):  # Last 3 exchanges
+            for i, block in enumerate(reversed(kept), 1):
                 context_parts.append(f"\n--- Exchange {i} ---")
-                context_parts.append(f"User: {exchange['user_input']}")
-                context_parts.append(f"AI Command: {exchange['ai_response'].get('command', 'N/A')}")
-                context_parts.append(f"Result: {'Success' if exchange['command_result'].get('success') else 'Failed'}")
-                if exchange['command_result'].get('stdout'):
-                    context_parts.append(f"Output: {exchange['command_result']['stdout'][:100]}...")
-        
-        context_parts.append(f"\n\nCurrent User Request: {user_input}")
-        context_parts.append("\nGenerate a safe terminal command:")
+                context_parts.append(block)
         
+        context_parts.extend(request_parts)
+        self.metrics.note("prompt_tokens", builder.used)
         return "\n".join(context_parts)
 
-    def generate_command(self, user_input: str) -> Dict[str, Any]:
-        """Generate terminal command from natural language input using Ollama with history"""
+    def select_history(self, user_input: str) -> List[Dict[str, Any]]:
+        """Pick the exchanges for the prompt: the latest one plus the most relevant earlier ones, within the token budget"""
+        recent = [
+            {
+                "user_input": exchange['user_input'],
+                "command": exchange['ai_response'].get('command', 'N/A'),
+                "success": bool(exchange['command_result'].get('success')),
+                "output": exchange['command_result'].get('stdout') or '',
+                "ts": exchange['ts']
+            }
+            for exchange in self.conversation_history[-RECENT_EXCHANGES:]
+        ]
+        if self.history_index is None or not len(self.history_index):
+            return recent
+        
+        with self.metrics.time("history_search"):
+            found = self.history_index.search(user_input, k=HISTORY_TOP_K)
+        if not found:
+            return recent
+        
+        selected, seen, used = [], set(), 0
+        for entry in recent[-1:] + [entry for _, entry in found]:
+            key = (entry['user_input'], entry['command'], entry['ts'])
+            cost = estimate_tokens(f"{entry['user_input']} {entry['command']} {entry['output'][:100]}") + 10
+            if key in seen or used + cost > self.history_token_budget:
+                continue
+            seen.add(key)
+            selected.append(entry)
+            used += cost
+        
+        # Oldest first, like a transcript
+        return sorted(selected, key=lambda entry: entry['ts'])
+
+    def history_fingerprint(self, listing: str = "") -> str:
+        """Hash the recent history and the names in the file listing; sizes and the summary change too often"""
+        digest = hashlib.sha256()
+        for exchange in self.conversation_history[-RECENT_EXCHANGES:]:
+            digest.update(json.dumps([
+                exchange['user_input'],
+                exchange['ai_response'].get('command', 'N/A'),
+                bool(exchange['command_result'].get('success')),
+                (exchange['command_result'].get('stdout') or '')[:100]
+            ]).encode("utf-8"))
+        # Files are listed as "name (size)" and directories as "name/"
+        names = [line if line.endswith("/") else line.rsplit(" (", 1)[0] for line in listing.splitlines()]
+        digest.update(json.dumps(names).encode("utf-8"))
+        return digest.hexdigest()
+
+    def build_turn_prompt(self, user_input: str, grounding: Optional[Dict[str, Any]] = None) -> str:
+        """Build only the new turn for a session that already holds the earlier prompt in its context"""
+        turn_parts = []
+        
+        for i, (exchange, generated) in enumerate(self.pending_results):
+            result = exchange['command_result']
+            status = 'Success' if result.get('success') else 'Failed'
+            if generated:
+                turn_parts.append(f"Result of the previous command: {status}")
+            else:
+                turn_parts += [f"User: {exchange['user_input']}",
+                               f"Command run (not generated by you): {exchange['ai_response'].get('command', 'N/A')}",
+                               f"Result: {status}"]
+            if result.get('stdout'):
+                # The latest output gets the full quota, like in a full prompt
+                latest = i == len(self.pending_results) - 1
+                quota = int(self.prompt_budget * SECTION_QUOTAS['output']) if latest else OLDER_OUTPUT_TOKENS
+                turn_parts.append(f"Output: {excerpt(result['stdout'].strip(), quota)}")
+        
+        turn_parts.append(f"CURRENT WORKING DIRECTORY: {self.current_working_dir}")
+        listing = grounding["turn_listing"] if grounding else self.directory_listing(user_input, max_lines=10,
+                                                                                     matches_only=True)
+        if listing:
+            turn_parts.append(f"FILES matching the request:\n{listing}")
+        turn_parts.append(f"\nCurrent User Request: {user_input}")
+        turn_parts.append("\nGenerate a safe terminal command as a JSON object:")
+        
+        return "\n".join(turn_parts)
+
+    def directory_listing(self, user_input: str, max_lines: int = 40, matches_only: bool = False,
+                          refresh: bool = True) -> str:
+        """Relevance-ranked excerpt of the working directory tree, rescanning only directories that changed"""
+        if not self.dir_index:
+            return ""
+        with self.metrics.time("dir_index"):
+            if refresh:
+                self.dir_index.refresh(self.current_working_dir)
+            return self.dir_index.excerpt(user_input, max_lines=max_lines, matches_only=matches_only)
+
+    def reset_session(self):
+        """Drop the cached Ollama context so the next turn rebuilds the full prompt"""
+        self.ollama_context = None
+        self.context_model = None
+        self.context_command = None
+        self.pending_results = []
+
+    def set_model(self, model: str):
+        """Use a single model instead of the cascade; the KV context of the old model is useless to the new one"""
+        if self.models != [model]:
+            self.models = [model]
+            self.model = model
+            self.reset_session()
+            if self.summary:
+                self.summary.model = model
+            if self.warmer:
+                self.warmer = ModelWarmer(self.client, [model])
+
+    def use_available_models(self, models: List[Dict[str, Any]]):
+        """Narrow the configured cascade to the models /api/tags reports"""
+        cascade = resolve_cascade(self.models, models)
+        if not cascade:
+            raise Exception("No models installed. To install Llama 3.2, run: ollama pull llama3.2")
+        if cascade != self.models:
+            self.models = cascade
+            self.model = cascade[-1]
+            self.reset_session()
+            if self.summary:
+                self.summary.model = cascade[0]
+
+    def generation_failed(self, response):
+        """Raise for a failed generate response, closing it and dropping a model list that has gone stale"""
+        response.close()
+        if response.status_code == 404:
+            forget_models()
+        raise Exception(f"Ollama API returned status {response.status_code}")
+
+    def stream_generate(self, payload: Dict[str, Any], on_command: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Read Ollama's NDJSON token stream, reporting the command as soon as it is complete"""
+        started = time.perf_counter()
+        response = self.client.post(
+            "/api/generate",
+            json={**payload, "stream": True},
+            stream=True,
+            timeout=60
+        )
+        self.metrics.record("request_send", time.perf_counter() - started)
+        
+        # Ctrl-C before the headers arrived can't cut the request short, but closing now still stops the generation
+        self.active_response = response
+        if self.cancelled.is_set():
+            self.active_response = None
+            response.close()
+            raise StageCancelled()
+        
+        if response.status_code != 200:
+            self.active_response = None
+            self.generation_failed(response)
+        
+        text = ""
+        final_chunk = {}
+        first_token_at = None
+        command_reported = on_command is None
         try:
-            # Build prompt with conversation history
-            prompt = self.build_context_prompt(user_input)
-            
-            # Call Ollama API
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json={
-                    "model": "llama3.2",
-                    "prompt": prompt,
-                    "stream": False
-                },
-                timeout=60
-            )
-            
-            if response.status_code != 200:
-                raise Exception(f"Ollama API returned status {response.status_code}")
-            
-            response_data = response.json()
-            ai_response = response_data.get("response", "")
-            
-            # Try to parse JSON response
-            try:
-                # Clean up the response to extract JSON
-                ai_response = ai_response.strip()
-                if ai_response.startswith("```json"):
-                    ai_response = ai_response[7:]
-                if ai_response.endswith("```"):
-                    ai_response = ai_response[:-3]
+            for line in response.iter_lines():
+                if not line:
+                    continue
                 
-                result = json.loads(ai_response)
-                return result
-            except json.JSONDecodeError:
-                # If JSON parsing fails, try to extract command from text
-                lines = ai_response.split('\n')
-                command = None
-                explanation = "AI response could not be parsed as JSON"
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise Exception(f"Ollama error: {chunk['error']}")
                 
-                for line in lines:
-                    if line.strip().startswith('"command"') or line.strip().startswith('command'):
-                        # Try to extract command from the line
-                        if ':' in line:
-                            command_part = line.split(':', 1)[1].strip().strip('"').strip(',')
-                            if command_part:
-                                command = command_part
-                                break
+                if first_token_at is None and chunk.get("response"):
+                    first_token_at = time.perf_counter()
+                    self.metrics.record("time_to_first_token", first_token_at - started)
+                text += chunk.get("response", "")
                 
-                if not command:
-                    # Fallback: try to find any command-like text
-                    for line in lines:
-                        if any(cmd in line.lower() for cmd in ['ls', 'pwd', 'echo', 'cat', 'find', 'grep']):
-                            command = line.strip()
-                            break
+                # Hand the command over while the explanation is still being generated
+                if not command_reported:
+                    command = extract_json_string_field(text, "command")
+                    if command is not None:
+                        command_reported = True
+                        on_command(command)
                 
-                if not command:
-                    command = "echo 'Could not parse AI response'"
+                if chunk.get("done"):
+                    final_chunk = chunk
+                    break
+        except Exception:
+            # cancel_stage() cut the stream off; Ollama sees the disconnect and stops generating
+            if self.cancelled.is_set():
+                raise StageCancelled()
+            raise
+        finally:
+            self.active_response = None
+            response.close()
+        if self.cancelled.is_set() and not final_chunk:
+            raise StageCancelled()
+        
+        if first_token_at is not None:
+            self.metrics.record("generation", time.perf_counter() - first_token_at)
+        
+        return {**final_chunk, "response": text}
+
+    def request_generation(self, payload: Dict[str, Any], on_command: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Send a generate request, streamed or blocking, and return Ollama's final response data"""
+        if self.stream:
+            return self.stream_generate(payload, on_command)
+        
+        # Call Ollama API; without streaming there is no separate first-token time
+        with self.metrics.time("generation"):
+            response = self.client.post(
+                "/api/generate",
+                json={**payload, "stream": False},
+                timeout=60
+            )
+        
+        # Without a stream there is nothing to cut off early; the reply is dropped once it arrives
+        if self.cancelled.is_set():
+            response.close()
+            raise StageCancelled()
+        
+        if response.status_code != 200:
+            self.generation_failed(response)
+        
+        return response.json()
+
+    def generate_command(self, user_input: str, on_command: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Generate terminal command from natural language input using Ollama with history"""
+        if self.intents:
+            matched = self.intents.match(user_input)
+            if matched:
+                self.metrics.note("source", "intent")
+                return matched
+        
+        # The key uses only the cheap parts of the prompt, so a hit never waits on the embedding search
+        listing = self.directory_listing(user_input)
+        cache_key = None
+        if self.response_cache:
+            cache_key = self.response_cache.make_key(
+                user_input, self.current_working_dir, self.history_fingerprint(listing), " > ".join(self.models)
+            )
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                self.metrics.note("source", "cache")
+                return {**cached, "cached": True}
+        
+        self.metrics.note("source", "model")
+        # Retrieval runs once here, not once per tier
+        grounding = self.gather_grounding(user_input, listing)
+        
+        try:
+            for tier, model in enumerate(self.models):
+                last_tier = tier == len(self.models) - 1
+                started = time.perf_counter()
+                try:
+                    # Smaller tiers don't retry a bad reply; escalating is their retry. Only the last tier's
+                    # command is final as it streams in; an earlier tier's may still be rejected and escalated
+                    result, problem = self.generate_with_model(user_input, model, on_command if last_tier else None,
+                                                               retry=last_tier, grounding=grounding)
+                except Exception as e:
+                    if last_tier:
+                        raise
+                    result, problem = None, str(e)
+                self.metrics.record(f"model:{model}", time.perf_counter() - started)
                 
+                reason = None if last_tier else escalation_reason(result, self.confidence_threshold)
+                if reason is None:
+                    break
+                self.metrics.count(f"escalated_{reason}")
+            
+            self.metrics.count(f"answered_by:{model}")
+            self.metrics.note("model", model)
+            
+            if result is None:
+                self.metrics.count("parse_failed")
                 return {
-                    "command": command,
-                    "explanation": explanation,
-                    "is_safe": True,
-                    "warning": "Response format was unexpected, using fallback parsing"
+                    "command": "echo 'Could not parse AI response'",
+                    "explanation": f"{SCHEMA_WARNING}: {problem}",
+                    "is_safe": False,
+                    "warning": SCHEMA_WARNING
                 }
+            result = {**result, "model": model}
+            
+            # Only cache well-formed responses; fallback parses should be retried next time
+            if cache_key and result.get("command") and result.get("warning") != FALLBACK_WARNING:
+                self.response_cache.put(cache_key, result)
+            
+            return result
                 
         except Exception as e:
             return {
@@ -190,8 +592,339 @@ Respond with a JSON object containing:
                 "warning": "Failed to generate command"
             }
 
-    def execute_command(self, command: str) -> Dict[str, Any]:
+    def generate_with_model(self, user_input: str, model: str, on_command: Optional[Callable[[str], None]] = None,
+                            retry: bool = True, grounding: Optional[Dict[str, Any]] = None
+                            ) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Ask one model for a command; returns (result, problem) like parse_response"""
+        response_data = None
+        response_format = {"format": RESPONSE_SCHEMA} if self.structured else {}
+        
+        if self.warmer:
+            waited = self.warmer.wait(model, self.cancelled)
+            if waited:
+                self.metrics.record("warmup_wait", waited)
+            if self.cancelled.is_set():
+                raise StageCancelled()
+        
+        # Continue the session from Ollama's KV context when this model produced it
+        if self.session and self.ollama_context and self.context_model == model:
+            try:
+                with self.metrics.time("prompt_build"):
+                    prompt = self.build_turn_prompt(user_input, grounding)
+                response_data = self.request_generation({
+                    "model": model,
+                    "prompt": prompt,
+                    "context": self.ollama_context,
+                    **response_format
+                }, on_command)
+            except Exception:
+                # The context may be stale or rejected; fall back to a full prompt
+                self.reset_session()
+        
+        if response_data is None:
+            # Build prompt with conversation history
+            with self.metrics.time("prompt_build"):
+                prompt = self.build_context_prompt(user_input, grounding)
+            response_data = self.request_generation({
+                "model": model,
+                "prompt": prompt,
+                **response_format
+            }, on_command)
+        
+        with self.metrics.time("parse"):
+            result, problem = self.parse_response(response_data.get("response", ""))
+        
+        # One retry with a full prompt and a reminder; never more, it costs a whole generation
+        if result is None and retry:
+            self.metrics.count("parse_retry")
+            with self.metrics.time("prompt_build"):
+                prompt = self.build_context_prompt(user_input, grounding) + RETRY_NOTE
+            response_data = self.request_generation({
+                "model": model,
+                "prompt": prompt,
+                **response_format
+            })
+            with self.metrics.time("parse"):
+                result, problem = self.parse_response(response_data.get("response", ""))
+        
+        self.pending_results = []
+        if self.session:
+            context = response_data.get("context")
+            if context and len(context) <= self.max_context_tokens:
+                self.ollama_context = context
+                self.context_model = model
+                self.context_command = result.get('command') if result else None
+            else:
+                self.reset_session()
+        
+        return result, problem
+
+    def generate_plan(self, user_input: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Ask the model of record for a whole multi-step plan in one generation; returns (plan, problem)"""
+        if self.warmer:
+            waited = self.warmer.wait(self.model, self.cancelled)
+            if waited:
+                self.metrics.record("warmup_wait", waited)
+            if self.cancelled.is_set():
+                raise StageCancelled()
+        
+        with self.metrics.time("prompt_build"):
+            prompt = self.build_context_prompt(user_input) + PLAN_NOTE
+        response_data = self.request_generation({"model": self.model, "prompt": prompt, "format": PLAN_SCHEMA})
+        
+        # The session's KV context doesn't cover this turn; the next one starts from a full prompt
+        self.reset_session()
+        
+        with self.metrics.time("parse"):
+            try:
+                plan = json.loads(response_data.get("response", ""))
+                problem = validate_plan(plan)
+            except json.JSONDecodeError:
+                plan, problem = None, "reply is not valid JSON"
+        return (plan, None) if problem is None else (None, problem)
+
+    async def run_plan(self, user_input: str):
+        """Generate a plan, confirm it once, run its steps as a dependency graph and record one history entry"""
+        print("🤔 Planning...")
+        try:
+            plan, problem = await self.stages.run(self.generate_plan, user_input)
+        except Exception as e:
+            plan, problem = None, str(e)
+        if plan is None:
+            print(f"❌ Could not get a usable plan: {problem}")
+            return
+        
+        steps = plan['steps']
+        print(f"\n🗺️  Plan ({len(steps)} steps):")
+        for step in steps:
+            after = f" (after {', '.join(step['depends_on'])})" if step['depends_on'] else ""
+            print(f"   🔧 [{step['id']}] {step['command']}{after}")
+            print(f"      📝 {step['explanation']}")
+            if step.get('warning'):
+                print(f"      ⚠️  Warning: {step['warning']}")
+        if plan.get('explanation'):
+            print(f"📝 Explanation: {plan['explanation']}")
+        
+        unsafe = [step['id'] for step in steps if not step.get('is_safe', True)]
+        if unsafe:
+            print(f"❌ Step {', '.join(unsafe)} deemed unsafe. Aborting.")
+            return
+        
+        with self.metrics.time("confirm_wait"):
+            answer = await self.reader.readline("\n❓ Execute this plan? (y/n): ", fresh=True)
+        confirm = answer.strip().lower() if isinstance(answer, str) else ""
+        if not isinstance(answer, str):
+            print()
+        self.metrics.note("executed", confirm in ['y', 'yes'])
+        if confirm not in ['y', 'yes']:
+            print("⏭️  Skipped.")
+            return
+        
+        # Results are printed as steps finish, which is not necessarily plan order
+        def show_step(step: Dict[str, Any], result: Dict[str, Any]):
+            status = "⏭️ " if result.get('skipped') else "✅" if result['success'] else "❌"
+            print(f"\n{status} [{step['id']}] {step['command']}")
+            output = result['stdout'] if result['success'] else result['stderr'] or result['stdout']
+            if output.strip():
+                print(output.rstrip())
+        
+        print("⚡ Executing...")
+        runner = PlanRunner(lambda command: run_step(command, self.current_working_dir, processes=self.active_processes))
+        with self.metrics.time("execute"):
+            results = await self.stages.run(runner.run, steps, show_step, on_cancel=runner.cancel)
+        
+        # The whole plan goes into history as one exchange, in an order that respects its dependencies
+        by_id = {step['id']: step for step in steps}
+        order = plan_order(steps)
+        failed = [step_id for step_id in order if not results[step_id]['success']]
+        combined = {
+            "success": not failed,
+            "stdout": "\n".join(f"[{step_id}] {results[step_id]['stdout'].rstrip()}" for step_id in order),
+            "stderr": "\n".join(f"[{step_id}] {results[step_id]['stderr'].rstrip()}" for step_id in failed),
+            "return_code": results[failed[0]]['return_code'] if failed else 0
+        }
+        ai_response = {
+            "command": " ; ".join(by_id[step_id]['command'] for step_id in order),
+            "explanation": plan.get('explanation') or f"Plan with {len(steps)} steps",
+            "is_safe": True,
+            "warning": "",
+            "plan": steps
+        }
+        self.add_to_history(user_input, ai_response, combined)
+        
+        print("\n📊 Results:")
+        print(f"{'✅' if not failed else '❌'} {len(steps) - len(failed)}/{len(steps)} steps succeeded")
+        print("-" * 50)
+
+    def parse_response(self, text: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Validate a reply against the response schema, repairing near misses; returns (result, problem)"""
+        if not self.structured:
+            result = self.parse_ai_response(text)
+            if result.get("warning") == FALLBACK_WARNING:
+                self.metrics.count("fallback_parse")
+            return result, None
+        
+        try:
+            data = json.loads(text)
+            problem = validate_response(data)
+        except json.JSONDecodeError:
+            data, problem = None, "reply is not valid JSON"
+        if problem is None:
+            self.metrics.count("parse_ok")
+            return data, None
+        
+        repaired = repair_response(text)
+        if repaired is not None and validate_response(repaired) is None:
+            self.metrics.count("parse_repaired")
+            return repaired, None
+        
+        return None, problem
+
+    def parse_ai_response(self, ai_response: str) -> Dict[str, Any]:
+        """Parse the model's reply into a command dict, falling back to text scanning"""
+        # Try to parse JSON response
+        try:
+            # Clean up the response to extract JSON
+            ai_response = ai_response.strip()
+            if ai_response.startswith("```json"):
+                ai_response = ai_response[7:]
+            if ai_response.endswith("```"):
+                ai_response = ai_response[:-3]
+            
+            result = json.loads(ai_response)
+            return result
+        except json.JSONDecodeError:
+            # If JSON parsing fails, try to extract command from text
+            lines = ai_response.split('\n')
+            command = None
+            explanation = "AI response could not be parsed as JSON"
+            
+            for line in lines:
+                if line.strip().startswith('"command"') or line.strip().startswith('command'):
+                    # Try to extract command from the line
+                    if ':' in line:
+                        command_part = line.split(':', 1)[1].strip().strip('"').strip(',')
+                        if command_part:
+                            command = command_part
+                            break
+            
+            if not command:
+                # Fallback: try to find any command-like text
+                for line in lines:
+                    if any(cmd in line.lower() for cmd in ['ls', 'pwd', 'echo', 'cat', 'find', 'grep']):
+                        command = line.strip()
+                        break
+            
+            if not command:
+                command = "echo 'Could not parse AI response'"
+            
+            return {
+                "command": command,
+                "explanation": explanation,
+                "is_safe": True,
+                "warning": FALLBACK_WARNING
+            }
+
+    def print_live_output(self, stream: str, text: str):
+        """Write command output to the terminal as it arrives"""
+        target = sys.stderr if stream == "stderr" else sys.stdout
+        target.write(text)
+        target.flush()
+
+    def speculate(self, command: str) -> Optional[Speculation]:
+        """Start a strictly read-only command before it is confirmed; None for anything with side effects"""
+        if not self.speculative or not self.shell or not can_speculate(command):
+            return None
+        # The sandbox is a fresh bash: it gets the session's exported variables, but a command that
+        # uses one of the session's aliases or functions could behave differently there
+        environment = self.shell.environment()
+        if environment is None or not can_speculate(command, environment[1]):
+            return None
+        # With the result cache on, its snapshot tells whether the output went stale before "y"
+        snapshot = self.result_cache.snapshot(command, self.current_working_dir) if self.result_cache else None
+        try:
+            return Speculation(command, self.current_working_dir, snapshot=snapshot, env=environment[0])
+        except OSError:
+            return None
+
+    def replay_output(self, result: Dict[str, Any], on_output: Optional[Callable[[str, str], None]]):
+        """Send a result that was produced earlier to the live output callback"""
+        if on_output:
+            for stream in ["stdout", "stderr"]:
+                if result.get(stream):
+                    on_output(stream, result[stream] if result[stream].endswith("\n") else result[stream] + "\n")
+        result['streamed'] = on_output is not None
+
+    def cancel_stage(self):
+        """Stop the generation or command in flight, from another thread; the shell session survives"""
+        self.cancelled.set()
+        response = self.active_response
+        if response is not None:
+            abort_response(response)
+        if self.shell:
+            self.shell.interrupt()
+        for process in list(self.active_processes):
+            try:
+                os.killpg(process.pid, signal.SIGINT)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+    def execute_command(self, command: str, on_output: Optional[Callable[[str, str], None]] = None,
+                        speculation: Optional[Speculation] = None) -> Dict[str, Any]:
+        """Execute a terminal command, or use its cached or speculatively run result"""
+        snapshot = None
+        if self.result_cache:
+            cached, snapshot = self.result_cache.lookup(command, self.current_working_dir)
+            if cached is not None:
+                if speculation:
+                    speculation.cancel()
+                self.replay_output(cached, on_output)
+                return cached
+        
+        result = None
+        if speculation:
+            if speculation.snapshot is None or self.result_cache.is_current(speculation.snapshot):
+                result = speculation.result()
+            else:
+                speculation.cancel()  # Something it reads changed while the prompt was up
+            if result is not None:
+                snapshot = speculation.snapshot or snapshot
+                self.replay_output(result, on_output)
+        
+        if result is None:
+            if self.cancelled.is_set():
+                # Interrupted while waiting for the speculative run; don't start the real one
+                return {"success": False, "stdout": "", "stderr": "Interrupted", "return_code": 130}
+            result = self.run_command(command, on_output)
+        if self.result_cache and not self.cancelled.is_set():
+            self.result_cache.store(snapshot, result)
+        return result
+
+    def run_command(self, command: str, on_output: Optional[Callable[[str, str], None]] = None) -> Dict[str, Any]:
         """Execute a terminal command and return results"""
+        if self.shell:
+            try:
+                result = self.shell.run(command, timeout=30, on_output=on_output)
+            except Exception as e:
+                self.shell.restart()
+                return {
+                    "success": False,
+                    "stdout": "",
+                    "stderr": f"Error executing command: {str(e)}",
+                    "return_code": -1
+                }
+            
+            self.current_working_dir = self.shell.cwd
+            if command.strip().split()[:1] == ['cd'] and result['success'] and not result['stdout']:
+                result['stdout'] = f"Changed directory to: {self.current_working_dir}"
+                if on_output:
+                    on_output("stdout", result['stdout'] + "\n")
+            
+            # Output already went to the terminal; the result only keeps its head and tail
+            result['streamed'] = on_output is not None
+            return result
+        
+        # Without bash, fall back to a fresh subprocess per command
         try:
             # Handle cd commands specially to update working directory
             if command.strip().startswith('cd '):
@@ -223,15 +956,8 @@ Respond with a JSON object containing:
                         "return_code": 1
                     }
             
-            # Run the command in the current working directory
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                cwd=self.current_working_dir,  # Use tracked working directory
-                timeout=30  # 30 second timeout
-            )
+            # Run the command in the current working directory, in a process group Ctrl-C can signal
+            result = run_step(command, self.current_working_dir, timeout=30, processes=self.active_processes)
             
             # Update working directory if it changed (for non-cd commands)
             try:
@@ -241,20 +967,8 @@ Respond with a JSON object containing:
             except:
                 pass  # Ignore errors updating working directory
             
-            return {
-                "success": result.returncode == 0,
-                "stdout": result.stdout,
-                "stderr": result.stderr,
-                "return_code": result.returncode
-            }
+            return result
             
-        except subprocess.TimeoutExpired:
-            return {
-                "success": False,
-                "stdout": "",
-                "stderr": "Command timed out after 30 seconds",
-                "return_code": -1
-            }
         except Exception as e:
             return {
                 "success": False,
@@ -265,30 +979,95 @@ Respond with a JSON object containing:
 
     def run(self):
         """Main loop for the terminal agent"""
+        try:
+            asyncio.run(self.repl())
+        except KeyboardInterrupt:
+            # Only reachable where the event loop can't trap Ctrl-C
+            print("\n👋 Goodbye!")
+
+    def interrupt(self):
+        """Ctrl-C: cancel the running stage, or wake the prompt that is waiting for input"""
+        if self.stages.interrupt():
+            print(flush=True)
+        else:
+            self.reader.interrupt()
+
+    async def repl(self):
+        """Read requests and run each stage on a worker, so Ctrl-C cancels a stage instead of ending the agent"""
+        loop = asyncio.get_running_loop()
+        self.reader = LineReader(loop)
+        self.stages = StageRunner(self.cancelled, self.cancel_stage)
+        trap_interrupts(loop, self.interrupt)
+        
         print("🤖 AI Terminal Agent (with History)")
         print("Type your request in natural language (e.g., 'show me the current directory')")
         print("Type 'quit' or 'exit' to stop")
-        print("Type 'history' to see conversation history")
-        print("Type 'clear' to clear conversation history\n")
+        print("Type 'history' to see conversation history ('history search <text>', 'history here', 'history failed')")
+        print("Type '!<id>' to run a command from history again ('!!' for the last one)")
+        print("Type 'plan <request>' to run a multi-part request as parallel steps")
+        print("Type 'clear' to clear conversation history")
+        print("Type 'model <name>' to switch Ollama models")
+        print("Type 'connections' to see Ollama connection reuse")
+        print("Type 'cache stats' or 'cache clear' to inspect or empty the response and result caches")
+        print("Type 'intents' to see how often requests skipped the model")
+        print("Type 'stats' (or 'stats prometheus') to see where each turn's time went")
+        print("Press Ctrl-C to stop a generation or command; the next request can be typed while one runs\n")
         
+        interrupted_at_prompt = False
         while True:
             try:
-                # Get user input
-                user_input = input("💬 You: ").strip()
+                # Get user input; lines typed while the last request ran are already waiting
+                user_input = await self.reader.readline("💬 You: ")
+                if user_input is None:
+                    print("👋 Goodbye!")
+                    break
+                if user_input is INTERRUPTED:
+                    if interrupted_at_prompt:
+                        print("\n👋 Goodbye!")
+                        break
+                    interrupted_at_prompt = True
+                    print("\n(Press Ctrl-C again, type 'quit' or press Ctrl-D to exit)")
+                    continue
+                interrupted_at_prompt = False
+                user_input = user_input.strip()
                 
                 if user_input.lower() in ['quit', 'exit', 'q']:
                     print("👋 Goodbye!")
                     break
                 
-                if user_input.lower() == 'history':
-                    self.show_history()
+                if user_input.lower() == 'history' or user_input.lower().startswith('history '):
+                    self.handle_history_command(user_input[len('history'):].strip())
+                    continue
+                
+                if user_input.lower() == 'connections':
+                    self.show_connection_stats()
+                    continue
+                
+                if user_input.lower() in ['cache stats', 'cache clear']:
+                    self.handle_cache_command(user_input.lower().split()[1])
+                    continue
+                
+                if user_input.lower() == 'intents':
+                    self.show_intent_stats()
+                    continue
+                
+                if user_input.lower() in ['stats', 'stats prometheus']:
+                    self.show_stats(prometheus=user_input.lower().endswith('prometheus'))
                     continue
                 
                 if user_input.lower() == 'clear':
                     self.conversation_history.clear()
+                    self.reset_session()
+                    if self.summary:
+                        self.summary.clear()
                     print("🗑️  Conversation history cleared!")
                     continue
                 
+                if user_input.lower().startswith('model '):
+                    self.set_model(user_input[6:].strip())
+                    print(f"🧠 Using model: {self.model}")
+                    continue
+                
                 if user_input.lower() in ['pwd', 'where am i', 'current directory']:
                     print(f"📍 Current working directory: {self.current_working_dir}")
                     continue
@@ -296,13 +1075,47 @@ Respond with a JSON object containing:
                 if not user_input:
                     continue
                 
-                print("🤔 Thinking...")
+                if user_input.lower().startswith('plan '):
+                    self.metrics.begin_turn()
+                    self.metrics.note("source", "plan")
+                    await self.run_plan(user_input[5:].strip())
+                    continue
                 
-                # Generate command from AI
-                ai_response = self.generate_command(user_input)
+                # Re-run a past command without asking the model again
+                recalled = None
+                if user_input.startswith('!'):
+                    recalled = self.recall_command(user_input[1:].strip())
+                    if recalled is None:
+                        continue
+                    user_input = recalled['user_input']
                 
-                # Display the generated command
-                print(f"\n🔧 Generated command: {ai_response['command']}")
+                if recalled:
+                    self.metrics.begin_turn()
+                    self.metrics.note("source", "history")
+                    ai_response = recalled['ai_response']
+                    print(f"\n🔧 Recalled command #{recalled['id']}: {ai_response['command']}")
+                else:
+                    print("🤔 Thinking...")
+                    self.metrics.begin_turn()
+                    
+                    # Show the command as soon as the stream delivers it
+                    shown = {}
+                    def show_command(command: str):
+                        shown['command'] = command
+                        print(f"\n🔧 Generated command: {command}")
+                    
+                    # Generate command from AI; Ctrl-C closes the stream so Ollama stops generating
+                    ai_response = await self.stages.run(self.generate_command, user_input, show_command)
+                    
+                    # Display the generated command (again, if parsing changed it)
+                    if shown.get('command') != ai_response['command']:
+                        print(f"\n🔧 Generated command: {ai_response['command']}")
+                    if ai_response.get('cached'):
+                        print("⚡ Answered from cache")
+                    if ai_response.get('intent'):
+                        print(f"⚡ Matched built-in request: {ai_response['intent']}")
+                    if ai_response.get('model') and ai_response['model'] != self.models[0]:
+                        print(f"🔼 Escalated to {ai_response['model']}")
                 print(f"📝 Explanation: {ai_response['explanation']}")
                 
                 if ai_response.get('warning'):
@@ -313,15 +1126,40 @@ Respond with a JSON object containing:
                     print("❌ Command deemed unsafe. Aborting.")
                     continue
                 
+                # Read-only commands start now, in a sandbox, and are usually done by the time you answer
+                speculation = self.speculate(ai_response['command'])
+                
                 # Ask for confirmation
-                confirm = input("\n❓ Execute this command? (y/n): ").strip().lower()
+                try:
+                    with self.metrics.time("confirm_wait"):
+                        answer = await self.reader.readline("\n❓ Execute this command? (y/n): ", fresh=True)
+                except BaseException:
+                    if speculation:
+                        speculation.cancel()
+                    raise
+                # Ctrl-C or end of input at the prompt means no
+                confirm = answer.strip().lower() if isinstance(answer, str) else ""
+                if not isinstance(answer, str):
+                    print()
+                self.metrics.note("executed", confirm in ['y', 'yes'])
                 if confirm not in ['y', 'yes']:
+                    if speculation:
+                        speculation.cancel()
                     print("⏭️  Skipped.")
                     continue
                 
                 # Execute the command
                 print("⚡ Executing...")
-                result = self.execute_command(ai_response['command'])
+                with self.metrics.time("execute"):
+                    result = await self.stages.run(self.execute_command, ai_response['command'],
+                                                   self.print_live_output, speculation,
+                                                   on_cancel=speculation.cancel if speculation else None)
+                self.metrics.note("result_cached", bool(result.get('cached')))
+                generated = not (recalled or ai_response.get('intent') or ai_response.get('cached'))
+                if generated and not self.cancelled.is_set():
+                    # A generated command that ran cleanly needed no follow-up turn to fix it
+                    self.metrics.count("first_try_ok" if result['success'] else "first_try_failed")
+                self.metrics.note("speculated", bool(result.get('speculated')))
                 
                 # Add to conversation history
                 self.add_to_history(user_input, ai_response, result)
@@ -330,20 +1168,238 @@ Respond with a JSON object containing:
                 print("\n📊 Results:")
                 if result['success']:
                     print("✅ Command executed successfully")
-                    if result['stdout']:
+                    if result.get('cached'):
+                        print(f"♻️  Cached result from {time.time() - result['cached_at']:.0f}s ago "
+                              f"(nothing the command reads has changed since)")
+                    if result['stdout'] and not result.get('streamed'):
                         print(f"📤 Output:\n{result['stdout']}")
                 else:
                     print("❌ Command failed")
-                    if result['stderr']:
+                    if result['stderr'] and not result.get('streamed'):
                         print(f"📤 Error:\n{result['stderr']}")
+                if result.get('speculated'):
+                    print(f"⏩ Ran while you were reading the command ({result['saved']:.1f}s saved)")
+                if result.get('truncated'):
+                    print("✂️  Large output: only its beginning and end were kept in history")
                 
                 print("-" * 50)
                 
+            except StageCancelled:
+                print("⛔ Cancelled")
             except KeyboardInterrupt:
                 print("\n👋 Goodbye!")
                 break
             except Exception as e:
                 print(f"❌ Error: {str(e)}")
+            finally:
+                self.metrics.end_turn()
+
+    def show_connection_stats(self):
+        """Display connection reuse statistics for the Ollama client"""
+        stats = self.client.stats()
+        print(f"\n🔌 Ollama connections ({self.ollama_url}):")
+        print(f"   📨 Requests: {stats['requests']} ({stats['retries']} retries)")
+        print(f"   🆕 Connections opened: {stats['connections_opened']}")
+        print(f"   ♻️  Connections reused: {stats['connections_reused']}")
+        print(f"   ⏳ Model keep_alive: {stats['keep_alive']}")
+        
+        if stats.get('backends'):
+            print(f"   🔀 Failovers: {stats['failovers']}, hedged requests: {stats['hedges']} ({stats['hedge_wins']} won)")
+            for backend in stats['backends']:
+                status = '✅' if backend['healthy'] else '❌'
+                print(f"   {status} {backend['url']}: {backend['in_flight']} in flight, "
+                      f"{backend['requests']} requests, {backend['failures']} failures")
+
+    def handle_cache_command(self, action: str):
+        """Show statistics for, or clear, the response and result caches"""
+        if action == 'clear':
+            if self.response_cache:
+                self.response_cache.clear()
+                print("🗑️  Response cache cleared!")
+            if self.result_cache:
+                self.result_cache.clear()
+                print("🗑️  Result cache cleared!")
+            return
+        
+        if not self.response_cache:
+            print("📦 Response cache is disabled.")
+        else:
+            stats = self.response_cache.stats()
+            print("\n📦 Response cache:")
+            print(f"   🎯 Hit rate: {stats['hit_rate']:.0%} "
+                  f"({stats['memory_hits']} memory, {stats['disk_hits']} disk, {stats['misses']} misses)")
+            print(f"   🧠 In memory: {stats['memory_entries']} entries")
+            print(f"   💾 On disk: {stats['disk_entries']} entries ({stats['path'] or 'disabled'})")
+        
+        if not self.result_cache:
+            print("♻️  Result cache is off (set TERMINAL_AGENT_RESULT_CACHE=1 to cache read-only command output)")
+            return
+        stats = self.result_cache.stats()
+        print(f"\n♻️  Result cache ({stats['mode']} invalidation):")
+        print(f"   🎯 Hit rate: {stats['hit_rate']:.0%} ({stats['hits']} hits, {stats['misses']} misses)")
+        print(f"   🔄 Invalidated by changes: {stats['invalidations']}, not cacheable: {stats['uncacheable']}")
+        print(f"   🧠 Entries: {stats['entries']}")
+        if stats['mode'] == "inotify":
+            print(f"   👀 Watches: {stats['watches']}, checked with stat() for lack of watches: {stats['stat_fallbacks']}")
+
+    def show_intent_stats(self):
+        """Display how often the intent table answered without the model"""
+        if not self.intents:
+            print("🎯 Intent matching is disabled.")
+            return
+        
+        stats = self.intents.stats()
+        print(f"\n🎯 Intents ({self.intents.config_path}):")
+        print(f"   ⚡ Answered without the model: {stats['hits']}/{stats['lookups']} ({stats['hit_rate']:.0%})")
+        print(f"   ⏱️  Average lookup: {stats['avg_lookup_ms']:.3f} ms")
+        for name, count in stats['by_intent'].items():
+            print(f"   - {name}: {count}")
+
+    def show_stats(self, prometheus: bool = False):
+        """Display per-stage latency percentiles, or the Prometheus text dump"""
+        if prometheus:
+            print(self.metrics.prometheus_text())
+            return
+        
+        summary = self.metrics.summary()
+        if not summary:
+            print("⏱️  No timings recorded yet.")
+            return
+        
+        print("\n⏱️  Stage latency (recent turns):")
+        print(f"   {'stage':<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for stage, stats in summary.items():
+            print(f"   {stage:<22}{stats['count']:>7}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+        
+        counters = self.metrics.counter_values()
+        replies = sum(counters.get(name, 0) for name in ['parse_ok', 'parse_repaired', 'parse_failed'])
+        if replies:
+            wasted = counters.get('parse_retry', 0) + counters.get('parse_failed', 0)
+            print(f"   🧩 Replies: {counters.get('parse_ok', 0)} valid, {counters.get('parse_repaired', 0)} repaired, "
+                  f"{counters.get('parse_retry', 0)} retried, {counters.get('parse_failed', 0)} failed "
+                  f"({wasted / replies:.0%} wasted round trips)")
+        if counters.get('fallback_parse'):
+            print(f"   🧩 Fallback parses: {counters['fallback_parse']}")
+        executed = counters.get('first_try_ok', 0) + counters.get('first_try_failed', 0)
+        if executed:
+            print(f"   🎯 First-try success: {counters.get('first_try_ok', 0) / executed:.0%} "
+                  f"({counters.get('first_try_ok', 0)} of {executed} generated commands ran cleanly)")
+        if len(self.models) > 1:
+            self.show_cascade_stats(summary, counters)
+        if self.history_index is not None:
+            index = self.history_index.stats()
+            print(f"   🔎 History search ({index['backend']}): {index['searched']} of {index['indexed']} exchanges scored"
+                  + (" - older ones are never found; pip install numpy to search them all" if index['truncated'] else ""))
+        if self.metrics.trace_path:
+            print(f"   📝 Tracing turns to {self.metrics.trace_path}")
+
+    def show_cascade_stats(self, summary: Dict[str, Dict[str, float]], counters: Dict[str, int]):
+        """Display how often each tier answered and roughly how much time the smaller tiers saved"""
+        answered = {model: counters.get(f"answered_by:{model}", 0) for model in self.models}
+        total = sum(answered.values())
+        if not total:
+            return
+        
+        print(f"   🪜 Cascade ({' → '.join(self.models)}):")
+        for model in self.models:
+            latency = summary.get(f"model:{model}", {}).get("p50_ms", 0.0)
+            print(f"      {model}: answered {answered[model]}/{total} ({answered[model] / total:.0%}), p50 {latency:.0f} ms")
+        
+        escalations = {name[len('escalated_'):]: count for name, count in counters.items() if name.startswith('escalated_')}
+        if escalations:
+            print("      Escalations: " + ", ".join(f"{reason}={count}" for reason, count in sorted(escalations.items())))
+        
+        # Estimate against sending every request straight to the largest model
+        largest = summary.get(f"model:{self.models[-1]}")
+        if largest:
+            saved = sum(
+                answered[model] * (largest["p50_ms"] - summary.get(f"model:{model}", {}).get("p50_ms", 0.0))
+                for model in self.models[:-1]
+            )
+            print(f"      ≈ {saved / 1000:.1f}s saved versus always using {self.models[-1]}")
+
+    def recall_command(self, reference: str) -> Optional[Dict[str, Any]]:
+        """Look up a past exchange by id ('!12') or the latest one ('!!')"""
+        if not self.history_store:
+            print("📝 Persistent history is disabled.")
+            return None
+        
+        if reference == '!':
+            entries = self.history_store.recent(1)
+            entry = entries[0] if entries else None
+        elif reference.isdigit():
+            entry = self.history_store.get(int(reference))
+        else:
+            print("❓ Use '!<id>' with an id from 'history', or '!!' for the last command")
+            return None
+        
+        if entry is None:
+            print(f"📝 No history entry {'yet' if reference == '!' else '#' + reference}.")
+            return None
+        
+        return {
+            "id": entry['id'],
+            "user_input": entry['user_input'],
+            "ai_response": {
+                "command": entry['command'],
+                "explanation": entry['explanation'],
+                "is_safe": True,
+                "warning": ""
+            }
+        }
+
+    def handle_history_command(self, args: str):
+        """history [here] [failed|ok] [search <text>]"""
+        if not self.history_store:
+            self.show_history()
+            return
+        
+        cwd, success, text = None, None, None
+        words = args.split()
+        while words:
+            word = words.pop(0).lower()
+            if word == 'here':
+                cwd = self.current_working_dir
+            elif word in ['failed', 'ok']:
+                success = word == 'ok'
+            elif word == 'search' and words:
+                text = " ".join(words)
+                break
+            else:
+                print("❓ Usage: history [here] [failed|ok] [search <text>]")
+                return
+        
+        if text:
+            entries = self.history_store.search(text, cwd=cwd, success=success)
+            title = f"History matching '{text}'"
+        else:
+            entries = self.history_store.recent(self.max_history_length, cwd=cwd, success=success)
+            title = "Recent History"
+        self.show_history_entries(entries, title)
+
+    def show_history_entries(self, entries: List[Dict[str, Any]], title: str):
+        """Display exchanges from the persistent history, oldest first"""
+        if not entries:
+            print("📝 No matching history.")
+            return
+        
+        print(f"\n📚 {title} ({len(entries)} exchanges, {self.history_store.count()} saved):")
+        print("=" * 60)
+        
+        for entry in reversed(entries):
+            print(f"\n🔄 #{entry['id']}:")
+            print(f"   💬 User: {entry['user_input']}")
+            print(f"   🤖 AI Command: {entry['command']}")
+            print(f"   📊 Result: {'✅ Success' if entry['success'] else '❌ Failed'}")
+            if entry['output'].strip():
+                output = entry['output'].strip()
+                if len(output) > 100:
+                    output = output[:100] + "..."
+                print(f"   📤 Output: {output}")
+            print(f"   📍 Directory: {entry['cwd']}")
+            print(f"   ⏰ Time: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['ts']))}")
+            print("-" * 40)
+        print("Run one again with '!<id>'")
 
     def show_history(self):
         """Display conversation history"""
@@ -1,21 +1,85 @@
 #!/usr/bin/env python3
 """
 Test script for Ollama connection
-Helps verify Ollama is running and Llama 3.2 is available
+Helps verify Ollama is running and Llama 3.2 is available, and with --load
+measures how much concurrent traffic the backend can take before it saturates
 """
 
+import argparse
+import json
+import random
 import sys
+import threading
+import time
 import requests
+from typing import Dict, Any, List, Optional
 
-def test_ollama_connection():
+from benchmark import REQUESTS, summarize
+from metrics import percentile
+from mock_ollama import REPLIES, DEFAULT_REPLY, MockOllamaServer
+from model_cascade import configured_cascade
+from ollama_client import OllamaClient
+from response_schema import RESPONSE_SCHEMA
+from terminal_agent import TerminalAgent
+
+# A closed-loop level is past saturation when it adds less than this much throughput over the previous one
+SATURATION_GAIN = 0.10
+
+# An open-loop rate is past saturation when p95 latency exceeds this multiple of the lightest rate's
+SATURATION_LATENCY = 2.0
+
+# What the mock's commands typically print; the load test never runs anything on this machine
+CANNED_OUTPUTS = {
+    "df -h": """Filesystem      Size  Used Avail Use% Mounted on
+/dev/nvme0n1p2  468G  211G  234G  48% /
+tmpfs           7.8G  1.2M  7.8G   1% /dev/shm
+/dev/nvme0n1p1  511M  6.1M  505M   2% /boot/efi
+""",
+    "free -h": """               total        used        free      shared  buff/cache   available
+Mem:            15Gi       5.2Gi       4.1Gi       612Mi       6.3Gi       9.6Gi
+Swap:          2.0Gi          0B       2.0Gi
+""",
+    "ps aux | head -n 10": """USER         PID %CPU %MEM    VSZ   RSS TTY      STAT START   TIME COMMAND
+root           1  0.0  0.1 167744 11904 ?        Ss   09:12   0:02 /sbin/init
+root           2  0.0  0.0      0     0 ?        S    09:12   0:00 [kthreadd]
+root         412  0.0  0.2  48212 17020 ?        S<s  09:12   0:01 /lib/systemd/systemd-journald
+ollama       988  2.1 21.4 9127344 3502112 ?     Ssl  09:12   4:31 /usr/local/bin/ollama serve
+user        2210  0.3  1.9 1204480 311208 ?      Sl   09:14   0:40 /usr/bin/gnome-shell
+user        3105  0.0  0.0  11292  5376 pts/0    Ss   10:02   0:00 -bash
+user        3377  1.2  0.8 402112 131844 pts/0   Sl+  10:05   0:09 python3 terminal_agent.py
+user        3391  0.0  0.0  13080  3712 pts/0    R+   10:07   0:00 ps aux
+user        3392  0.0  0.0   8604  1024 pts/0    S+   10:07   0:00 head -n 10
+""",
+    "find . -name '*.py' -type f": """./terminal_agent.py
+./ollama_client.py
+./benchmark.py
+./test_api.py
+./mock_ollama.py
+./prompt_builder.py
+""",
+    "date": "Thu Mar 14 10:07:31 UTC 2024\n",
+    "pwd": "/home/user/projects/agent\n",
+    "echo 'Hello World'": "Hello World\n",
+    "ls -la": """total 96
+drwxr-xr-x  4 user user  4096 Mar 14 10:01 .
+drwxr-xr-x 12 user user  4096 Mar 12 18:40 ..
+drwxr-xr-x  8 user user  4096 Mar 14 09:58 .git
+-rw-r--r--  1 user user   312 Mar 10 11:20 .gitignore
+-rw-r--r--  1 user user  8712 Mar 14 09:55 README.md
+-rw-r--r--  1 user user    67 Mar 10 11:20 requirements.txt
+-rwxr-xr-x  1 user user 41022 Mar 14 10:01 terminal_agent.py
+"""
+}
+
+def test_ollama_connection(client: Optional[OllamaClient] = None):
     """Test the Ollama connection"""
     print("🔍 Testing Ollama Connection...")
     
-    ollama_url = "http://localhost:11434"
+    client = client or OllamaClient()
     
     try:
         # Test if Ollama is running
-        response = requests.get(f"{ollama_url}/api/tags")
+        response = client.get("/api/tags")
         if response.status_code == 200:
             print("✅ Ollama server is running")
         else:
@@ -34,8 +98,8 @@ def test_ollama_connection():
             
             # Test the model
             print("🧪 Testing Llama 3.2...")
-            test_response = requests.post(
-                f"{ollama_url}/api/generate",
+            test_response = client.post(
+                "/api/generate",
                 json={
                     "model": "llama3.2",
                     "prompt": "Say 'Hello World'",
@@ -48,6 +112,10 @@ def test_ollama_connection():
                 result = test_response.json()
                 print(f"✅ Llama 3.2 is working!")
                 print(f"📝 Response: {result.get('response', 'No response')}")
+                
+                stats = client.stats()
+                print(f"🔌 Connections: {stats['connections_opened']} opened, "
+                      f"{stats['connections_reused']} reused for {stats['requests']} requests")
                 return True
             else:
                 print(f"❌ Llama 3.2 test failed with status {test_response.status_code}")
@@ -56,7 +124,7 @@ def test_ollama_connection():
             print("❌ Llama 3.2 model not found")
             print("To install it, run: ollama pull llama3.2")
             return False
-            
+    
     except requests.exceptions.ConnectionError:
         print("❌ Could not connect to Ollama server")
         print("Make sure Ollama is running: ollama serve")
@@ -65,12 +133,277 @@ def test_ollama_connection():
         print(f"❌ Unexpected error: {str(e)}")
         return False
 
+def sample_prompts(client: OllamaClient) -> List[str]:
+    """Prompts exactly as the agent builds them, each with the previous requests and typical output as history"""
+    agent = TerminalAgent(session=False, client=client, cache=False, intents=False, probe=False, shell=False,
+                          retrieval=False, history=False, result_cache=False, speculate=False, summarize=False)
+    prompts = []
+    for user_input in REQUESTS:
+        prompts.append(agent.build_context_prompt(user_input))
+        command, explanation = next(
+            ((command, explanation) for keyword, command, explanation in REPLIES if keyword in user_input),
+            DEFAULT_REPLY
+        )
+        result = {"success": True, "stdout": CANNED_OUTPUTS.get(command, ""), "stderr": "", "return_code": 0}
+        agent.add_to_history(user_input, {"command": command, "explanation": explanation}, result)
+    return prompts
+
+def timed_generation(client: OllamaClient, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Stream one generation, timing the first token and the whole request"""
+    sample = {"ok": False, "ttft": None, "e2e": None, "tokens": 0, "tokens_per_s": None, "error": None}
+    started = time.perf_counter()
+    first_token_at = None
+    chunks = 0
+    final_chunk = {}
+    try:
+        response = client.post("/api/generate", json=payload, stream=True, timeout=120)
+        try:
+            if response.status_code != 200:
+                sample["error"] = f"HTTP {response.status_code}"
+                return sample
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    sample["error"] = chunk["error"]
+                    return sample
+                if chunk.get("response"):
+                    chunks += 1
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                if chunk.get("done"):
+                    final_chunk = chunk
+                    break
+        finally:
+            response.close()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        sample["error"] = str(e)
+        return sample
+    
+    finished = time.perf_counter()
+    sample["ok"] = first_token_at is not None
+    sample["e2e"] = finished - started
+    sample["tokens"] = final_chunk.get("eval_count") or chunks
+    if first_token_at is not None:
+        sample["ttft"] = first_token_at - started
+        # Decode speed one user sees; prefer the server's own timing when it reports it
+        if final_chunk.get("eval_duration"):
+            sample["tokens_per_s"] = sample["tokens"] / (final_chunk["eval_duration"] / 1e9)
+        elif finished > first_token_at:
+            sample["tokens_per_s"] = max(sample["tokens"] - 1, 1) / (finished - first_token_at)
+    return sample
+
+def level_report(samples: List[Dict[str, Any]], wall: float) -> Dict[str, Any]:
+    """Throughput and latency percentiles for one load level"""
+    ok = [sample for sample in samples if sample["ok"]]
+    rates = [sample["tokens_per_s"] for sample in ok if sample["tokens_per_s"]]
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "wall_s": wall,
+        "throughput_rps": len(ok) / wall if wall else 0.0,
+        "throughput_tokens_s": sum(sample["tokens"] for sample in ok) / wall if wall else 0.0,
+        "ttft": summarize([sample["ttft"] for sample in ok]),
+        "e2e": summarize([sample["e2e"] for sample in ok]),
+        # Per-stream decode speed; p5 is what the unluckiest users get
+        "stream_tokens_s": {"p50": percentile(rates, 50), "p5": percentile(rates, 5)}
+    }
+
+def closed_loop(client: OllamaClient, payloads: List[Dict[str, Any]], concurrency: int,
+                total: int) -> Dict[str, Any]:
+    """`concurrency` users, each sending its next request as soon as the last one finishes"""
+    samples = []
+    lock = threading.Lock()
+    issued = [0]
+    
+    def user():
+        while True:
+            with lock:
+                if issued[0] >= total:
+                    return
+                payload = payloads[issued[0] % len(payloads)]
+                issued[0] += 1
+            sample = timed_generation(client, payload)
+            with lock:
+                samples.append(sample)
+    
+    started = time.perf_counter()
+    threads = [threading.Thread(target=user, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report = level_report(samples, time.perf_counter() - started)
+    report["concurrency"] = concurrency
+    return report
+
+def open_loop(client: OllamaClient, payloads: List[Dict[str, Any]], rate: float, duration: float,
+              seed: int = 0) -> Dict[str, Any]:
+    """Poisson arrivals at `rate` per second regardless of how fast replies come back, like independent users"""
+    arrivals = random.Random(seed)
+    samples = []
+    lock = threading.Lock()
+    
+    def send(payload: Dict[str, Any]):
+        sample = timed_generation(client, payload)
+        with lock:
+            samples.append(sample)
+    
+    threads = []
+    started = time.perf_counter()
+    at = arrivals.expovariate(rate)
+    while at < duration:
+        time.sleep(max(started + at - time.perf_counter(), 0))
+        thread = threading.Thread(target=send, args=(payloads[len(threads) % len(payloads)],), daemon=True)
+        thread.start()
+        threads.append(thread)
+        at += arrivals.expovariate(rate)
+    for thread in threads:
+        thread.join()
+    report = level_report(samples, time.perf_counter() - started)
+    report["offered_rps"] = rate
+    return report
+
+def saturation_point(levels: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Last level before added load stopped paying off, or None if the sweep never got there"""
+    baseline = levels[0]["e2e"]["p95_ms"] if levels else 0.0
+    for previous, level in zip(levels, levels[1:]):
+        if "offered_rps" in level:
+            # Open loop: throughput just follows the arrivals until the queue starts to grow, which shows as latency
+            saturated = level["e2e"]["p95_ms"] > SATURATION_LATENCY * baseline
+        else:
+            saturated = (not previous["throughput_tokens_s"]
+                         or level["throughput_tokens_s"] / previous["throughput_tokens_s"] - 1 < SATURATION_GAIN)
+        if saturated:
+            return previous
+    return None
+
+def level_name(level: Dict[str, Any]) -> str:
+    """Concurrency or arrival rate of a level"""
+    return f"{level['concurrency']}" if "concurrency" in level else f"{level['offered_rps']:g}"
+
+def run_load_test(client: OllamaClient, model: str, concurrency: List[int], requests_per_level: int,
+                  rates: List[float], duration: float, seed: int = 0) -> Dict[str, Any]:
+    """Concurrency sweep, then optionally an open-loop rate sweep, with the saturation point of each"""
+    prompts = sample_prompts(client)
+    payloads = [{"model": model, "prompt": prompt, "format": RESPONSE_SCHEMA, "stream": True} for prompt in prompts]
+    
+    # One unmeasured request so model loading doesn't count against the first level
+    timed_generation(client, payloads[0])
+    
+    report = {
+        "model": model,
+        "server": client.base_url,
+        "prompts": len(prompts),
+        "prompt_tokens_mean": sum(len(prompt) // 4 for prompt in prompts) / len(prompts),
+        "closed_loop": [],
+        "open_loop": []
+    }
+    for level in concurrency:
+        # Every user sends a few requests, so a level isn't just one burst
+        report["closed_loop"].append(closed_loop(client, payloads, level, max(requests_per_level, level * 3)))
+        print_level(report["closed_loop"][-1], f"{level:>4} users")
+    report["closed_saturation"] = saturation_point(report["closed_loop"])
+    
+    for rate in rates:
+        report["open_loop"].append(open_loop(client, payloads, rate, duration, seed))
+        print_level(report["open_loop"][-1], f"{rate:>5g}/s")
+    report["open_saturation"] = saturation_point(report["open_loop"]) if rates else None
+    return report
+
+def print_level(level: Dict[str, Any], label: str):
+    """One row of the load table"""
+    print(f"   {label}  {level['throughput_rps']:6.2f} req/s  {level['throughput_tokens_s']:7.1f} tok/s  "
+          f"TTFT p50/p95 {level['ttft']['p50_ms']:6.0f}/{level['ttft']['p95_ms']:6.0f} ms  "
+          f"e2e p50/p95/p99 {level['e2e']['p50_ms']:6.0f}/{level['e2e']['p95_ms']:6.0f}/{level['e2e']['p99_ms']:6.0f} ms  "
+          f"stream {level['stream_tokens_s']['p50']:5.1f} tok/s"
+          + (f"  ❌ {level['errors']} errors" if level['errors'] else ""))
+
+def print_saturation(levels: List[Dict[str, Any]], point: Optional[Dict[str, Any]], unit: str):
+    """Where the backend stops scaling and what pushing past it costs"""
+    if not levels:
+        return
+    if not any(level["throughput_rps"] for level in levels):
+        print(f"❌ No request succeeded at any level ({unit}); the backend failed rather than saturated")
+        return
+    if point is None:
+        print(f"🚀 No saturation up to {level_name(levels[-1])} {unit}; "
+              f"extend the sweep to find the limit")
+        return
+    if not point["throughput_tokens_s"]:
+        # Nothing succeeded at the level itself, so there is no throughput to compare against
+        print(f"🧱 Saturated by {level_name(point)} {unit}: no request there succeeded")
+        return
+    beyond = levels[levels.index(point) + 1:]
+    worst = beyond[-1]
+    print(f"🧱 Saturates at {level_name(point)} {unit}: "
+          f"{point['throughput_rps']:.2f} req/s, {point['throughput_tokens_s']:.0f} tok/s, "
+          f"p95 {point['e2e']['p95_ms']:.0f} ms")
+    if point["e2e"]["p95_ms"]:
+        print(f"   Beyond it p95 latency grows {worst['e2e']['p95_ms'] / point['e2e']['p95_ms']:.1f}x "
+              f"for {(worst['throughput_tokens_s'] / point['throughput_tokens_s'] - 1) * 100:+.0f}% throughput")
+
+def load_main(args: argparse.Namespace):
+    """Run the load test, against the built-in mock server with --mock"""
+    server = None
+    if args.mock:
+        server = MockOllamaServer(token_rate=args.mock_token_rate, ttft=args.mock_ttft,
+                                  parallel=args.mock_parallel or None, seed=args.seed).start()
+        print(f"🧪 Mock Ollama on {server.url} ({args.mock_parallel or 'unlimited'} parallel slots, "
+              f"{args.mock_token_rate:g} tok/s per stream)")
+    
+    concurrency = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    rates = [float(rate) for rate in args.rate.split(",") if rate.strip()] if args.rate else []
+    client = OllamaClient(base_url=server.url if server else None, pool_size=max(concurrency + [16]))
+    try:
+        print(f"📈 Closed-loop concurrency sweep ({args.model})")
+        report = run_load_test(client, args.model, concurrency, args.requests, rates, args.duration, args.seed)
+    except requests.exceptions.ConnectionError:
+        print("❌ Could not connect to Ollama server")
+        print("Make sure Ollama is running (ollama serve) or pass --mock")
+        sys.exit(1)
+    finally:
+        if server:
+            server.stop()
+    
+    print(f"\n📝 {report['prompts']} agent prompts, ~{report['prompt_tokens_mean']:.0f} tokens each")
+    print_saturation(report["closed_loop"], report["closed_saturation"], "concurrent requests")
+    print_saturation(report["open_loop"], report["open_saturation"], "requests/s")
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.output}")
+
 def main():
     """Main test function"""
+    parser = argparse.ArgumentParser(description="Check the Ollama connection, or load-test the backend")
+    parser.add_argument("--load", action="store_true", help="run the load test instead of the connection check")
+    parser.add_argument("--model", default=configured_cascade()[-1], help="model to load-test")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="comma-separated concurrent users per level")
+    parser.add_argument("--requests", type=int, default=24, help="requests per concurrency level")
+    parser.add_argument("--rate", help="comma-separated open-loop arrival rates (requests/s) to sweep")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds of arrivals per open-loop rate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--mock", action="store_true", help="load-test a local mock server instead of Ollama")
+    parser.add_argument("--mock-parallel", type=int, default=4, help="mock generations served at once (0 = unlimited)")
+    parser.add_argument("--mock-token-rate", type=float, default=100.0, help="mock tokens per second per stream")
+    parser.add_argument("--mock-ttft", type=float, default=0.05, help="mock seconds before the first token")
+    args = parser.parse_args()
+    
+    if args.load:
+        load_main(args)
+        return
+    
     print("🤖 Ollama Connection Test")
     print("=" * 25)
     
-    success = test_ollama_connection()
+    server = MockOllamaServer().start() if args.mock else None
+    success = test_ollama_connection(OllamaClient(base_url=server.url) if server else None)
+    if server:
+        server.stop()
     
     if success:
         print("\n🎉 Ollama connection successful! You can now run the terminal agent.")
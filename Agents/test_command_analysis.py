@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests for command_analysis
+Writing, system-changing and never-ending arguments must be refused in every
+form getopt accepts, since batch mode and speculation run these commands unattended
+"""
+
+import unittest
+
+from batch_agent import READ_ONLY_COMMANDS
+from command_analysis import disallowed_reason, is_read_only, parse_options
+from speculation import can_speculate
+
+class DisallowedArgumentsTest(unittest.TestCase):
+    def test_option_value_forms_are_refused(self):
+        """--opt=value, abbreviated long options and separate values"""
+        for command in ["sort --output=F /dev/null", "sort --out=F x", "sort --output F x",
+                        "sort --compress-program=sh x", "sort --compress-program sh x",
+                        "tail --follow=name x", "tail --fo x", "date --set=now", "date --se now",
+                        "hostname --file=f", "file --compile -m x"]:
+            with self.subTest(command=command):
+                self.assertIsNotNone(disallowed_reason(command, READ_ONLY_COMMANDS))
+                self.assertFalse(can_speculate(command))
+
+    def test_attached_and_clustered_flags_are_refused(self):
+        """-oF, flags inside a cluster and find's -fprint0"""
+        for command in ["sort -oF /dev/null", "sort -ro F x", "tail -fn5 x", "tail -n5 -F x", "date -s2020-01-01",
+                        "hostname -F/etc/hostname", "find /dev/null -fprint0 F", "ls | sort -oF"]:
+            with self.subTest(command=command):
+                self.assertIsNotNone(disallowed_reason(command, READ_ONLY_COMMANDS))
+                self.assertFalse(can_speculate(command))
+
+    def test_system_changing_positionals_are_refused(self):
+        """hostname NAME, date with a time to set, uniq's output file"""
+        for command in ["hostname NAME", "hostname -- NAME", "date 0101010120", "uniq a b", "uniq -f 1 a b"]:
+            with self.subTest(command=command):
+                self.assertFalse(is_read_only(command))
+
+    def test_program_paths_are_refused(self):
+        """./ls or ~/bin/grep run whatever binary the path names, even though the basename is allowlisted"""
+        for command in ["./ls", "/tmp/x/cat /etc/hostname", "~/bin/grep foo .", "ls | ./sort", "bin/ls -la"]:
+            with self.subTest(command=command):
+                self.assertIsNotNone(disallowed_reason(command, READ_ONLY_COMMANDS))
+                self.assertFalse(can_speculate(command))
+
+    def test_session_aliases_and_functions_are_not_speculated(self):
+        """The sandbox can't see them, so its run could differ from the confirmed one"""
+        self.assertFalse(can_speculate("ls -la", {"ls"}))
+        self.assertFalse(can_speculate("cat x | grep y", {"grep", "ll"}))
+        self.assertTrue(can_speculate("cat x | grep y", {"ll"}))
+
+    def test_read_only_forms_are_allowed(self):
+        """Values that merely contain a denied letter, and the reading uses of each program"""
+        for command in ["sort -k2 -t: x", "sort -t o x", "sort -k 2 x | uniq -c", "tail -n5 x", "tail -n 5 x",
+                        "date", "date +%Y-%m-%d", "date -d yesterday +%F", "date -Iseconds", "hostname",
+                        "hostname -I", "uniq -f 1 x", "find . -name '*.py' -print0", "grep -rn foo ."]:
+            with self.subTest(command=command):
+                self.assertIsNone(disallowed_reason(command, READ_ONLY_COMMANDS))
+
+    def test_parse_options(self):
+        """Values are dropped, clusters are split and -- ends the options"""
+        self.assertEqual(parse_options("sort", ["-rk", "2", "-oF", "x", "--", "-y"]),
+                         (["-r", "-k", "-o"], ["x", "-y"]))
+        self.assertEqual(parse_options("tail", ["--lines=5", "--follow", "x"]), (["--lines", "--follow"], ["x"]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Tests for intents
+A built-in intent answers without the model, so a phrase it misreads runs the
+wrong command; anything it isn't sure of must fall through to the model
+"""
+
+import unittest
+from pathlib import Path
+
+from intents import IntentEngine
+
+class IntentEngineTest(unittest.TestCase):
+    def setUp(self):
+        # No user intents, only the built-in table
+        self.engine = IntentEngine(Path("/nonexistent/intents.json"))
+
+    def command(self, request: str):
+        matched = self.engine.match(request)
+        return matched and matched["command"]
+
+    def test_file_types(self):
+        """Known extensions, friendly aliases and the leading-dot form"""
+        for request, command in [("find all python files", "find . -type f -name '*.py'"),
+                                 ("find log files in /var/log", "find /var/log -type f -name '*.log'"),
+                                 ("show me the markdown files", "find . -type f -name '*.md'"),
+                                 ("find .conf files under /etc", "find /etc -type f -name '*.conf'"),
+                                 ("search for JSON files", "find . -type f -name '*.json'")]:
+            with self.subTest(request=request):
+                self.assertEqual(self.command(request), command)
+
+    def test_file_adjectives_go_to_the_model(self):
+        """Words that describe files without naming a type"""
+        for request in ["show hidden files", "find empty files", "list recent files", "find executable files",
+                        "show my files", "open files", "new files", "find duplicate files"]:
+            with self.subTest(request=request):
+                self.assertIsNone(self.engine.match(request))
+
+    def test_paths_keep_their_case(self):
+        """Slots come from the original text, not the lowercased request"""
+        self.assertEqual(self.command("List files in ~/Projects/MyApp"), "ls -la ~/Projects/MyApp")
+        self.assertEqual(self.command("How big is ./Build/Output.TXT?"), "du -sh ./Build/Output.TXT")
+        self.assertEqual(self.command("list files in ."), "ls -la .")
+
+    def test_slots_are_quoted(self):
+        """A path can't smuggle shell syntax into the command"""
+        self.assertEqual(self.command("list files in a;rm"), "ls -la 'a;rm'")
+
+if __name__ == "__main__":
+    unittest.main()